@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+# Serve the recipe and user endpoints with their async views, see core.asyncviews
+os.environ.setdefault('ASGI_MODE', '1')
 
 application = get_asgi_application()
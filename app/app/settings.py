@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 import os
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # Postgres specific features, used for the recipe full-text search
     'core',
     'rest_framework',  # Django REST framework
     'rest_framework.authtoken',  # Django REST framework token authentication, it's built-in DRF but needs to be added to the INSTALLED_APPS separately, to add support for token authentication
@@ -54,6 +56,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Compresses the responses with brotli or gzip, before the other middleware that read or change the content
+    'core.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -100,6 +104,27 @@ DATABASES = {
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
+# Password hashing
+# Iterations of PBKDF2 of each cost profile, the hashes are made again at login when the cost changes
+PASSWORD_HASH_PROFILES = {
+    'low': 100000,
+    'default': 260000,   # Django 3.2's default
+    'high': 600000,
+}
+PASSWORD_HASH_PROFILE = os.environ.get('PASSWORD_HASH_PROFILE', 'default')
+PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', PASSWORD_HASH_PROFILES[PASSWORD_HASH_PROFILE]))
+# The first hasher makes the new hashes, the others check the hashes they made before
+PASSWORD_HASHERS = [
+    'core.hashers.ProfilePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+# Pool hashing the passwords off the request threads, thread or process, and the hashes run at a time per worker
+# 0 hashes on the request thread
+PASSWORD_HASHING_EXECUTOR = os.environ.get('PASSWORD_HASHING_EXECUTOR', 'thread')
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', 2))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -134,6 +159,11 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.2/howto/static-files/
 
 STATIC_URL = '/static/'
+# collectstatic copies the static files to the volume the proxy serves them from
+STATIC_ROOT = os.environ.get('STATIC_ROOT', '/vol/web/static')
+# The deployment uses core.storage.CompressedManifestStaticFilesStorage, which writes hashed and compressed copies
+# The default storage doesn't need collectstatic, for development and the tests
+STATICFILES_STORAGE = os.environ.get('STATICFILES_STORAGE', 'django.contrib.staticfiles.storage.StaticFilesStorage')
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
@@ -142,9 +172,140 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Define the custom user model
 AUTH_USER_MODEL = 'core.User'
+# Users log in with their email in any case, e.g. the admin login and the token endpoints
+AUTHENTICATION_BACKENDS = ['core.backends.EmailBackend']
 
 # Django REST framework settings
 # Configure to use the openapi schema generator
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Number of proxies in front of the app whose X-Forwarded-For entries are trusted to find the client IP
+    # uWSGI gets the client address from nginx in REMOTE_ADDR, so by default the header sent by the client is ignored
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+    # JSON is encoded and decoded with orjson when it is installed, with the same output as DRF's JSON classes
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+# MessagePack responses and request bodies, chosen with the Accept and Content-Type headers application/msgpack
+if find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('core.renderers.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append('core.parsers.MessagePackParser')
+
+# Recipe list pagination
+# Number of recipes returned per page when the client doesn't ask for a page size
+RECIPE_PAGE_SIZE = int(os.environ.get('RECIPE_PAGE_SIZE', 25))
+# Maximum page size a client can ask for with ?page_size=
+RECIPE_MAX_PAGE_SIZE = int(os.environ.get('RECIPE_MAX_PAGE_SIZE', 100))
+
+# Recipe title autocomplete
+# Maximum number of titles returned by the autocomplete endpoint
+RECIPE_AUTOCOMPLETE_LIMIT = int(os.environ.get('RECIPE_AUTOCOMPLETE_LIMIT', 10))
+
+# Recipe batch endpoints
+# Maximum number of recipes in one batch create, update or delete request
+RECIPE_BULK_MAX_ITEMS = int(os.environ.get('RECIPE_BULK_MAX_ITEMS', 500))
+
+# Recipe export
+# Number of recipes read from the database cursor, and sent to the client, at a time
+RECIPE_EXPORT_CHUNK_SIZE = int(os.environ.get('RECIPE_EXPORT_CHUNK_SIZE', 2000))
+# Under ASGI the export is written to a temporary file before it is sent, in memory up to this many bytes
+RECIPE_EXPORT_SPOOL_SIZE = int(os.environ.get('RECIPE_EXPORT_SPOOL_SIZE', 10 * 1024 * 1024))
+
+# Recipe import
+# Number of records validated and inserted at a time
+RECIPE_IMPORT_CHUNK_SIZE = int(os.environ.get('RECIPE_IMPORT_CHUNK_SIZE', 1000))
+# Number of failed records whose errors are reported, the others are only counted
+RECIPE_IMPORT_MAX_ERRORS = int(os.environ.get('RECIPE_IMPORT_MAX_ERRORS', 100))
+
+# Recipe sync
+# Number of changes returned by a sync, the client syncs again with the cursor while has_more is true
+RECIPE_SYNC_PAGE_SIZE = int(os.environ.get('RECIPE_SYNC_PAGE_SIZE', 1000))
+# Seconds a sync cursor is accepted, an older cursor gets a 400 and the client syncs again from scratch
+RECIPE_SYNC_CURSOR_MAX_AGE = int(os.environ.get('RECIPE_SYNC_CURSOR_MAX_AGE', 30 * 24 * 3600))
+# Seconds the tombstones of the deleted recipes are kept by prune_recipe_tombstones, longer than the cursors
+# are accepted, so a client with a valid cursor still gets the deletions
+RECIPE_TOMBSTONE_TTL = int(os.environ.get('RECIPE_TOMBSTONE_TTL', 60 * 24 * 3600))
+# Number of tombstones deleted per transaction by the prune_recipe_tombstones command
+RECIPE_TOMBSTONE_BATCH_SIZE = int(os.environ.get('RECIPE_TOMBSTONE_BATCH_SIZE', 1000))
+
+# User bulk creation
+# Number of users validated, hashed and inserted at a time
+USER_IMPORT_CHUNK_SIZE = int(os.environ.get('USER_IMPORT_CHUNK_SIZE', 500))
+# Number of failed records and duplicate emails whose details are reported, the others are only counted
+USER_IMPORT_MAX_ERRORS = int(os.environ.get('USER_IMPORT_MAX_ERRORS', 100))
+
+# Cache
+# The local-memory backend is per process, set CACHE_BACKEND and CACHE_LOCATION to memcached (or Redis)
+# to share the cache between the workers, the database cache would add queries to the requests it should save
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    },
 }
+
+# Recipe response cache
+# Cache of CACHES used for the recipe list and detail responses, must be a memcached or Redis shared by the workers (check core.E002)
+RECIPE_CACHE_ALIAS = os.environ.get('RECIPE_CACHE_ALIAS', 'default')
+# Seconds a cached response is kept, writes drop the cached responses of the user before that
+RECIPE_CACHE_TIMEOUT = int(os.environ.get('RECIPE_CACHE_TIMEOUT', 300))
+
+# Token authentication cache
+# Number of tokens whose user is kept in the memory of each worker, 0 turns the cache off
+TOKEN_AUTH_CACHE_SIZE = int(os.environ.get('TOKEN_AUTH_CACHE_SIZE', 10000))
+# Seconds a token is trusted without reading it again, the longest a token revoked by another worker still works
+TOKEN_AUTH_CACHE_TTL = int(os.environ.get('TOKEN_AUTH_CACHE_TTL', 60))
+
+# Opaque token expiry
+# Seconds a token stays valid after its last use, and after its creation, 0 for no limit
+TOKEN_TTL = int(os.environ.get('TOKEN_TTL', 30 * 24 * 3600))
+TOKEN_MAX_AGE = int(os.environ.get('TOKEN_MAX_AGE', 0))
+# The last use is written at most once per this number of seconds, most requests don't write
+TOKEN_LAST_USED_INTERVAL = int(os.environ.get('TOKEN_LAST_USED_INTERVAL', 300))
+# Number of expired tokens deleted per transaction by the cleanup_tokens command
+TOKEN_CLEANUP_BATCH_SIZE = int(os.environ.get('TOKEN_CLEANUP_BATCH_SIZE', 1000))
+
+# Login throttling
+# Token buckets of the login and sign up endpoints, as (capacity, tokens refilled per minute)
+# A client can make capacity requests at once, then refill per minute requests
+LOGIN_THROTTLE = {
+    'ip': (
+        int(os.environ.get('LOGIN_THROTTLE_IP_CAPACITY', 20)),
+        float(os.environ.get('LOGIN_THROTTLE_IP_PER_MINUTE', 10)),
+    ),
+    'email': (
+        int(os.environ.get('LOGIN_THROTTLE_EMAIL_CAPACITY', 5)),
+        float(os.environ.get('LOGIN_THROTTLE_EMAIL_PER_MINUTE', 2)),
+    ),
+}
+
+# Token modes
+# token: the opaque tokens of /api/user/token/, signed: the signed access tokens of /api/user/token/signed/
+AUTH_TOKEN_MODES = os.environ.get('AUTH_TOKEN_MODES', 'token,signed').split(',')
+# Seconds an access token is valid, and a refresh token
+ACCESS_TOKEN_TTL = int(os.environ.get('ACCESS_TOKEN_TTL', 300))
+REFRESH_TOKEN_TTL = int(os.environ.get('REFRESH_TOKEN_TTL', 14 * 24 * 3600))
+# Keys signing the access tokens, as id:key pairs separated by commas
+# The first key signs the new tokens, the others only verify: to rotate, put the new key first,
+# and remove the old one ACCESS_TOKEN_TTL seconds later
+ACCESS_TOKEN_KEYS = dict(
+    pair.split(':', 1) for pair in os.environ.get('ACCESS_TOKEN_KEYS', f'1:{SECRET_KEY}').split(',')
+)
+# Cache of CACHES holding the revoked access tokens, must be a memcached or Redis shared by the workers (check core.E001)
+AUTH_DENYLIST_CACHE_ALIAS = os.environ.get('AUTH_DENYLIST_CACHE_ALIAS', 'default')
+
+# Response compression
+# Responses smaller than this number of bytes are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+
+# ASGI deployment
+# Set by app/asgi.py, the recipe list and detail and the user endpoint are then served by async views
+ASGI_MODE = bool(int(os.environ.get('ASGI_MODE', 0)))
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Importing the modules registers the custom lookups on the model fields, connects the signal receivers
+        # and registers the system checks
+        from core import checks, lookups, signals  # noqa: F401
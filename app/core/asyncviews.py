@@ -0,0 +1,55 @@
+"""
+Async views for the ASGI deployment.
+"""
+
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+
+def _run_view(view, request, *args, **kwargs):
+    """Run the view and render its response, in a worker thread"""
+    # Each worker thread has its own database connection, open and close it like the request signals do
+    # for the thread of a synchronous request
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        # Render here, otherwise Django renders the DRF response in the single thread shared by the sync code
+        if hasattr(response, 'render') and callable(response.render):
+            response = response.render()
+
+        return response
+    finally:
+        close_old_connections()
+
+
+def as_async_view(view):
+    """Return an async view running the view in a thread pool
+
+    Django 3.2 has no async ORM, and under ASGI it runs every sync view in one thread per process.
+    The async view runs the view in the thread pool of the event loop instead, so slow database calls
+    of concurrent requests overlap.
+    """
+    # wraps copies the attributes of the view, like csrf_exempt of the DRF views
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        return await sync_to_async(_run_view, thread_sensitive=False)(view, request, *args, **kwargs)
+
+    return async_view
+
+
+def asgi_view(view):
+    """Return the async version of the view when the app is served by ASGI, otherwise the view"""
+    # Under WSGI an async view would start an event loop for every request, for nothing
+    return as_async_view(view) if settings.ASGI_MODE else view
+
+
+def asgi_urlpatterns(urlpatterns, names):
+    """Replace the views of the url patterns with the names by their async version when served by ASGI"""
+    for pattern in urlpatterns:
+        if pattern.name in names:
+            pattern.callback = asgi_view(pattern.callback)
+
+    return urlpatterns
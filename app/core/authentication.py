@@ -0,0 +1,205 @@
+"""
+Authentication classes for the API.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from drf_spectacular.extensions import OpenApiAuthenticationExtension
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from core import tokens
+from core.utils import now_and_on_commit
+
+# Names of the counters of the token cache
+STATS = ('hits', 'misses', 'invalidations')
+
+
+class TokenCache:
+    """Bounded LRU cache of the tokens and their users, with a time to live, shared by the threads of a worker
+
+    The cache is in the memory of the process, a hit costs no query and no network round trip.
+    A write in this worker drops the entries of the token or user at once, the other workers
+    keep theirs until they expire, so TOKEN_AUTH_CACHE_TTL is the longest a revoked token still works.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()   # Token key: (token with its user, expiry), least recently used first
+        self._lock = threading.Lock()   # Under ASGI the views run in a thread pool, the threads share the cache
+        self._stats = dict.fromkeys(STATS, 0)
+
+    def get(self, key):
+        """Return the cached token of the key, None when it isn't cached or has expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self._stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+
+        return _copy_token(entry[0])
+
+    def set(self, key, token):
+        """Cache the token of the key, with its user"""
+        size = settings.TOKEN_AUTH_CACHE_SIZE
+        token = _copy_token(token)
+        with self._lock:
+            self._entries[key] = (token, time.monotonic() + settings.TOKEN_AUTH_CACHE_TTL)
+            self._entries.move_to_end(key)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key=None, user_id=None):
+        """Drop the entry of the token key, or the entries of the user"""
+        with self._lock:
+            if key is not None:
+                self._entries.pop(key, None)
+            if user_id is not None:
+                # The cache is bounded, scanning it on the rare user writes is cheaper than an index by user
+                for cached_key in [k for k, (token, _) in self._entries.items() if token.user_id == user_id]:
+                    del self._entries[cached_key]
+            self._stats['invalidations'] += 1
+
+    def clear(self):
+        """Drop all the entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self._stats = dict.fromkeys(STATS, 0)
+
+    def stats(self):
+        """Return the counters since the last clear, with the hit rate and the number of entries"""
+        with self._lock:
+            stats = dict(self._stats, size=len(self._entries))
+
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+
+        return stats
+
+
+def _copy_token(token):
+    """Return a copy of the token and its user"""
+    # Every request gets its own copies, a view changing request.user doesn't change the cached user
+    token = copy.copy(token)
+    token.user = copy.copy(token.user)
+
+    return token
+
+
+token_cache = TokenCache()
+
+
+def invalidate_token_cache(key=None, user_id=None):
+    """Drop the cached users of a deleted token or of a changed user"""
+    # A request in another thread can cache the old rows again until the write commits
+    now_and_on_commit(lambda: token_cache.invalidate(key=key, user_id=user_id))
+
+
+def token_cache_stats():
+    """Return the hits, misses, invalidations, hit rate and size of the token cache of this worker"""
+    return token_cache.stats()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication caching the tokens and their users in the memory of the worker
+
+    Without the cache every authenticated request reads the token and its user with a join.
+    TOKEN_AUTH_CACHE_SIZE = 0 turns the cache off.
+    The token also expires, see core/tokens.py, its last use is written at most once per TOKEN_LAST_USED_INTERVAL.
+    """
+
+    def authenticate(self, request):
+        """Authenticate the request, unless the token mode is turned off"""
+        if 'token' not in settings.AUTH_TOKEN_MODES:
+            return None
+
+        return super().authenticate(request)
+
+    def get_token(self, key):
+        """Return the token of the key with its user and last use, in one query"""
+        try:
+            token = self.get_model().objects.select_related('user', 'usage').get(key=key)
+        except self.get_model().DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return token
+
+    def authenticate_credentials(self, key):
+        """Return the user and token of the key, from the cache when possible"""
+        now = timezone.now()
+        token = token_cache.get(key) if settings.TOKEN_AUTH_CACHE_SIZE else None
+
+        # A token whose last use must be recorded is read again, a token deleted by another worker is noticed then
+        if token is None or tokens.token_needs_stamp(token, now):
+            # Inactive users and unknown keys raise AuthenticationFailed and aren't cached
+            token = self.get_token(key)
+            # Checked before the stamp, which would otherwise make an expired token valid again
+            if tokens.token_expired(token, now):
+                raise exceptions.AuthenticationFailed(_('Token expired.'))
+            if tokens.token_needs_stamp(token, now):
+                tokens.stamp_token(token, now)
+            if settings.TOKEN_AUTH_CACHE_SIZE:
+                token_cache.set(key, token)
+        elif tokens.token_expired(token, now):
+            # Only TOKEN_MAX_AGE can expire a token used less than TOKEN_LAST_USED_INTERVAL ago
+            raise exceptions.AuthenticationFailed(_('Token expired.'))
+
+        return token.user, token
+
+
+class SignedTokenAuthentication(TokenAuthentication):
+    """Authentication with the signed access tokens of core/tokens.py, sent as Authorization: Bearer <token>
+
+    The token is verified without reading the database. request.user only has its id loaded,
+    its other fields are read from the database when used, request.auth holds the claims of the token.
+    """
+
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        """Authenticate the request, unless the signed mode is turned off"""
+        if 'signed' not in settings.AUTH_TOKEN_MODES:
+            return None
+
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        """Return the user and claims of the access token"""
+        try:
+            claims = tokens.verify_access_token(key)
+        except tokens.InvalidToken as exc:
+            raise exceptions.AuthenticationFailed(exc.args[0])
+
+        # Tokens are only issued to active users, and deactivating a user revokes them
+        user = get_user_model().from_db(DEFAULT_DB_ALIAS, ['id', 'is_active'], [claims['u'], True])
+
+        return user, claims
+
+
+# Both token modes are tried, each one only when enabled in AUTH_TOKEN_MODES
+API_AUTHENTICATION_CLASSES = [CachedTokenAuthentication, SignedTokenAuthentication]
+
+
+class SignedTokenScheme(OpenApiAuthenticationExtension):
+    """OpenAPI security scheme of the signed access tokens"""
+
+    target_class = SignedTokenAuthentication
+    name = 'accessTokenAuth'
+
+    def get_security_definition(self, auto_schema):
+        return {'type': 'http', 'scheme': 'bearer'}
@@ -0,0 +1,34 @@
+"""
+Authentication backends.
+"""
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+
+class EmailBackend(ModelBackend):
+    """Authentication with the email and password, whatever the case of the email
+
+    ModelBackend looks the user up with email = username, so a login with a case variant of the email fails.
+    The lookup is LOWER(email) = LOWER(username), answered from the unique index on lower(email).
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        """Return the active user of the email and password, None when they don't match"""
+        user_model = get_user_model()
+        if username is None:
+            username = kwargs.get(user_model.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        try:
+            user = user_model._default_manager.get(email__ciexact=username)
+        except user_model.DoesNotExist:
+            # Hash the password anyway, an unknown email takes as long to answer as a wrong password
+            user_model().set_password(password)
+            return None
+
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+
+        return None
@@ -0,0 +1,29 @@
+"""
+Deletion of many rows in small batches, for the cleanup commands.
+"""
+
+import time
+
+from django.db import transaction
+
+
+def delete_in_batches(queryset, batch_size, pause=0):
+    """Delete the rows of the queryset batch by batch, return the number of rows deleted"""
+    deleted = 0
+    while True:
+        # A short transaction per batch, the locks are held for one batch only
+        with transaction.atomic():
+            # skip_locked leaves the rows locked by a request to a later run instead of waiting for them
+            # of=('self',) because a condition can be read from an outer join, e.g. the last use of the tokens
+            pks = list(
+                queryset.select_for_update(skip_locked=True, of=('self',)).values_list('pk', flat=True)[:batch_size]
+            )
+            if not pks:
+                return deleted
+
+            # The conditions are checked again, e.g. a token used since the select isn't deleted
+            # The count of the cascaded rows, like the last use of the tokens, is left out
+            deleted += queryset.filter(pk__in=pks).delete()[1].get(queryset.model._meta.label, 0)
+
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,51 @@
+"""
+System checks of the deployment settings, run by manage.py check --deploy.
+"""
+
+from django.conf import settings
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.core.checks import Error, Tags, register
+from django.utils.module_loading import import_string
+
+
+def _shared_memory(alias):
+    """Return whether the cache of the alias is a memcached or Redis server, shared by the workers"""
+    # The class is checked without connecting, the client library of the backend may not be installed here
+    backend = import_string(settings.CACHES[alias]['BACKEND'])
+    # Django 3.2 has no Redis backend, the one of django-redis and the one of Django 4.0 are both RedisCache
+    return issubclass(backend, BaseMemcachedCache) or backend.__name__ == 'RedisCache'
+
+
+@register(Tags.caches, deploy=True)
+def check_denylist_cache(app_configs, **kwargs):
+    """Refuse a denylist of the signed access tokens that isn't in a shared memory cache"""
+    if 'signed' not in settings.AUTH_TOKEN_MODES or _shared_memory(settings.AUTH_DENYLIST_CACHE_ALIAS):
+        return []
+
+    # In the memory of each worker, a token revoked in one worker stays valid in the others until it expires
+    # In the database, every request with a signed token reads a table, the query the signed tokens save
+    return [Error(
+        f'The denylist of the signed access tokens is in the cache {settings.AUTH_DENYLIST_CACHE_ALIAS!r}, '
+        f'which isn\'t a memcached or Redis server shared by the workers.',
+        hint='Set CACHE_BACKEND to django.core.cache.backends.memcached.PyMemcacheCache and CACHE_LOCATION '
+             'to the memcached server, or turn the signed mode off in AUTH_TOKEN_MODES.',
+        id='core.E001',
+    )]
+
+
+@register(Tags.caches, deploy=True)
+def check_recipe_cache(app_configs, **kwargs):
+    """Refuse a recipe response cache that isn't in a shared memory cache"""
+    if _shared_memory(settings.RECIPE_CACHE_ALIAS):
+        return []
+
+    # In the memory of each worker, a write only starts a new generation of the responses in its worker,
+    # the others keep serving the old ones
+    # In the database, a hit reads several rows of a table instead of the one indexed query it should save
+    return [Error(
+        f'The recipe responses are cached in the cache {settings.RECIPE_CACHE_ALIAS!r}, '
+        f'which isn\'t a memcached or Redis server shared by the workers.',
+        hint='Set CACHE_BACKEND to django.core.cache.backends.memcached.PyMemcacheCache and CACHE_LOCATION '
+             'to the memcached server.',
+        id='core.E002',
+    )]
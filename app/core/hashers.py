@@ -0,0 +1,19 @@
+"""
+Password hashers.
+"""
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ProfilePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2 hasher with the iterations of the cost profile in PASSWORD_HASH_ITERATIONS
+
+    The algorithm name is the same as Django's, the existing hashes are still checked by this hasher.
+    When the cost changes, must_update() is true for the hashes made with the previous one,
+    and User.check_password makes them again with the new cost at the next login.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
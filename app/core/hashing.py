@@ -0,0 +1,105 @@
+"""
+Password hashing in a bounded pool, off the request threads.
+
+A hash takes PBKDF2 a few hundred milliseconds of CPU on purpose. Run on the request threads, a burst of
+sign ups and logins keeps every thread of the worker hashing and stalls its other requests.
+The pool runs at most PASSWORD_HASHING_WORKERS hashes at a time per worker, the other ones wait their turn.
+"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+_executor = None
+_executor_key = None
+_lock = threading.Lock()
+
+
+def _get_executor():
+    """Return the pool of this process, created on first use"""
+    global _executor, _executor_key
+
+    # Created lazily and per process id: a pool created before uWSGI forks its workers would be shared by them
+    # and its threads wouldn't exist in the children
+    key = (os.getpid(), settings.PASSWORD_HASHING_EXECUTOR, settings.PASSWORD_HASHING_WORKERS)
+    with _lock:
+        if _executor_key != key:
+            if _executor is not None and _executor_key[0] == key[0]:
+                # The settings changed, the running hashes of the previous pool still finish
+                _executor.shutdown(wait=False)
+            if settings.PASSWORD_HASHING_EXECUTOR == 'process':
+                # Forked processes run the hashes outside the GIL of the worker, and inherit its settings
+                _executor = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASHING_WORKERS)
+            else:
+                # hashlib releases the GIL while it hashes, the other threads of the worker keep running
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.PASSWORD_HASHING_WORKERS,
+                    thread_name_prefix='password-hashing',
+                )
+            _executor_key = key
+
+        return _executor
+
+
+def _run(func, *args):
+    """Run the function in the pool and return its result"""
+    if not settings.PASSWORD_HASHING_WORKERS:
+        return func(*args)
+
+    return _get_executor().submit(func, *args).result()
+
+
+def make_password(password):
+    """Return the hash of the password, computed in the pool"""
+    # An unusable password (None) has no hash to compute
+    if password is None:
+        return hashers.make_password(None)
+
+    return _run(hashers.make_password, password)
+
+
+def needs_rehash(encoded):
+    """Return whether the hash was made with another hasher or cost than the current ones"""
+    preferred = hashers.get_hasher('default')
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        # An unusable or unknown password
+        return False
+
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def check_password(password, encoded, setter=None):
+    """Return whether the password matches the hash, checked in the pool
+
+    Like django.contrib.auth.hashers.check_password, setter is called with the password when it
+    matches a hash that needs to be made again, e.g. after the cost profile changed.
+    """
+    is_correct = _run(hashers.check_password, password, encoded)
+    # The setter saves the new hash, it runs on the request thread and its database connection
+    if is_correct and setter is not None and needs_rehash(encoded):
+        setter(password)
+
+    return is_correct
+
+
+@contextmanager
+def parallel_hasher(workers=None):
+    """Yield a function returning the hashes of a list of passwords, computed by a pool of processes
+
+    For the bulk creation of users: every CPU hashes, and the pool only lives during the creation.
+    A None password gets an unusable password.
+    """
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        def make_passwords(passwords):
+            # Several passwords per task, a single hash is too short a job to send to a process
+            chunksize = max(1, len(passwords) // (workers * 4))
+            return list(pool.map(hashers.make_password, passwords, chunksize=chunksize))
+
+        yield make_passwords
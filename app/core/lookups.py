@@ -0,0 +1,35 @@
+"""
+Custom database lookups.
+"""
+
+from django.db.models import CharField, Lookup
+
+
+# Django turns __istartswith into UPPER(column) LIKE UPPER(pattern), which can't use an index on the column
+# ILIKE on the column itself can be answered from a pg_trgm GIN index on that column
+@CharField.register_lookup
+class ILike(Lookup):
+    """Case-insensitive LIKE pattern match, e.g. title__ilike='choc%'"""
+
+    lookup_name = 'ilike'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+
+        return f'{lhs} ILIKE {rhs}', lhs_params + rhs_params
+
+
+# Django turns __iexact into UPPER(column) LIKE UPPER(value), which no index on the column answers
+# The functional unique index on lower(email) (migration 0013) answers this equality
+@CharField.register_lookup
+class CIExact(Lookup):
+    """Case-insensitive equality, e.g. email__ciexact='Ann@Example.com'"""
+
+    lookup_name = 'ciexact'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+
+        return f'LOWER({lhs}) = LOWER({rhs})', lhs_params + rhs_params
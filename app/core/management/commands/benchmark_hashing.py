@@ -0,0 +1,79 @@
+"""
+Django command to measure the login throughput for PBKDF2 iterations.
+"""
+
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from core import hashing
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the password hashing"""
+
+    help = 'Measure the password checks per second of a worker for PBKDF2 iterations, on the request threads and in the pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            nargs='+',
+            default=sorted(settings.PASSWORD_HASH_PROFILES.values()),
+            help='PBKDF2 iterations to measure, by default the ones of the cost profiles',
+        )
+        parser.add_argument('--logins', type=int, default=40, help='Number of password checks timed for each iterations')
+        parser.add_argument('--concurrency', type=int, default=8, help='Number of request threads checking passwords')
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        self.stdout.write(
+            f'{settings.PASSWORD_HASHING_WORKERS} {settings.PASSWORD_HASHING_EXECUTOR} workers in the pool, '
+            f'{options["concurrency"]} request threads'
+        )
+        # other ms: time of a light request, like serializing a page of recipes, while the passwords are checked
+        self.stdout.write(
+            f'{"iterations":>10}{"ms/check":>10}{"inline/s":>10}{"other ms":>10}{"pool/s":>10}{"other ms":>10}'
+        )
+        for iterations in options['iterations']:
+            with override_settings(PASSWORD_HASH_ITERATIONS=iterations):
+                encoded = hashers.make_password('benchmark-password')
+
+                start = time.perf_counter()
+                hashers.check_password('benchmark-password', encoded)
+                check_ms = (time.perf_counter() - start) * 1000
+
+                inline, inline_other = self._throughput(hashers.check_password, encoded, options)
+                pool, pool_other = self._throughput(hashing.check_password, encoded, options)
+
+            self.stdout.write(
+                f'{iterations:>10}{check_ms:>10.1f}{inline:>10.1f}{inline_other:>10.1f}{pool:>10.1f}{pool_other:>10.1f}'
+            )
+
+    def _throughput(self, check_password, encoded, options):
+        """Return the password checks per second of the request threads, and the median time of a light request"""
+        done = threading.Event()
+        other_times = []
+
+        def other_requests():
+            while not done.is_set():
+                start = time.perf_counter()
+                sum(i * i for i in range(20000))
+                other_times.append((time.perf_counter() - start) * 1000)
+
+        other = threading.Thread(target=other_requests)
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as threads:
+            start = time.perf_counter()
+            other.start()
+            list(threads.map(lambda _: check_password('benchmark-password', encoded), range(options['logins'])))
+            elapsed = time.perf_counter() - start
+        done.set()
+        other.join()
+
+        return options['logins'] / elapsed, statistics.median(other_times)
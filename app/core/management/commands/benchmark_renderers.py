@@ -0,0 +1,80 @@
+"""
+Django command to compare the speed of the API renderers on recipe payloads.
+"""
+
+import timeit
+from decimal import Decimal
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core.parsers import FastJSONParser, MessagePackParser
+from core.renderers import FastJSONRenderer, MessagePackRenderer, msgpack, orjson
+
+
+def recipe_list_page(size):
+    """Return a page of the recipe list, like the API returns it"""
+    return {
+        'next': 'http://localhost/api/recipe/recipes/?cursor=cD0xMjM0NQ%3D%3D',
+        'previous': None,
+        'results': [
+            {
+                'id': 100000 - i,
+                'title': f'Crème brûlée à la vanille {i}',
+                'time_minutes': 5 + i % 120,
+                'price': str(Decimal(i % 5000) / 100),  # The serializers return prices as strings
+                'link': f'https://example.com/recipes/{i}',
+            }
+            for i in range(size)
+        ],
+    }
+
+
+def recipe_detail():
+    """Return a recipe detail with a long description"""
+    return {
+        'id': 12345,
+        'title': 'Tarte Tatin',
+        'time_minutes': 90,
+        'price': '12.50',
+        'link': 'https://example.com/recipes/tarte-tatin',
+        'description': 'Caramelise the apples, cover with the pastry and bake. ' * 60,
+    }
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the renderers"""
+
+    help = 'Compare the time to render and parse recipe payloads with the stdlib JSON, orjson and MessagePack'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=1000, help='Number of calls timed for each payload')
+        parser.add_argument('--page-size', type=int, default=100, help='Number of recipes in the list page')
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        payloads = {
+            f'list of {options["page_size"]}': recipe_list_page(options['page_size']),
+            'detail': recipe_detail(),
+        }
+        # The stdlib JSON classes of DRF are the baseline
+        codecs = [('json (stdlib)', JSONRenderer(), JSONParser())]
+        if orjson:
+            codecs.append(('json (orjson)', FastJSONRenderer(), FastJSONParser()))
+        if msgpack:
+            codecs.append(('msgpack', MessagePackRenderer(), MessagePackParser()))
+
+        self.stdout.write(f'{"payload":<16}{"codec":<16}{"render µs":>12}{"parse µs":>12}{"bytes":>10}')
+        for payload_name, data in payloads.items():
+            for codec_name, renderer, parser in codecs:
+                body = renderer.render(data)
+                render_time = self._time(lambda: renderer.render(data), options['number'])
+                parse_time = self._time(lambda: parser.parse(BytesIO(body)), options['number'])
+                self.stdout.write(f'{payload_name:<16}{codec_name:<16}{render_time:>12.1f}{parse_time:>12.1f}{len(body):>10}')
+
+    def _time(self, func, number):
+        """Return the best time of one call in microseconds"""
+        # The best of several repeats is the least disturbed by the rest of the machine
+        return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
@@ -0,0 +1,55 @@
+"""
+Django command to create users and their tokens from an NDJSON or CSV file.
+"""
+
+import csv
+from functools import partial
+
+from core.management.importing import ImportCommand
+from user.importer import import_users
+
+
+class Command(ImportCommand):
+    """Django command to create users in bulk"""
+
+    help = 'Create users and their tokens from an NDJSON or CSV file of email, password and name'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Processes hashing the passwords, by default one per CPU, 0 to hash in this process',
+        )
+        parser.add_argument('--tokens', help='Path of a CSV file to write the email and token of the created users to')
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        tokens_file = open(options['tokens'], 'w', newline='') if options['tokens'] else None
+        try:
+            on_created = None
+            if tokens_file is not None:
+                writer = csv.writer(tokens_file)
+                writer.writerow(['email', 'token'])
+                # Written chunk by chunk, the tokens of all the users are never in memory at once
+                on_created = partial(self._write_tokens, writer)
+
+            result = self.import_file(options, partial(import_users, workers=options['workers'], on_created=on_created))
+        finally:
+            if tokens_file is not None:
+                tokens_file.close()
+
+        self.write_errors(result)
+        for duplicate in result['duplicates']:
+            self.stderr.write(f'Line {duplicate["line"]}: {duplicate["email"]} already exists.')
+        if result['duplicated'] > len(result['duplicates']):
+            self.stderr.write(f'{result["duplicated"] - len(result["duplicates"])} more duplicate emails not shown.')
+
+        style = self.style.SUCCESS if not (result['failed'] or result['duplicated']) else self.style.WARNING
+        self.stdout.write(style(
+            f'{result["created"]} users created, {result["duplicated"]} duplicate emails, {result["failed"]} failed.'
+        ))
+
+    def _write_tokens(self, writer, created):
+        """Write the email and token of the created users"""
+        writer.writerows((user.email, token.key) for user, token in created)
@@ -0,0 +1,37 @@
+"""
+Django command to delete the expired tokens and the stale login throttle buckets.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import throttling, tokens
+from core.batches import delete_in_batches
+
+
+class Command(BaseCommand):
+    """Django command to delete the expired opaque tokens, refresh tokens and login throttle buckets"""
+
+    help = 'Delete the expired tokens and stale throttle buckets in small batches, each in its own short transaction'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.TOKEN_CLEANUP_BATCH_SIZE,
+            help='Number of tokens deleted per transaction',
+        )
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to wait between the batches')
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        now = timezone.now()
+
+        for name, queryset in (
+            ('tokens', tokens.expired_tokens(now)),
+            ('refresh tokens', tokens.expired_refresh_tokens(now)),
+            ('throttle buckets', throttling.stale_buckets()),
+        ):
+            deleted = delete_in_batches(queryset, options['batch_size'], options['pause'])
+            self.stdout.write(self.style.SUCCESS(f'{deleted} expired {name} deleted.'))
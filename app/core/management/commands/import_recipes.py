@@ -0,0 +1,34 @@
+"""
+Django command to import recipes for a user from an NDJSON or CSV file.
+"""
+
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import CommandError
+
+from core.management.importing import ImportCommand
+from recipe import importer
+
+
+class Command(ImportCommand):
+    """Django command to import recipes"""
+
+    help = 'Import recipes for a user from an NDJSON or CSV file, reading it chunk by chunk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='Email of the user the recipes are imported for')
+        super().add_arguments(parser)
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        try:
+            user = get_user_model().objects.get(email__ciexact=options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user with the email {options["email"]}.')
+
+        result = self.import_file(options, partial(importer.import_recipes, user))
+
+        self.write_errors(result)
+        style = self.style.SUCCESS if not result['failed'] else self.style.WARNING
+        self.stdout.write(style(f'{result["created"]} recipes imported, {result["failed"]} failed.'))
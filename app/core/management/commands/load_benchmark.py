@@ -0,0 +1,64 @@
+"""
+Django command to load test a running API server, to compare the WSGI and the ASGI deployment.
+"""
+
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand
+
+# Endpoints served by async views under ASGI
+DEFAULT_PATHS = ['/api/recipe/recipes/', '/api/user/me/']
+
+
+class Command(BaseCommand):
+    """Django command to load test the API"""
+
+    help = (
+        'Send many concurrent requests to a running server and report the throughput and latencies, '
+        'e.g. once to the WSGI app on :8000 and once to the ASGI app of the asgi compose profile on :8001'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Base url of the server, e.g. http://localhost:8000')
+        parser.add_argument('--token', required=True, help='Auth token of the user the requests are sent for')
+        parser.add_argument('--requests', type=int, default=2000, help='Number of requests sent to each path')
+        parser.add_argument('--concurrency', type=int, default=200, help='Number of requests in flight at a time')
+        parser.add_argument('--path', action='append', dest='paths', help='Path to request, can be repeated')
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        self.stdout.write(f'{"path":<28}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"errors":>8}')
+        for path in options['paths'] or DEFAULT_PATHS:
+            request = Request(options['url'].rstrip('/') + path, headers={'Authorization': f'Token {options["token"]}'})
+
+            # Threads are enough to keep the server busy, the client only waits on the sockets
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                results = list(executor.map(lambda _: self._send(request), range(options['requests'])))
+            elapsed = time.perf_counter() - start
+
+            latencies = sorted(latency for latency, ok in results if ok)
+            errors = len(results) - len(latencies)
+            if not latencies:
+                self.stdout.write(f'{path:<28}{"":>40}{errors:>8}')
+                continue
+            quantiles = statistics.quantiles(latencies, n=100)
+            self.stdout.write(
+                f'{path:<28}{len(results) / elapsed:>10.0f}{quantiles[49]:>10.1f}'
+                f'{quantiles[94]:>10.1f}{quantiles[98]:>10.1f}{errors:>8}'
+            )
+
+    def _send(self, request):
+        """Send the request, return its latency in milliseconds and if it succeeded"""
+        start = time.perf_counter()
+        try:
+            with urlopen(request, timeout=60) as response:
+                response.read()
+                ok = response.status == 200
+        except OSError:     # HTTPError for an error status, URLError when the connection fails
+            ok = False
+
+        return (time.perf_counter() - start) * 1000, ok
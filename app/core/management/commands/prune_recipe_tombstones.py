@@ -0,0 +1,30 @@
+"""
+Django command to delete the recipe tombstones no sync cursor can still need.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.batches import delete_in_batches
+from recipe import sync
+
+
+class Command(BaseCommand):
+    """Django command to delete the tombstones older than RECIPE_TOMBSTONE_TTL and those of deleted users"""
+
+    help = 'Delete the old recipe tombstones in small batches, each in its own short transaction'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.RECIPE_TOMBSTONE_BATCH_SIZE,
+            help='Number of tombstones deleted per transaction',
+        )
+        parser.add_argument('--pause', type=float, default=0, help='Seconds to wait between the batches')
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        deleted = delete_in_batches(sync.stale_tombstones(timezone.now()), options['batch_size'], options['pause'])
+        self.stdout.write(self.style.SUCCESS(f'{deleted} old recipe tombstones deleted.'))
@@ -0,0 +1,34 @@
+"""
+Django command to compute the recipe statistics of the users again.
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.functions import Lower
+
+from core.models import RecipeStats
+
+
+class Command(BaseCommand):
+    """Django command to rebuild the recipe statistics"""
+
+    help = 'Compute the recipe statistics again from the recipes, to backfill them or repair drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', nargs='+', help='Emails of the users to rebuild, by default all the users')
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        users = None
+        if options['email']:
+            # Whatever the case of the emails, LOWER(email) IN (...) is answered from the index on lower(email)
+            emails = {email.lower(): email for email in options['email']}
+            users = list(get_user_model().objects.alias(email_lower=Lower('email')).filter(email_lower__in=list(emails)))
+            missing = {emails[email] for email in emails.keys() - {user.email.lower() for user in users}}
+            if missing:
+                raise CommandError(f'No user with the email {", ".join(sorted(missing))}.')
+
+        # The recipes are locked against writes while the statistics are replaced
+        stats = RecipeStats.objects.rebuild(users)
+
+        self.stdout.write(self.style.SUCCESS(f'Recipe statistics rebuilt for {len(stats)} users.'))
@@ -0,0 +1,82 @@
+"""
+Django command to resolve the users sharing an email in different cases, before migration 0013.
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.db.models.functions import Coalesce, Greatest, Lower
+
+from core import tokens
+
+
+def duplicate_email(user):
+    """Return the email the user gets when another account keeps its email"""
+    local, _, domain = user.email.rpartition('@')
+    suffix = f'+duplicate-{user.pk}@{domain}'
+    # Still a valid and unique email, and never longer than the column
+    max_length = get_user_model()._meta.get_field('email').max_length
+
+    return local[:max_length - len(suffix)] + suffix
+
+
+def last_activity():
+    """Return the expression of the last time a user used the API"""
+    # The API logins don't set last_login, only the admin does: the last use of the opaque token, or its creation
+    # before its first use, and the newest refresh token, issued at every login and refresh of the signed mode
+    return Greatest(
+        Max(Coalesce('auth_token__usage__last_used_at', 'auth_token__created')),
+        Max('refresh_tokens__created_at'),
+        'last_login',
+    )
+
+
+class Command(BaseCommand):
+    """Django command to resolve the email collisions"""
+
+    help = (
+        'Keep the email of the most recently active user of each group of users sharing an email '
+        'in different cases, rename and deactivate the others'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only list what would be changed')
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        user_model = get_user_model()
+        collisions = (
+            user_model.objects.annotate(email_lower=Lower('email'))
+            .values('email_lower').annotate(users=Count('id')).filter(users__gt=1)
+            .values_list('email_lower', flat=True).order_by('email_lower')
+        )
+
+        resolved = 0
+        for email in collisions:
+            # Each email is resolved on its own, the users are locked so none of them is changed meanwhile
+            with transaction.atomic():
+                pks = list(user_model.objects.select_for_update().filter(email__ciexact=email).values_list('pk', flat=True))
+                users = list(
+                    user_model.objects.filter(pk__in=pks).annotate(last_active=last_activity())
+                    .order_by(F('last_active').desc(nulls_last=True), 'id')
+                )
+                kept, others = users[0], users[1:]
+                self.stdout.write(f'{email}: keeping user {kept.pk} ({kept.email}, last active {kept.last_active}).')
+                for user in others:
+                    new_email = duplicate_email(user)
+                    self.stdout.write(f'  User {user.pk} ({user.email}) renamed to {new_email} and deactivated.')
+                    if options['dry_run']:
+                        continue
+
+                    # Nothing is deleted, support can still merge the account's recipes by hand
+                    user.email = new_email
+                    user.is_active = False
+                    user.save(update_fields=['email', 'is_active'])
+                    tokens.revoke_user_tokens(user.pk)
+            resolved += 1
+
+        if options['dry_run']:
+            self.stdout.write(f'{resolved} emails to resolve, nothing changed.')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{resolved} emails resolved.'))
@@ -0,0 +1,44 @@
+"""
+Base of the commands importing an NDJSON or CSV file, see import_recipes and bulk_create_users.
+"""
+
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from recipe import importer
+
+
+class ImportCommand(BaseCommand):
+    """Command reading the records of an NDJSON or CSV file line by line"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Path of the file to import, - to read standard input')
+        parser.add_argument(
+            '--format',
+            choices=['ndjson', 'csv'],
+            help='Format of the file, by default guessed from the extension',
+        )
+
+    def import_file(self, options, import_records):
+        """Return the result of import_records called with the records of the file of the options"""
+        path = options['file']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        read_records = importer.ndjson_records if file_format == 'ndjson' else importer.csv_records
+
+        # The file is read line by line, newline='' lets the csv module handle the line endings of quoted fields
+        # utf-8-sig also accepts the byte order mark spreadsheets write at the start of a CSV file
+        if path == '-':
+            sys.stdin.reconfigure(encoding='utf-8-sig', newline='')
+            return import_records(read_records(sys.stdin))
+
+        with open(path, encoding='utf-8-sig', newline='') as lines:
+            return import_records(read_records(lines))
+
+    def write_errors(self, result):
+        """Write the errors of the failed records of the result, and how many more failed"""
+        for error in result['errors']:
+            self.stderr.write(f'Line {error["line"]}: {json.dumps(error["errors"])}')
+        if result['failed'] > len(result['errors']):
+            self.stderr.write(f'{result["failed"] - len(result["errors"])} more failed records not shown.')
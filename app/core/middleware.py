@@ -0,0 +1,58 @@
+"""
+Middleware for the API.
+"""
+
+import re
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+# Brotli is optional, without it the responses are only compressed with gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+re_accepts_brotli = re.compile(r'\bbr\b')
+
+# Brotli quality for responses compressed on the fly, above 5 the compression is much slower for little gain
+BROTLI_QUALITY = 5
+
+
+# Subclass of the Django GZipMiddleware, which compresses everything from 200 bytes and only with gzip
+class CompressionMiddleware(GZipMiddleware):
+    """Compress the responses above COMPRESSION_MIN_SIZE with brotli or gzip, whichever the client accepts"""
+
+    def process_response(self, request, response):
+        # Below the threshold compressing costs more CPU than the bytes it saves
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        # A stream is compressed chunk by chunk by the GZipMiddleware
+        if (
+            brotli is None
+            or response.streaming
+            or response.has_header('Content-Encoding')
+            or not re_accepts_brotli.search(accept_encoding)
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        # Return the compressed content only if it's actually shorter
+        compressed_content = brotli.compress(response.content, quality=BROTLI_QUALITY)
+        if len(compressed_content) >= len(response.content):
+            return response
+        response.content = compressed_content
+        response['Content-Length'] = str(len(response.content))
+
+        # Like the GZipMiddleware, the ETag of the compressed response is weak,
+        # so If-None-Match still matches the uncompressed version
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = 'br'
+
+        return response
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-17 05:56
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_recipe_search_vector'),
+    ]
+
+    operations = [
+        # pg_trgm provides the gin_trgm_ops operator class of the index, it ships with the postgres image
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='core_recipe_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
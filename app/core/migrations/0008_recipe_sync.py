@@ -0,0 +1,83 @@
+# Generated by Django 3.2.25 on 2026-10-17 06:03
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Every write of a recipe records the id of its transaction, whatever does the write (ORM, bulk_update, raw SQL)
+# The sync API compares these ids with the snapshot of the database to find what changed since a cursor
+# The delete trigger runs once per DELETE statement and records all the deleted rows with one INSERT
+CREATE_TRIGGERS = """
+CREATE FUNCTION core_recipe_change_txid_update() RETURNS trigger AS $$
+BEGIN
+    NEW.change_txid := txid_current();
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_recipe_change_txid_trigger
+    BEFORE INSERT OR UPDATE ON core_recipe
+    FOR EACH ROW EXECUTE FUNCTION core_recipe_change_txid_update();
+
+CREATE FUNCTION core_recipe_tombstone_insert() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO core_recipetombstone (user_id, recipe_id, change_txid, deleted_at)
+    SELECT user_id, id, txid_current(), now() FROM deleted_recipes;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_recipe_tombstone_trigger
+    AFTER DELETE ON core_recipe
+    REFERENCING OLD TABLE AS deleted_recipes
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_tombstone_insert();
+
+-- The existing recipes count as changed by this migration
+UPDATE core_recipe SET change_txid = txid_current();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER core_recipe_tombstone_trigger ON core_recipe;
+DROP FUNCTION core_recipe_tombstone_insert();
+DROP TRIGGER core_recipe_change_txid_trigger ON core_recipe;
+DROP FUNCTION core_recipe_change_txid_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_recipe_timestamps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe_id', models.BigIntegerField()),
+                ('change_txid', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='change_txid',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'change_txid'], name='core_recipe_user_txid_idx'),
+        ),
+        migrations.AddField(
+            model_name='recipetombstone',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='recipetombstone',
+            index=models.Index(fields=['user', 'change_txid'], name='core_tombstone_user_txid_idx'),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
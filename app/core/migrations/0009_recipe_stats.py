@@ -0,0 +1,139 @@
+# Generated by Django 3.2.25 on 2026-10-17 06:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# The time_minutes histogram buckets, like RecipeStats.TIME_BUCKETS
+BUCKETS = """
+    count(*) FILTER (WHERE time_minutes < 15) AS time_0_15,
+    count(*) FILTER (WHERE time_minutes >= 15 AND time_minutes < 30) AS time_15_30,
+    count(*) FILTER (WHERE time_minutes >= 30 AND time_minutes < 60) AS time_30_60,
+    count(*) FILTER (WHERE time_minutes >= 60 AND time_minutes < 120) AS time_60_120,
+    count(*) FILTER (WHERE time_minutes >= 120) AS time_120_plus
+"""
+
+COLUMNS = 'user_id, recipe_count, price_sum, price_min, price_max, time_0_15, time_15_30, time_30_60, time_60_120, time_120_plus'
+
+# The statistics of the rows of a table of recipes, per user
+AGGREGATE = f"""
+SELECT user_id, count(*), sum(price), min(price), max(price), {BUCKETS}
+FROM {{table}} GROUP BY user_id
+"""
+
+# Count the new rows, with a row for the users without statistics yet
+ADD = f"""
+INSERT INTO core_recipestats ({COLUMNS})
+{AGGREGATE}
+ON CONFLICT (user_id) DO UPDATE SET
+    recipe_count = core_recipestats.recipe_count + EXCLUDED.recipe_count,
+    price_sum = core_recipestats.price_sum + EXCLUDED.price_sum,
+    price_min = LEAST(core_recipestats.price_min, EXCLUDED.price_min),
+    price_max = GREATEST(core_recipestats.price_max, EXCLUDED.price_max),
+    time_0_15 = core_recipestats.time_0_15 + EXCLUDED.time_0_15,
+    time_15_30 = core_recipestats.time_15_30 + EXCLUDED.time_15_30,
+    time_30_60 = core_recipestats.time_30_60 + EXCLUDED.time_30_60,
+    time_60_120 = core_recipestats.time_60_120 + EXCLUDED.time_60_120,
+    time_120_plus = core_recipestats.time_120_plus + EXCLUDED.time_120_plus;
+"""
+
+# Uncount the removed rows
+# Only an UPDATE, when the user is deleted its statistics are deleted too and must not come back
+# A minimum or maximum can't be uncounted, when a removed price is one of them it is read again from the recipes,
+# min(price) and max(price) of a user are the first and last entries of the (user, price) index of migration 0006
+SUBTRACT = f"""
+WITH removed ({COLUMNS}) AS ({AGGREGATE})
+UPDATE core_recipestats SET
+    recipe_count = core_recipestats.recipe_count - removed.recipe_count,
+    price_sum = core_recipestats.price_sum - removed.price_sum,
+    price_min = CASE WHEN removed.price_min > core_recipestats.price_min THEN core_recipestats.price_min
+        ELSE (SELECT min(price) FROM core_recipe WHERE user_id = removed.user_id) END,
+    price_max = CASE WHEN removed.price_max < core_recipestats.price_max THEN core_recipestats.price_max
+        ELSE (SELECT max(price) FROM core_recipe WHERE user_id = removed.user_id) END,
+    time_0_15 = core_recipestats.time_0_15 - removed.time_0_15,
+    time_15_30 = core_recipestats.time_15_30 - removed.time_15_30,
+    time_30_60 = core_recipestats.time_30_60 - removed.time_30_60,
+    time_60_120 = core_recipestats.time_60_120 - removed.time_60_120,
+    time_120_plus = core_recipestats.time_120_plus - removed.time_120_plus
+FROM removed WHERE core_recipestats.user_id = removed.user_id;
+"""
+
+# The statistics of the users are updated on every write of their recipes, whatever does the write
+# The triggers run once per statement, a bulk write of many recipes updates each statistics row once
+# An update is the removal of the old rows and the addition of the new ones, which also handles a recipe changing user
+CREATE_TRIGGERS = f"""
+CREATE FUNCTION core_recipe_stats_insert() RETURNS trigger AS $$
+BEGIN
+    {ADD.format(table='new_recipes')}
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION core_recipe_stats_update() RETURNS trigger AS $$
+BEGIN
+    {SUBTRACT.format(table='old_recipes')}
+    {ADD.format(table='new_recipes')}
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION core_recipe_stats_delete() RETURNS trigger AS $$
+BEGIN
+    {SUBTRACT.format(table='old_recipes')}
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_recipe_stats_insert_trigger
+    AFTER INSERT ON core_recipe
+    REFERENCING NEW TABLE AS new_recipes
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_stats_insert();
+
+CREATE TRIGGER core_recipe_stats_update_trigger
+    AFTER UPDATE ON core_recipe
+    REFERENCING OLD TABLE AS old_recipes NEW TABLE AS new_recipes
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_stats_update();
+
+CREATE TRIGGER core_recipe_stats_delete_trigger
+    AFTER DELETE ON core_recipe
+    REFERENCING OLD TABLE AS old_recipes
+    FOR EACH STATEMENT EXECUTE FUNCTION core_recipe_stats_delete();
+
+-- The statistics of the existing recipes
+{ADD.format(table='core_recipe')}
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER core_recipe_stats_delete_trigger ON core_recipe;
+DROP TRIGGER core_recipe_stats_update_trigger ON core_recipe;
+DROP TRIGGER core_recipe_stats_insert_trigger ON core_recipe;
+DROP FUNCTION core_recipe_stats_delete();
+DROP FUNCTION core_recipe_stats_update();
+DROP FUNCTION core_recipe_stats_insert();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_recipe_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='core.user')),
+                ('recipe_count', models.IntegerField(default=0)),
+                ('price_sum', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('price_min', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('price_max', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('time_0_15', models.IntegerField(default=0)),
+                ('time_15_30', models.IntegerField(default=0)),
+                ('time_30_60', models.IntegerField(default=0)),
+                ('time_60_120', models.IntegerField(default=0)),
+                ('time_120_plus', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-17 06:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# The existing tokens count as used now, otherwise the ones created before TOKEN_TTL would expire at once
+BACKFILL = 'INSERT INTO core_tokenusage (token_id, last_used_at) SELECT key, now() FROM authtoken_token;'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authtoken', '0003_tokenproxy'),
+        ('core', '0010_refresh_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenUsage',
+            fields=[
+                ('token', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='usage', serialize=False, to='authtoken.token')),
+                ('last_used_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+    ]
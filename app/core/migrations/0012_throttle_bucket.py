@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-17 06:33
+
+from django.db import migrations, models
+
+
+# The buckets are rewritten on every login attempt and worthless after a crash, no need to write them to the WAL
+SET_UNLOGGED = 'ALTER TABLE core_throttlebucket SET UNLOGGED;'
+SET_LOGGED = 'ALTER TABLE core_throttlebucket SET LOGGED;'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_token_usage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottleBucket',
+            fields=[
+                ('key', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('tokens', models.FloatField()),
+                ('allowed', models.BooleanField()),
+                ('updated_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.RunSQL(SET_UNLOGGED, SET_LOGGED),
+    ]
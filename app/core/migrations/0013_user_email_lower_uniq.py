@@ -0,0 +1,43 @@
+# Generated by Django 3.2.25 on 2026-10-17 07:10
+
+from django.db import migrations
+
+
+# Emails differing only by their case, the index can't be created while some exist
+COLLISIONS = """
+SELECT lower(email), count(*) FROM core_user GROUP BY lower(email) HAVING count(*) > 1 ORDER BY 1 LIMIT 20
+"""
+
+# Unique whatever the case, and answers the LOWER(email) = LOWER(%s) lookups of the authentication backend
+# Django 3.2 declares an index on an expression in the model, Index(Lower('email')), but not a unique one,
+# UniqueConstraint on an expression came with Django 4.0, so the unique index lives in this migration only
+CREATE_INDEX = 'CREATE UNIQUE INDEX core_user_email_lower_uniq ON core_user (lower(email));'
+DROP_INDEX = 'DROP INDEX core_user_email_lower_uniq;'
+
+
+def check_collisions(apps, schema_editor):
+    """Refuse to migrate while users share an email in different cases"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(COLLISIONS)
+        collisions = cursor.fetchall()
+
+    if collisions:
+        emails = ', '.join(f'{email} ({count} users)' for email, count in collisions)
+        # Deciding which account keeps the email is left to the resolve_email_collisions command,
+        # a migration shouldn't lock users out on its own
+        raise RuntimeError(
+            f'Users share an email in different cases: {emails}. '
+            'Run python manage.py resolve_email_collisions, then migrate again.'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_throttle_bucket'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_collisions, migrations.RunPython.noop),
+        migrations.RunSQL(CREATE_INDEX, DROP_INDEX),
+    ]
@@ -2,12 +2,20 @@
 Database models.
 """
 
+from decimal import Decimal
+
 from django.conf import settings
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models.functions import Lower
 from django.contrib.auth.models import (AbstractBaseUser,
                                         BaseUserManager,
                                         PermissionsMixin,
                                         )
+from rest_framework.authtoken.models import Token
+
+from core import hashing
 
 
 class UserManager(BaseUserManager):
@@ -27,6 +35,75 @@ class UserManager(BaseUserManager):
 
         return user
 
+    def bulk_create_users(self, users, make_passwords=None):
+        """Create the users of a list of field dicts and their tokens, with one INSERT each
+
+        Return (user, token) for each dict in order, token is None when the email is taken, by an existing user
+        or an earlier dict. make_passwords hashes a list of passwords, e.g. in the process pool of
+        hashing.parallel_hasher, a None password gets an unusable password.
+        """
+        results = []
+        passwords = []
+        for fields in users:
+            fields = dict(fields, email=self.normalize_email(fields['email']))
+            passwords.append(fields.pop('password', None) or None)
+            results.append([self.model(**fields), None])
+
+        # Emails are unique whatever their case, one LOWER(email) IN (...) query answered from the index
+        new = self._untaken([user for user, _ in results])
+
+        # Only the new users are hashed, the hashes are the slow part, and only once
+        new_passwords = [passwords[index] for index in new]
+        hashes = make_passwords(new_passwords) if make_passwords else [hashing.make_password(p) for p in new_passwords]
+        for index, encoded in zip(new, hashes):
+            results[index][0].password = encoded
+
+        # A user created by another request between the check and the INSERT fails the whole chunk,
+        # its email is then found taken on the second try
+        try:
+            self._insert_with_tokens(results, new)
+        except IntegrityError:
+            new = self._untaken([results[index][0] for index in new], new)
+            try:
+                self._insert_with_tokens(results, new)
+            except IntegrityError:
+                # Python's str.lower() and Postgres' lower() differ for some characters, the check can miss an
+                # email the index refuses: insert the users one by one, a refused user is reported as taken
+                for index in new:
+                    try:
+                        self._insert_with_tokens(results, [index])
+                    except IntegrityError:
+                        pass
+
+        return [tuple(result) for result in results]
+
+    def _untaken(self, users, indexes=None):
+        """Return the indexes of the users whose email isn't taken, by an existing user or a previous user"""
+        indexes = range(len(users)) if indexes is None else indexes
+        emails = [user.email.lower() for user in users]
+        taken = set(
+            self.annotate(email_lower=Lower('email')).filter(email_lower__in=emails).values_list('email_lower', flat=True)
+        )
+        untaken = []
+        for index, email in zip(indexes, emails):
+            if email not in taken:
+                taken.add(email)
+                untaken.append(index)
+
+        return untaken
+
+    def _insert_with_tokens(self, results, indexes):
+        """Insert the users of the results at the indexes and their tokens, in one transaction or savepoint"""
+        new_users = [results[index][0] for index in indexes]
+        with transaction.atomic(using=self._db):
+            # Postgres returns the ids of the inserted rows, the tokens can reference them
+            self.bulk_create(new_users)
+            new_tokens = Token.objects.using(self._db).bulk_create(
+                [Token(user=user, key=Token.generate_key()) for user in new_users]
+            )
+        for index, token in zip(indexes, new_tokens):
+            results[index][1] = token
+
     def create_superuser(self, email, password):
         """Create a new superuser profile"""
         # **extra_fields keyword argument accepts any number of keyword arguments key=value
@@ -41,7 +118,7 @@ class UserManager(BaseUserManager):
 class User(AbstractBaseUser, PermissionsMixin):
     """User in the system"""
 
-    # Email is the username and should be unique
+    # Email is the username and should be unique, whatever its case (index on lower(email), migration 0013)
     email = models.EmailField(max_length=255, unique=True)
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
@@ -54,6 +131,23 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     objects = UserManager()
 
+    # create_user, the user serializer and the authentication backend all go through these two methods,
+    # the hashes are computed in the pool of core/hashing.py instead of the request thread
+    def set_password(self, raw_password):
+        """Set the hash of the password"""
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password   # Sends password_changed after the save, like AbstractBaseUser
+
+    def check_password(self, raw_password):
+        """Return whether the password is correct, saving a new hash when the cost profile changed"""
+        def setter(raw_password):
+            self.set_password(raw_password)
+            # The password didn't change, only its hash
+            self._password = None
+            self.save(update_fields=['password'])
+
+        return hashing.check_password(raw_password, self.password, setter)
+
 
 # Simple Model Base Class from Django
 class Recipe(models.Model):
@@ -69,7 +163,185 @@ class Recipe(models.Model):
     time_minutes = models.IntegerField()
     price = models.DecimalField(max_digits=5, decimal_places=2)
     link = models.CharField(max_length=255, blank=True)
+    # Full-text search document of the title and the description, never set from Python
+    # A database trigger (migration 0004) fills it on every insert and on every update of the title or description
+    search_vector = SearchVectorField(null=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)   # Set once when the recipe is created
+    updated_at = models.DateTimeField(auto_now=True)    # Set on every save, the API uses it to detect changes
+    # Id of the last transaction that wrote the recipe, set by a database trigger (migration 0008) for the sync API
+    change_txid = models.BigIntegerField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Every recipe API call filters on the user and sorts by newest first (-id)
+            # With this index Postgres reads the rows of one user already in order, without a sort
+            models.Index(fields=['user', '-id'], name='core_recipe_user_id_desc_idx'),
+            # Range filters of the recipe list, e.g. recipes of a user under 10.00 or under 30 minutes
+            models.Index(fields=['user', 'price'], name='core_recipe_user_price_idx'),
+            models.Index(fields=['user', 'time_minutes'], name='core_recipe_user_time_idx'),
+            # Latest change of a user's recipes, read for the ETag and Last-Modified headers of the recipe API
+            models.Index(fields=['user', 'updated_at'], name='core_recipe_user_updated_idx'),
+            # Recipes of a user changed since a sync cursor
+            models.Index(fields=['user', 'change_txid'], name='core_recipe_user_txid_idx'),
+            # GIN index for the full-text search, finds the matching recipes without reading every row
+            GinIndex(fields=['search_vector'], name='core_recipe_search_vector_idx'),
+            # Trigram GIN index for the title autocomplete, answers ILIKE 'prefix%' and fuzzy % matches
+            GinIndex(fields=['title'], opclasses=['gin_trgm_ops'], name='core_recipe_title_trgm_idx'),
+        ]
 
     def __str__(self):
         # Is used in the Django admin, otherwise there will be just an id in the admin
         return self.title
+
+
+# Written only by a database trigger (migration 0008) when a recipe row is deleted, whatever deletes it
+class RecipeTombstone(models.Model):
+    """Deleted recipe, kept so the sync API can tell clients to remove it"""
+
+    # db_constraint=False and DO_NOTHING because the trigger also runs while a user and their recipes are deleted,
+    # the tombstones of a deleted user are left behind and nobody can sync them anymore
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+    recipe_id = models.BigIntegerField()    # Not a ForeignKey, the recipe doesn't exist anymore
+    change_txid = models.BigIntegerField()  # Id of the transaction that deleted the recipe
+    deleted_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Recipes of a user deleted since a sync cursor
+            models.Index(fields=['user', 'change_txid'], name='core_tombstone_user_txid_idx'),
+        ]
+
+    def __str__(self):
+        return f'Recipe {self.recipe_id}'
+
+
+class RecipeStatsManager(models.Manager):
+    """Manager for the recipe statistics"""
+
+    def rebuild(self, users=None):
+        """Compute the statistics again from the recipes, of all users or only of the users given
+
+        The statistics are kept up to date by database triggers, this is for backfills and to repair drift.
+        """
+        recipes = Recipe.objects.all()
+        stats = self.all()
+        if users is not None:
+            recipes = recipes.filter(user__in=users)
+            stats = stats.filter(user__in=users)
+
+        # The histogram buckets are counts of the recipes with a time_minutes in their range
+        buckets = {
+            field: models.Count('id', filter=models.Q(
+                **({'time_minutes__gte': low} if low is not None else {}),
+                **({'time_minutes__lt': high} if high is not None else {}),
+            ))
+            for field, low, high in RecipeStats.TIME_BUCKETS
+        }
+        rows = recipes.order_by().values('user').annotate(
+            recipe_count=models.Count('id'),
+            price_sum=models.Sum('price'),
+            price_min=models.Min('price'),
+            price_max=models.Max('price'),
+            **buckets,
+        )
+
+        with transaction.atomic():
+            # Writers wait until the statistics are replaced, so no change is counted twice or lost
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {Recipe._meta.db_table} IN SHARE MODE')
+            stats.delete()
+            # The users without recipes get no row, the API answers zeros for them
+            return self.bulk_create(
+                RecipeStats(user_id=row.pop('user'), **row) for row in rows
+            )
+
+
+# Written by database triggers (migration 0009) on every insert, update and delete of recipes, whatever does the write
+# Reading the dashboard is then one row instead of aggregates over all the recipes of the user
+class RecipeStats(models.Model):
+    """Statistics of the recipes of a user"""
+
+    # Field name, lowest and highest time_minutes (excluded) of the histogram buckets, None for no limit
+    # The triggers of migration 0009 use the same buckets
+    TIME_BUCKETS = [
+        ('time_0_15', None, 15),
+        ('time_15_30', 15, 30),
+        ('time_30_60', 30, 60),
+        ('time_60_120', 60, 120),
+        ('time_120_plus', 120, None),
+    ]
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True)
+    recipe_count = models.IntegerField(default=0)
+    price_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # The average is price_sum / recipe_count
+    price_min = models.DecimalField(max_digits=5, decimal_places=2, null=True)  # None without recipes
+    price_max = models.DecimalField(max_digits=5, decimal_places=2, null=True)
+    time_0_15 = models.IntegerField(default=0)
+    time_15_30 = models.IntegerField(default=0)
+    time_30_60 = models.IntegerField(default=0)
+    time_60_120 = models.IntegerField(default=0)
+    time_120_plus = models.IntegerField(default=0)
+
+    objects = RecipeStatsManager()
+
+    def __str__(self):
+        return f'Recipe statistics of {self.user}'
+
+    @property
+    def price_avg(self):
+        """Return the average price of the recipes, None without recipes"""
+        if not self.recipe_count:
+            return None
+
+        return (self.price_sum / self.recipe_count).quantize(Decimal('0.01'))
+
+    @property
+    def time_histogram(self):
+        """Return the buckets of the time_minutes histogram with their count of recipes"""
+        return [
+            {'min': low, 'max': high, 'count': getattr(self, field)}
+            for field, low, high in self.TIME_BUCKETS
+        ]
+
+
+# The refresh tokens of the signed token mode, see core/tokens.py
+class RefreshToken(models.Model):
+    """Long lived token exchanged for new access tokens"""
+
+    # Only the SHA-256 of the token is stored, a leaked table can't be used to refresh
+    digest = models.CharField(max_length=64, primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='refresh_tokens')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)    # To find the expired tokens
+
+    def __str__(self):
+        return f'Refresh token of {self.user}'
+
+
+# The table of the opaque tokens belongs to DRF, the last use of a token is kept next to it
+class TokenUsage(models.Model):
+    """Last use of an opaque token, for its sliding expiry"""
+
+    token = models.OneToOneField(Token, on_delete=models.CASCADE, primary_key=True, related_name='usage')
+    # Written at most once per TOKEN_LAST_USED_INTERVAL, not on every request
+    last_used_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'Usage of the token of {self.token.user}'
+
+
+# The table is UNLOGGED (migration 0012), the buckets are disposable and refill anyway after a crash
+class ThrottleBucket(models.Model):
+    """Token bucket of a login throttle, shared by all the workers, see core/throttling.py"""
+
+    key = models.CharField(max_length=255, primary_key=True)    # Scope and client, e.g. login-ip:1.2.3.4
+    tokens = models.FloatField()
+    allowed = models.BooleanField()     # Whether the last request took a token
+    updated_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,82 @@
+"""
+Renderers for the API.
+"""
+
+from decimal import Decimal
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+# The fast encoders are optional, without them the renderers fall back to the standard library
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class DecimalJSONEncoder(encoders.JSONEncoder):
+    """DRF JSON encoder that keeps every digit of a Decimal"""
+
+    def default(self, obj):
+        # DRF turns a Decimal into a float, which can't represent every price exactly
+        # The serializers already return prices as strings, this only matters for a Decimal in a hand made response
+        if isinstance(obj, Decimal):
+            return str(obj)
+
+        return super().default(obj)
+
+
+# Types orjson and msgpack don't encode themselves are encoded like DRF does, e.g. lazy translations and datetimes
+_default = DecimalJSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSON renderer using orjson when it is installed, with the same output as DRF's JSONRenderer"""
+
+    encoder_class = DecimalJSONEncoder
+
+    # Non-string keys are turned into strings like the json module does, e.g. the indexes of the batch errors
+    # Datetimes go through _default, so they get the Z suffix DRF uses instead of +00:00
+    orjson_options = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Render the data into JSON bytes"""
+        if data is None:
+            return b''
+
+        # orjson only writes compact non-ASCII JSON, which is DRF's default
+        # The indented JSON of the browsable API and ?indent= requests is rendered by DRF
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=_default, option=self.orjson_options)
+        except orjson.JSONEncodeError:
+            # Data orjson can't encode, like an integer above 64 bits, is rendered by DRF
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Like DRF, escape the line and paragraph separators so the JSON is also valid JavaScript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Renderer for MessagePack, a binary format smaller and faster to decode than JSON"""
+
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Render the data into MessagePack bytes"""
+        if data is None:
+            return b''
+
+        # datetime=False sends the datetimes to _default, they are strings like in the JSON responses
+        return msgpack.packb(data, default=_default, use_bin_type=True, datetime=False)
@@ -0,0 +1,40 @@
+"""
+Signal receivers of the core app.
+"""
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from core.authentication import invalidate_token_cache
+from core.tokens import revoke_user_tokens
+
+
+# Deleting a user deletes its tokens, which sends post_delete for each of them
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Drop the cached user of a deleted token"""
+    invalidate_token_cache(key=instance.key)
+
+
+# Every save drops the cached copies of the user, whatever changed: a deactivation, a new password
+# (UserSerializer.update saves the user after set_password) or the profile, so the views see the new name
+# QuerySet.update() sends no signal, the cached copies then expire after TOKEN_AUTH_CACHE_TTL
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_saved_user(sender, instance, created, **kwargs):
+    """Drop the cached copies of a saved user"""
+    # A new user has no token yet
+    if not created:
+        invalidate_token_cache(user_id=instance.pk)
+        # The signed access tokens aren't cached, they are revoked
+        if not instance.is_active:
+            revoke_user_tokens(instance.pk)
+
+
+# The signed access tokens of a deleted user would still authenticate requests until they expire,
+# and the views would fail reading or referencing the missing user
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    """Revoke the access tokens of a deleted user"""
+    revoke_user_tokens(instance.pk)
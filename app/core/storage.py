@@ -0,0 +1,50 @@
+"""
+Static files storage.
+"""
+
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+from core.middleware import brotli
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Static files storage adding a hash of the content to the file names, and .gz and .br copies of the text files
+
+    The proxy serves the compressed copies directly, and caches the hashed names forever because their content
+    never changes.
+    """
+
+    # Text files, images like PNG or JPEG are already compressed
+    compressible_extensions = ('.css', '.js', '.map', '.svg', '.json', '.html', '.txt', '.xml', '.ttf', '.eot')
+
+    def post_process(self, paths, dry_run=False, **options):
+        """Hash the files, then write a compressed copy of each hashed text file"""
+        yield from super().post_process(paths, dry_run, **options)
+
+        if dry_run:
+            return
+
+        # The files with references to other files are hashed again on every pass,
+        # only the final names in the manifest exist once the hashing is done
+        for name in paths:
+            hashed_name = self.hashed_files.get(self.hash_key(self.clean_name(name)))
+            if hashed_name and hashed_name.endswith(self.compressible_extensions):
+                self._compress(hashed_name)
+
+    def _compress(self, name):
+        """Write the .gz copy of the file, and the .br copy when brotli is installed"""
+        with self.open(name) as original:
+            content = original.read()
+
+        # The files are compressed once at deploy time, so use the best compression
+        copies = {f'{name}.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli:
+            copies[f'{name}.br'] = brotli.compress(content)
+
+        for path, compressed in copies.items():
+            if self.exists(path):
+                self.delete(path)
+            self._save(path, ContentFile(compressed))
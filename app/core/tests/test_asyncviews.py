@@ -0,0 +1,65 @@
+"""
+Test the async views of the ASGI deployment
+"""
+
+import asyncio
+
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase, override_settings
+
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.asyncviews import as_async_view, asgi_view
+from core.models import Recipe
+from recipe.views import RecipeViewSet
+from user.views import ManageUserView
+
+
+# TransactionTestCase because the async views query the database from another thread, with another connection,
+# which wouldn't see the data of the transaction of a TestCase
+class AsyncViewTests(TransactionTestCase):
+    """Test the async views"""
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = get_user_model().objects.create_user(email='user@example.com', password='testpass123')
+
+    def test_recipe_list(self):
+        """Test the async recipe list returns the rendered recipes of the user"""
+        Recipe.objects.create(user=self.user, title='Soup', time_minutes=10, price='2.50')
+        view = as_async_view(RecipeViewSet.as_view({'get': 'list'}))
+        request = self.factory.get('/api/recipe/recipes/')
+        force_authenticate(request, self.user)
+
+        response = async_to_sync(view)(request)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.is_rendered)
+        self.assertEqual([recipe['title'] for recipe in response.data['results']], ['Soup'])
+
+    def test_manage_user(self):
+        """Test the async user view updates the user"""
+        view = as_async_view(ManageUserView.as_view())
+        request = self.factory.patch('/api/user/me/', {'name': 'New name'}, format='json')
+        force_authenticate(request, self.user)
+
+        response = async_to_sync(view)(request)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'New name')
+
+    def test_asgi_view_only_under_asgi(self):
+        """Test the views are only replaced by async views when the app is served by ASGI"""
+        view = ManageUserView.as_view()
+
+        with override_settings(ASGI_MODE=False):
+            self.assertIs(asgi_view(view), view)
+        with override_settings(ASGI_MODE=True):
+            async_view = asgi_view(view)
+
+        self.assertTrue(asyncio.iscoroutinefunction(async_view))
+        self.assertTrue(async_view.csrf_exempt)
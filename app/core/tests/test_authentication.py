@@ -0,0 +1,181 @@
+"""
+Test the cached token authentication
+"""
+
+import os
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import token_cache, token_cache_stats
+from core.models import TokenUsage
+
+ME_URL = reverse('user:me')
+TOKEN_CACHE_STATS_URL = reverse('user:token-cache-stats')
+
+
+@override_settings(TOKEN_AUTH_CACHE_SIZE=100, TOKEN_AUTH_CACHE_TTL=60, TOKEN_TTL=3600, TOKEN_MAX_AGE=0,
+                   TOKEN_LAST_USED_INTERVAL=300)
+class CachedTokenAuthenticationTests(TestCase):
+    """Test the token authentication cache"""
+
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        self.user = get_user_model().objects.create_user(email='user@example.com', password='testpass123', name='Name')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_me(self):
+        """Return the status code and the number of queries of a request of the user endpoint"""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(ME_URL)
+
+        return res.status_code, len(queries)
+
+    def test_cached_after_first_request(self):
+        """Test the token is read from the database only by the first request"""
+        self.assertEqual(self.get_me(), (status.HTTP_200_OK, 1))
+        self.assertEqual(self.get_me(), (status.HTTP_200_OK, 0))
+
+        stats = token_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_token_cache_stats_endpoint(self):
+        """Test the staff gets the counters of the cache of the worker answering, the other users don't"""
+        self.get_me()
+        res_forbidden = self.client.get(TOKEN_CACHE_STATS_URL)
+        get_user_model().objects.filter(pk=self.user.pk).update(is_staff=True)
+        token_cache.clear()
+
+        self.get_me()
+        res = self.client.get(TOKEN_CACHE_STATS_URL)
+
+        self.assertEqual(res_forbidden.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual((res.data['hits'], res.data['misses'], res.data['size']), (1, 1, 1))
+        self.assertEqual(res.data['worker'], os.getpid())
+
+    def test_cached_user_not_changed_by_view(self):
+        """Test a view changing request.user doesn't change the cached user"""
+        self.get_me()
+        cached = token_cache.get(self.token.key)
+
+        cached.user.name = 'Changed'
+
+        self.assertEqual(token_cache.get(self.token.key).user.name, 'Name')
+
+    def test_deleted_token_rejected(self):
+        """Test a deleted token is dropped from the cache"""
+        self.get_me()
+
+        self.token.delete()
+
+        self.assertEqual(self.get_me()[0], status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """Test the token of a deactivated user is dropped from the cache"""
+        self.get_me()
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.get_me()[0], status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_invalidates(self):
+        """Test changing the password through the API drops the cached token, which is deleted"""
+        self.get_me()
+
+        res = self.client.patch(ME_URL, {'password': 'newpass123', 'name': 'New name'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(token_cache.get(self.token.key))
+        self.assertEqual(self.get_me()[0], status.HTTP_401_UNAUTHORIZED)
+
+    def test_profile_change_refreshes_cached_user(self):
+        """Test the cached user is read again after a profile change, the token stays valid"""
+        self.get_me()
+
+        self.client.patch(ME_URL, {'name': 'New name'})
+
+        self.assertEqual(self.client.get(ME_URL).data['name'], 'New name')
+
+    def test_expired_entry_read_again(self):
+        """Test a token is read from the database again after the TTL"""
+        with self.settings(TOKEN_AUTH_CACHE_TTL=0):
+            self.get_me()
+
+        self.assertEqual(self.get_me(), (status.HTTP_200_OK, 1))
+
+    def test_least_recently_used_evicted(self):
+        """Test the cache keeps at most TOKEN_AUTH_CACHE_SIZE tokens, dropping the least recently used"""
+        other = get_user_model().objects.create_user(email='other@example.com', password='testpass123')
+        other_token = Token.objects.create(user=other)
+
+        with self.settings(TOKEN_AUTH_CACHE_SIZE=1):
+            self.get_me()
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {other_token.key}')
+            self.get_me()
+
+        self.assertIsNone(token_cache.get(self.token.key))
+        self.assertIsNotNone(token_cache.get(other_token.key))
+
+    @override_settings(TOKEN_AUTH_CACHE_SIZE=0)
+    def test_cache_disabled(self):
+        """Test every request reads the token when the cache is off"""
+        self.get_me()
+
+        self.assertEqual(self.get_me(), (status.HTTP_200_OK, 1))
+
+    def use_token_ago(self, **delta):
+        """Set the last use of the token in the past"""
+        TokenUsage.objects.update_or_create(token=self.token, defaults={'last_used_at': timezone.now() - timedelta(**delta)})
+
+    def test_last_use_written_once_per_interval(self):
+        """Test the last use is only written when older than the interval"""
+        self.use_token_ago(minutes=10)
+
+        self.assertEqual(self.get_me(), (status.HTTP_200_OK, 2))    # The token and the write of its last use
+        self.assertEqual(self.get_me(), (status.HTTP_200_OK, 0))
+
+        with self.settings(TOKEN_AUTH_CACHE_SIZE=0):
+            self.assertEqual(self.get_me(), (status.HTTP_200_OK, 1))
+        self.assertGreater(TokenUsage.objects.get(token=self.token).last_used_at, timezone.now() - timedelta(minutes=1))
+
+    def test_first_use_recorded(self):
+        """Test the first use of a token creates its last use"""
+        Token.objects.filter(pk=self.token.pk).update(created=timezone.now() - timedelta(minutes=10))
+
+        self.get_me()
+
+        self.assertTrue(TokenUsage.objects.filter(token=self.token).exists())
+
+    def test_sliding_expiry(self):
+        """Test a token unused for longer than TOKEN_TTL is rejected and not made valid again"""
+        self.use_token_ago(hours=2)
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(res.data['detail'], 'Token expired.')
+        self.assertLess(TokenUsage.objects.get(token=self.token).last_used_at, timezone.now() - timedelta(hours=1))
+
+    def test_max_age(self):
+        """Test a token older than TOKEN_MAX_AGE is rejected even when used recently, also from the cache"""
+        Token.objects.filter(pk=self.token.pk).update(created=timezone.now() - timedelta(days=2))
+        self.use_token_ago(minutes=1)
+        self.assertEqual(self.get_me(), (status.HTTP_200_OK, 1))
+
+        with self.settings(TOKEN_MAX_AGE=24 * 3600):
+            self.assertEqual(self.get_me()[0], status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,58 @@
+"""
+Test the deployment system checks
+"""
+
+from django.test import SimpleTestCase, override_settings
+
+from core.checks import check_denylist_cache, check_recipe_cache
+
+DATABASE_CACHE = {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache_table'}
+LOCMEM_CACHE = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+MEMCACHED_CACHE = {'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache', 'LOCATION': 'memcached:11211'}
+
+
+class DenylistCacheCheckTests(SimpleTestCase):
+    """Test the check of the cache holding the denylist of the access tokens"""
+
+    @override_settings(AUTH_TOKEN_MODES=['token', 'signed'], CACHES={'default': LOCMEM_CACHE})
+    def test_locmem_denylist_error(self):
+        """Test a denylist in the memory of each worker is an error when the signed mode is on"""
+        errors = check_denylist_cache(None)
+
+        self.assertEqual([error.id for error in errors], ['core.E001'])
+
+    @override_settings(AUTH_TOKEN_MODES=['token', 'signed'], CACHES={'default': DATABASE_CACHE})
+    def test_database_denylist_error(self):
+        """Test a denylist in the database is an error, it adds a query to every request with a signed token"""
+        errors = check_denylist_cache(None)
+
+        self.assertEqual([error.id for error in errors], ['core.E001'])
+
+    @override_settings(AUTH_TOKEN_MODES=['token', 'signed'], CACHES={'default': MEMCACHED_CACHE})
+    def test_memcached_denylist(self):
+        """Test a memcached shared by the workers passes"""
+        self.assertEqual(check_denylist_cache(None), [])
+
+    @override_settings(AUTH_TOKEN_MODES=['token'], CACHES={'default': LOCMEM_CACHE})
+    def test_signed_mode_off(self):
+        """Test the cache doesn't matter without signed tokens"""
+        self.assertEqual(check_denylist_cache(None), [])
+
+
+class RecipeCacheCheckTests(SimpleTestCase):
+    """Test the check of the cache of the recipe responses"""
+
+    @override_settings(CACHES={'default': LOCMEM_CACHE})
+    def test_locmem_recipe_cache_error(self):
+        """Test responses cached in the memory of each worker are an error"""
+        self.assertEqual([error.id for error in check_recipe_cache(None)], ['core.E002'])
+
+    @override_settings(CACHES={'default': DATABASE_CACHE})
+    def test_database_recipe_cache_error(self):
+        """Test responses cached in the database are an error, a hit would cost more queries than a miss"""
+        self.assertEqual([error.id for error in check_recipe_cache(None)], ['core.E002'])
+
+    @override_settings(CACHES={'default': MEMCACHED_CACHE})
+    def test_memcached_recipe_cache(self):
+        """Test a memcached shared by the workers passes"""
+        self.assertEqual(check_recipe_cache(None), [])
@@ -1,13 +1,23 @@
 """
 Test custom Django management commands
 """
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
 from unittest.mock import patch
 
 from psycopg2 import OperationalError as Psycopg2Error
 
-from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core.models import Recipe, RecipeStats, RecipeTombstone, RefreshToken, ThrottleBucket, TokenUsage
 
 
 @patch("core.management.commands.wait_for_db.Command.check")
@@ -39,3 +49,276 @@ class CommandTests(SimpleTestCase):
 
         # command will be called multiple times until it is successful
         patched_check.assert_called_with(databases=["default"])
+
+
+class ImportRecipesCommandTests(TestCase):
+    """Test the import_recipes command."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='user@example.com', password='testpass123')
+
+    def write_file(self, content, suffix):
+        """Write the content to a temporary file and return its path."""
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(content)
+        self.addCleanup(os.remove, path)
+
+        return path
+
+    def test_import_recipes_csv(self):
+        """Test importing a CSV file, the format is guessed from the extension."""
+        path = self.write_file(
+            'title,time_minutes,price\n'
+            'Soup,10,2.50\n'
+            'Cake,10,not a price\n',
+            suffix='.csv',
+        )
+        stdout, stderr = StringIO(), StringIO()
+
+        call_command('import_recipes', 'user@example.com', path, stdout=stdout, stderr=stderr)
+
+        self.assertEqual(list(Recipe.objects.filter(user=self.user).values_list('title', flat=True)), ['Soup'])
+        self.assertIn('1 recipes imported, 1 failed.', stdout.getvalue())
+        self.assertIn('Line 3: {"price"', stderr.getvalue())
+
+    def test_import_recipes_ndjson(self):
+        """Test importing an NDJSON file."""
+        path = self.write_file('{"title": "Soup", "time_minutes": 10, "price": "2.50"}\n', suffix='.txt')
+
+        call_command('import_recipes', 'User@Example.com', path, format='ndjson', stdout=StringIO())
+
+        self.assertTrue(Recipe.objects.filter(user=self.user, title='Soup').exists())
+
+    def test_import_recipes_unknown_user(self):
+        """Test the command fails for an unknown user."""
+        with self.assertRaises(CommandError):
+            call_command('import_recipes', 'nobody@example.com', 'recipes.csv')
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000)
+class BulkCreateUsersCommandTests(TestCase):
+    """Test the bulk_create_users command."""
+
+    def setUp(self):
+        get_user_model().objects.create_user(email='taken@example.com', password='testpass123')
+
+    def write_file(self, content, suffix):
+        """Write the content to a temporary file and return its path."""
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(content)
+        self.addCleanup(os.remove, path)
+
+        return path
+
+    def test_bulk_create_users_csv(self):
+        """Test users are created with their tokens, duplicate emails and invalid rows are reported."""
+        path = self.write_file(
+            'email,password,name\n'
+            'one@example.com,testpass123,One\n'
+            'taken@EXAMPLE.com,testpass123,Taken\n'
+            'one@example.com,otherpass123,Again\n'
+            'not an email,testpass123,Bad\n'
+            'two@example.com,,Two\n',
+            suffix='.csv',
+        )
+        tokens_path = self.write_file('', suffix='.csv')
+        stdout, stderr = StringIO(), StringIO()
+
+        call_command('bulk_create_users', path, workers=1, tokens=tokens_path, stdout=stdout, stderr=stderr)
+
+        one = get_user_model().objects.get(email='one@example.com')
+        self.assertTrue(one.check_password('testpass123'))
+        self.assertEqual(one.name, 'One')
+        self.assertFalse(get_user_model().objects.get(email='two@example.com').has_usable_password())
+        self.assertEqual(Token.objects.filter(user__email__in=['one@example.com', 'two@example.com']).count(), 2)
+        self.assertIn('2 users created, 2 duplicate emails, 1 failed.', stdout.getvalue())
+        self.assertIn('Line 3: taken@example.com already exists.', stderr.getvalue())
+        self.assertIn('Line 4: one@example.com already exists.', stderr.getvalue())
+        self.assertIn('Line 5: {"email"', stderr.getvalue())
+        with open(tokens_path) as file:
+            self.assertEqual(file.read().splitlines(), [
+                'email,token',
+                f'one@example.com,{one.auth_token.key}',
+                f'two@example.com,{Token.objects.get(user__email="two@example.com").key}',
+            ])
+
+    @override_settings(USER_IMPORT_CHUNK_SIZE=2)
+    def test_bulk_create_users_ndjson_in_chunks(self):
+        """Test an NDJSON file is created chunk by chunk, hashing in this process."""
+        path = self.write_file(
+            ''.join(f'{{"email": "user{i}@example.com", "password": "testpass123"}}\n' for i in range(5)),
+            suffix='.ndjson',
+        )
+
+        call_command('bulk_create_users', path, workers=0, stdout=StringIO())
+
+        self.assertEqual(get_user_model().objects.filter(email__startswith='user').count(), 5)
+        self.assertEqual(Token.objects.count(), 5)
+
+
+class ResolveEmailCollisionsCommandTests(TestCase):
+    """Test the resolve_email_collisions command."""
+
+    def setUp(self):
+        # Users sharing an email in different cases only exist in databases from before migration 0013,
+        # the index is dropped in the transaction of the test and comes back with its rollback
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX core_user_email_lower_uniq')
+        self.old = get_user_model().objects.create_user(email='ann@example.com', password='testpass123')
+        self.recent = get_user_model().objects.create_user(email='Ann@example.com', password='testpass123')
+
+    def test_resolve_keeps_most_recently_active(self):
+        """Test the user whose token was used last keeps the email, the other is renamed and deactivated."""
+        # The admin login of the other user is older than the last use of the API token
+        get_user_model().objects.filter(pk=self.old.pk).update(last_login=timezone.now() - timedelta(days=10))
+        token = Token.objects.create(user=self.recent)
+        TokenUsage.objects.create(token=token, last_used_at=timezone.now() - timedelta(days=1))
+        Token.objects.create(user=self.old)
+        Token.objects.filter(user=self.old).update(created=timezone.now() - timedelta(days=30))
+        stdout = StringIO()
+
+        call_command('resolve_email_collisions', stdout=stdout)
+
+        self.old.refresh_from_db()
+        self.assertEqual(self.old.email, f'ann+duplicate-{self.old.pk}@example.com')
+        self.assertFalse(self.old.is_active)
+        self.assertFalse(Token.objects.filter(user=self.old).exists())
+        self.recent.refresh_from_db()
+        self.assertEqual(self.recent.email, 'Ann@example.com')
+        self.assertTrue(self.recent.is_active)
+        self.assertIn('1 emails resolved.', stdout.getvalue())
+
+    def test_resolve_refresh_token_activity(self):
+        """Test a refresh token, issued at every signed login, counts as activity."""
+        RefreshToken.objects.create(digest='a' * 64, user=self.old, expires_at=timezone.now() + timedelta(days=1))
+
+        call_command('resolve_email_collisions', stdout=StringIO())
+
+        self.old.refresh_from_db()
+        self.assertTrue(self.old.is_active)
+        self.assertEqual(self.old.email, 'ann@example.com')
+
+    def test_resolve_without_activity_keeps_oldest(self):
+        """Test the first created user keeps the email when no user has any activity."""
+        call_command('resolve_email_collisions', stdout=StringIO())
+
+        self.recent.refresh_from_db()
+        self.assertFalse(self.recent.is_active)
+
+    def test_resolve_dry_run(self):
+        """Test a dry run changes nothing."""
+        stdout = StringIO()
+
+        call_command('resolve_email_collisions', dry_run=True, stdout=stdout)
+
+        self.recent.refresh_from_db()
+        self.assertEqual(self.recent.email, 'Ann@example.com')
+        self.assertIn(f'User {self.recent.pk} (Ann@example.com) renamed', stdout.getvalue())
+        self.assertIn('1 emails to resolve, nothing changed.', stdout.getvalue())
+
+
+class RebuildRecipeStatsCommandTests(TestCase):
+    """Test the rebuild_recipe_stats command."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='user@example.com', password='testpass123')
+        self.other_user = get_user_model().objects.create_user(email='other@example.com', password='testpass123')
+        for user in (self.user, self.other_user):
+            Recipe.objects.create(user=user, title='Soup', time_minutes=10, price='2.50')
+            Recipe.objects.create(user=user, title='Cake', time_minutes=90, price='7.50')
+
+    def test_rebuild_repairs_drift(self):
+        """Test the statistics changed behind the triggers' back are computed again."""
+        RecipeStats.objects.update(recipe_count=0, price_sum=0, price_min=None, time_0_15=5)
+        stdout = StringIO()
+
+        call_command('rebuild_recipe_stats', stdout=stdout)
+
+        stats = RecipeStats.objects.get(user=self.user)
+        self.assertEqual((stats.recipe_count, stats.price_sum, stats.price_min, stats.price_max), (2, 10, 2.5, 7.5))
+        self.assertEqual((stats.time_0_15, stats.time_60_120), (1, 1))
+        self.assertIn('rebuilt for 2 users', stdout.getvalue())
+
+    def test_rebuild_one_user(self):
+        """Test only the statistics of the given users are rebuilt."""
+        RecipeStats.objects.update(recipe_count=0)
+
+        call_command('rebuild_recipe_stats', email=['user@example.com'], stdout=StringIO())
+
+        self.assertEqual(RecipeStats.objects.get(user=self.user).recipe_count, 2)
+        self.assertEqual(RecipeStats.objects.get(user=self.other_user).recipe_count, 0)
+
+    def test_rebuild_unknown_user(self):
+        """Test the command fails for an unknown user."""
+        with self.assertRaises(CommandError):
+            call_command('rebuild_recipe_stats', email=['nobody@example.com'])
+
+
+@override_settings(TOKEN_TTL=3600, TOKEN_MAX_AGE=0)
+class CleanupTokensCommandTests(TestCase):
+    """Test the cleanup_tokens command."""
+
+    def create_token(self, email, last_used_ago):
+        """Create a token of a new user, last used the time ago."""
+        user = get_user_model().objects.create_user(email=email, password='testpass123')
+        token = Token.objects.create(user=user)
+        TokenUsage.objects.create(token=token, last_used_at=timezone.now() - last_used_ago)
+
+        return token
+
+    def test_cleanup_expired_tokens(self):
+        """Test only the expired tokens are deleted, batch by batch."""
+        expired = [self.create_token(f'old{i}@example.com', timedelta(hours=2)) for i in range(5)]
+        recent = self.create_token('recent@example.com', timedelta(minutes=5))
+        RefreshToken.objects.create(digest='a' * 64, user=recent.user, expires_at=timezone.now() - timedelta(days=1))
+        RefreshToken.objects.create(digest='b' * 64, user=recent.user, expires_at=timezone.now() + timedelta(days=1))
+        stdout = StringIO()
+
+        call_command('cleanup_tokens', batch_size=2, stdout=stdout)
+
+        self.assertEqual(list(Token.objects.all()), [recent])
+        self.assertFalse(TokenUsage.objects.filter(token__in=[token.pk for token in expired]).exists())
+        self.assertEqual(list(RefreshToken.objects.values_list('digest', flat=True)), ['b' * 64])
+        self.assertIn('5 expired tokens deleted.', stdout.getvalue())
+        self.assertIn('1 expired refresh tokens deleted.', stdout.getvalue())
+
+    @override_settings(LOGIN_THROTTLE={'ip': (10, 1), 'email': (5, 1)})
+    def test_cleanup_stale_throttle_buckets(self):
+        """Test the buckets full again since their last request are deleted."""
+        now = timezone.now()
+        ThrottleBucket.objects.create(key='ip:stale', tokens=0, allowed=False, updated_at=now - timedelta(minutes=11))
+        ThrottleBucket.objects.create(key='ip:recent', tokens=0, allowed=False, updated_at=now - timedelta(minutes=9))
+
+        call_command('cleanup_tokens', stdout=StringIO())
+
+        self.assertEqual(list(ThrottleBucket.objects.values_list('key', flat=True)), ['ip:recent'])
+
+    def test_cleanup_without_ttl(self):
+        """Test no token is deleted when the tokens don't expire."""
+        self.create_token('old@example.com', timedelta(days=400))
+
+        with self.settings(TOKEN_TTL=0):
+            call_command('cleanup_tokens', stdout=StringIO())
+
+        self.assertTrue(Token.objects.exists())
+
+
+class PruneRecipeTombstonesCommandTests(TestCase):
+    """Test the prune_recipe_tombstones command."""
+
+    @override_settings(RECIPE_TOMBSTONE_TTL=24 * 3600)
+    def test_prune_old_recipe_tombstones(self):
+        """Test the tombstones older than the TTL and those of deleted users are deleted."""
+        user = get_user_model().objects.create_user(email='user@example.com', password='testpass123')
+        now = timezone.now()
+        RecipeTombstone.objects.create(user=user, recipe_id=1, change_txid=1, deleted_at=now - timedelta(days=2))
+        RecipeTombstone.objects.create(user=user, recipe_id=2, change_txid=2, deleted_at=now - timedelta(hours=1))
+        RecipeTombstone.objects.create(user_id=user.pk + 1000, recipe_id=3, change_txid=3, deleted_at=now)
+        stdout = StringIO()
+
+        call_command('prune_recipe_tombstones', batch_size=1, stdout=stdout)
+
+        self.assertEqual(list(RecipeTombstone.objects.values_list('recipe_id', flat=True)), [2])
+        self.assertIn('2 old recipe tombstones deleted.', stdout.getvalue())
@@ -0,0 +1,101 @@
+"""
+Test the response compression and the compressed static files
+"""
+
+import gzip
+import shutil
+import tempfile
+
+import brotli
+
+from django.core.files.base import ContentFile
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from core.middleware import CompressionMiddleware
+from core.storage import CompressedManifestStaticFilesStorage
+
+CONTENT = b'{"title": "Sample recipe", "price": "5.00"}' * 100
+
+
+def get_response(request):
+    """Return an uncompressed JSON response, like a view does"""
+    response = HttpResponse(CONTENT, content_type='application/json')
+    response['ETag'] = '"abc"'
+
+    return response
+
+
+@override_settings(COMPRESSION_MIN_SIZE=1024)
+class CompressionMiddlewareTests(SimpleTestCase):
+    """Test the compression middleware"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = CompressionMiddleware(get_response)
+
+    def test_brotli_preferred(self):
+        """Test a client accepting brotli gets a brotli response with a weak ETag"""
+        response = self.middleware(self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip, deflate, br'))
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), CONTENT)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_gzip(self):
+        """Test a client accepting only gzip gets a gzip response"""
+        response = self.middleware(self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip'))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), CONTENT)
+
+    def test_no_compression_accepted(self):
+        """Test a client without Accept-Encoding gets the uncompressed response"""
+        response = self.middleware(self.factory.get('/'))
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, CONTENT)
+
+    @override_settings(COMPRESSION_MIN_SIZE=len(CONTENT) + 1)
+    def test_small_response_not_compressed(self):
+        """Test a response below the threshold is sent uncompressed"""
+        response = self.middleware(self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip, br'))
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, CONTENT)
+
+
+class CompressedStaticFilesStorageTests(SimpleTestCase):
+    """Test the static files storage"""
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location)
+        self.storage = CompressedManifestStaticFilesStorage(location=self.location, base_url='/static/')
+
+    def collect(self, **files):
+        """Save the files and post process them like collectstatic does"""
+        for name, content in files.items():
+            self.storage.save(name, ContentFile(content))
+
+        return list(self.storage.post_process({name: (self.storage, name) for name in files}))
+
+    def test_hashed_text_files_compressed(self):
+        """Test a .gz and a .br copy are written next to the hashed name of a text file"""
+        css = b'body { color: red; }' * 50
+        self.collect(**{'app.css': css})
+
+        hashed_name = self.storage.stored_name('app.css')
+        self.assertRegex(hashed_name, r'^app\.[0-9a-f]{12}\.css$')
+        with self.storage.open(f'{hashed_name}.gz') as file:
+            self.assertEqual(gzip.decompress(file.read()), css)
+        with self.storage.open(f'{hashed_name}.br') as file:
+            self.assertEqual(brotli.decompress(file.read()), css)
+
+    def test_images_not_compressed(self):
+        """Test already compressed files, like images, get no compressed copy"""
+        self.collect(**{'logo.png': b'\x89PNG' + bytes(100)})
+
+        self.assertFalse(self.storage.exists(f'{self.storage.stored_name("logo.png")}.gz'))
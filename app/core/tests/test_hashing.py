@@ -0,0 +1,79 @@
+"""
+Test the password hashing pool and the cost profile
+"""
+
+import threading
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import identify_hasher
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import hashing
+
+TOKEN_URL = reverse('user:token')
+
+
+def current_thread_name(*args):
+    """Return the name of the thread running the hash"""
+    return threading.current_thread().name
+
+
+def iterations(encoded):
+    """Return the PBKDF2 iterations of a hash"""
+    return identify_hasher(encoded).decode(encoded)['iterations']
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000, PASSWORD_HASHING_EXECUTOR='thread', PASSWORD_HASHING_WORKERS=2)
+class PasswordHashingTests(TestCase):
+    """Test the password hashing"""
+
+    def test_hashed_in_pool(self):
+        """Test the passwords are hashed and checked by the threads of the pool"""
+        with patch('core.hashing.hashers.make_password', current_thread_name):
+            self.assertTrue(hashing.make_password('testpass123').startswith('password-hashing'))
+        with patch('core.hashing.hashers.check_password', current_thread_name):
+            self.assertTrue(hashing.check_password('testpass123', 'hash').startswith('password-hashing'))
+
+    @override_settings(PASSWORD_HASHING_WORKERS=0)
+    def test_pool_disabled(self):
+        """Test the passwords are hashed on the calling thread without workers"""
+        with patch('core.hashing.hashers.make_password', current_thread_name):
+            self.assertEqual(hashing.make_password('testpass123'), threading.current_thread().name)
+
+    @override_settings(PASSWORD_HASHING_EXECUTOR='process', PASSWORD_HASHING_WORKERS=1)
+    def test_process_pool(self):
+        """Test the passwords are hashed and checked by a process pool"""
+        encoded = hashing.make_password('testpass123')
+
+        self.assertEqual(iterations(encoded), 1000)
+        self.assertTrue(hashing.check_password('testpass123', encoded))
+        self.assertFalse(hashing.check_password('wrong', encoded))
+
+    def test_create_user_uses_profile(self):
+        """Test a new user's password is hashed with the iterations of the cost profile"""
+        user = get_user_model().objects.create_user(email='test@example.com', password='testpass123')
+
+        self.assertEqual(iterations(user.password), 1000)
+        self.assertTrue(user.check_password('testpass123'))
+        self.assertFalse(user.check_password('wrong'))
+
+    def test_rehash_on_login(self):
+        """Test logging in makes the hash again when the cost profile changed, and only then"""
+        user = get_user_model().objects.create_user(email='test@example.com', password='testpass123')
+        payload = {'email': 'test@example.com', 'password': 'testpass123'}
+        client = APIClient()
+
+        with self.settings(PASSWORD_HASH_ITERATIONS=2000):
+            self.assertEqual(client.post(TOKEN_URL, {**payload, 'password': 'wrong'}).status_code, status.HTTP_400_BAD_REQUEST)
+            user.refresh_from_db()
+            self.assertEqual(iterations(user.password), 1000)  # Not with a wrong password
+
+            self.assertEqual(client.post(TOKEN_URL, payload).status_code, status.HTTP_200_OK)
+            user.refresh_from_db()
+            self.assertEqual(iterations(user.password), 2000)
+            self.assertTrue(user.check_password('testpass123'))
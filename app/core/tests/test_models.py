@@ -2,7 +2,9 @@
 Test for models
 """
 from decimal import Decimal
+from unittest.mock import patch
 
+from django.db import IntegrityError
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
@@ -38,6 +40,13 @@ class ModelTests(TestCase):
 
             self.assertEqual(user.email, expected)
 
+    def test_new_user_email_unique_in_any_case(self):
+        """Test the database refuses an email already used in another case"""
+        get_user_model().objects.create_user('test@example.com', 'test123')
+
+        with self.assertRaises(IntegrityError):
+            get_user_model().objects.create_user('TEST@example.com', 'test123')
+
     def test_new_user_without_email_raises_error(self):
         """Test creating user without email raises error"""
         with self.assertRaises(ValueError):
@@ -53,6 +62,40 @@ class ModelTests(TestCase):
         self.assertTrue(user.is_superuser)
         self.assertTrue(user.is_staff)
 
+    def test_bulk_create_users(self):
+        """Test creating users in bulk returns their tokens in order, and none for taken emails"""
+        get_user_model().objects.create_user('taken@example.com', 'test123')
+
+        pairs = get_user_model().objects.bulk_create_users([
+            {'email': 'new@EXAMPLE.com', 'password': 'test123', 'name': 'New'},
+            {'email': 'taken@example.com', 'password': 'test123'},
+            {'email': 'new@example.com', 'password': 'test123'},
+        ])
+
+        self.assertEqual([user.email for user, _ in pairs], ['new@example.com', 'taken@example.com', 'new@example.com'])
+        self.assertEqual([token is not None for _, token in pairs], [True, False, False])
+        user, token = pairs[0]
+        self.assertEqual(token.user_id, user.pk)
+        self.assertTrue(get_user_model().objects.get(email='new@example.com').check_password('test123'))
+
+    def test_bulk_create_users_missed_taken_email(self):
+        """Test a taken email the check misses is reported as taken, and the other users are created"""
+        get_user_model().objects.create_user('taken@example.com', 'test123')
+
+        # As if Python's lower() and Postgres' lower() disagreed on the email, every insert of the chunk fails
+        def untaken(self, users, indexes=None):
+            return list(range(len(users)) if indexes is None else indexes)
+
+        with patch.object(models.UserManager, '_untaken', untaken):
+            pairs = get_user_model().objects.bulk_create_users([
+                {'email': 'first@example.com', 'password': 'test123'},
+                {'email': 'TAKEN@example.com', 'password': 'test123'},
+                {'email': 'last@example.com', 'password': 'test123'},
+            ])
+
+        self.assertEqual([token is not None for _, token in pairs], [True, False, True])
+        self.assertEqual(get_user_model().objects.filter(email__in=['first@example.com', 'last@example.com']).count(), 2)
+
     def test_create_recipe(self) :
         """Test creating a new recipe is successful"""
 
@@ -70,3 +113,47 @@ class ModelTests(TestCase):
         )
 
         self.assertEqual(str(recipe), recipe.title)
+
+    def test_recipe_search_vector_maintained(self):
+        """Test the search document of a recipe is filled and updated by the database"""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'test123',
+        )
+        recipe = models.Recipe.objects.create(
+            user=user,
+            title='Lemon tart',
+            time_minutes=5,
+            price=Decimal('10.50'),
+        )
+
+        # The search document is set by a trigger, so it has to be read back from the database
+        recipes = models.Recipe.objects.filter(user=user)
+        self.assertTrue(recipes.filter(search_vector='lemon').exists())
+
+        recipe.title = 'Apple pie'
+        recipe.save()
+
+        self.assertFalse(recipes.filter(search_vector='lemon').exists())
+        self.assertTrue(recipes.filter(search_vector='apple').exists())
+
+    def test_recipe_timestamps(self):
+        """Test the recipe creation and update times are set on save"""
+        user = get_user_model().objects.create_user(
+            'test@example.com',
+            'test123',
+        )
+        recipe = models.Recipe.objects.create(
+            user=user,
+            title='Recipe title',
+            time_minutes=5,
+            price=Decimal('10.50'),
+        )
+        created_at = recipe.created_at
+        updated_at = recipe.updated_at
+
+        recipe.title = 'New title'
+        recipe.save()
+
+        self.assertEqual(recipe.created_at, created_at)
+        self.assertGreater(recipe.updated_at, updated_at)
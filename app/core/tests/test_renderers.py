@@ -0,0 +1,113 @@
+"""
+Test the API renderers and parsers
+"""
+
+import datetime
+from decimal import Decimal
+from io import BytesIO
+
+import msgpack
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.parsers import FastJSONParser, MessagePackParser
+from core.renderers import FastJSONRenderer, MessagePackRenderer
+
+ME_URL = reverse('user:me')
+
+# Data like the API returns, with the types the renderers handle in a special way
+SAMPLE_DATA = {
+    'next': None,
+    'results': [
+        {'id': 1, 'title': 'Crème brûlée', 'time_minutes': 30, 'price': '5.10', 'link': ''},
+        {'id': 2, 'title': 'Line\u2028separator', 'time_minutes': 0, 'price': '999.99', 'link': 'https://x.com/?a=1&b=2'},
+    ],
+    'errors': {0: [_('Recipe not found.')]},
+    'updated_at': datetime.datetime(2021, 6, 1, 12, 30, tzinfo=datetime.timezone.utc),
+}
+
+
+class FastJSONTests(SimpleTestCase):
+    """Test the JSON renderer and parser"""
+
+    def test_same_output_as_drf(self):
+        """Test the fast renderer renders the same bytes as DRF's JSONRenderer"""
+        self.assertEqual(FastJSONRenderer().render(SAMPLE_DATA), JSONRenderer().render(SAMPLE_DATA))
+
+    def test_indent_same_output_as_drf(self):
+        """Test an indented response is the same as DRF's"""
+        media_type = 'application/json; indent=4'
+
+        self.assertEqual(
+            FastJSONRenderer().render(SAMPLE_DATA, media_type),
+            JSONRenderer().render(SAMPLE_DATA, media_type),
+        )
+
+    def test_big_integer(self):
+        """Test an integer too big for orjson is still rendered"""
+        self.assertEqual(FastJSONRenderer().render({'count': 2 ** 70}), b'{"count":1180591620717411303424}')
+
+    def test_decimal_exact(self):
+        """Test a Decimal is rendered as a string with all its digits, not as a float"""
+        data = {'price': Decimal('0.10'), 'total': Decimal('12345678901234567890.01')}
+
+        self.assertEqual(FastJSONRenderer().render(data), b'{"price":"0.10","total":"12345678901234567890.01"}')
+
+    def test_parse(self):
+        """Test parsing a JSON body, including a number too big for orjson"""
+        body = '{"title": "Crème brûlée", "price": 5.1, "big": 1180591620717411303424}'.encode()
+
+        data = FastJSONParser().parse(BytesIO(body))
+
+        self.assertEqual(data, {'title': 'Crème brûlée', 'price': 5.1, 'big': 2 ** 70})
+
+    def test_parse_errors(self):
+        """Test invalid JSON and NaN are rejected"""
+        for body in (b'{"title": ', b'{"price": NaN}'):
+            with self.assertRaises(ParseError):
+                FastJSONParser().parse(BytesIO(body))
+
+
+class MessagePackTests(TestCase):
+    """Test the MessagePack renderer and parser"""
+
+    def test_round_trip(self):
+        """Test the rendered data is parsed back like JSON would be"""
+        data = {'price': Decimal('5.10'), 'errors': {'title': [_('This field is required.')]}}
+
+        body = MessagePackRenderer().render(data)
+
+        self.assertEqual(MessagePackParser().parse(BytesIO(body)), {
+            'price': '5.10',
+            'errors': {'title': ['This field is required.']},
+        })
+
+    def test_parse_error(self):
+        """Test an invalid MessagePack body is rejected"""
+        with self.assertRaises(ParseError):
+            MessagePackParser().parse(BytesIO(b'\xc1'))
+
+    def test_negotiated_with_accept(self):
+        """Test the API answers in MessagePack when the client asks for it, and parses MessagePack bodies"""
+        user = get_user_model().objects.create_user(email='user@example.com', password='testpass123', name='Name')
+        client = APIClient()
+        client.force_authenticate(user)
+
+        res = client.patch(
+            ME_URL,
+            msgpack.packb({'name': 'New name'}),
+            content_type='application/msgpack',
+            HTTP_ACCEPT='application/msgpack',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(res.content), {'email': 'user@example.com', 'name': 'New name'})
@@ -0,0 +1,50 @@
+"""
+Test the helpers shared by the apps
+"""
+
+from unittest.mock import Mock
+
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+
+from core.utils import now_and_on_commit
+
+
+class NowAndOnCommitTests(TestCase):
+    """Test now_and_on_commit inside a transaction"""
+
+    def test_called_now_and_at_commit(self):
+        """Test the function is called at once, and again when the transaction commits"""
+        func = Mock()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            now_and_on_commit(func)
+            self.assertEqual(func.call_count, 1)
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(func.call_count, 2)
+
+
+class NowAndOnCommitAutocommitTests(TransactionTestCase):
+    """Test now_and_on_commit outside of a transaction"""
+
+    def test_called_once_in_autocommit(self):
+        """Test the function is called only once when there is no transaction to wait for"""
+        func = Mock()
+
+        now_and_on_commit(func)
+
+        self.assertEqual(func.call_count, 1)
+
+    def test_not_called_again_after_rollback(self):
+        """Test the second call is dropped with the transaction"""
+        func = Mock()
+
+        try:
+            with transaction.atomic():
+                now_and_on_commit(func)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+
+        self.assertEqual(func.call_count, 1)
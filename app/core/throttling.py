@@ -0,0 +1,99 @@
+"""
+Token bucket throttles of the login and sign up endpoints.
+"""
+
+import hashlib
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from rest_framework.throttling import BaseThrottle
+
+from core.models import ThrottleBucket
+
+# Tokens in the bucket after the refill since its last request, at most its capacity
+REFILLED = 'LEAST(%(capacity)s, bucket.tokens + EXTRACT(EPOCH FROM clock_timestamp() - bucket.updated_at) * %(rate)s)'
+
+# Take a token from the bucket of the key, a new bucket starts full
+# clock_timestamp() and not now(), the time the transaction started, the request may run in a transaction
+# One statement, so concurrent requests of all the workers can't take the same token
+# A refused request takes nothing, a client retrying too fast can't push a bucket below empty
+# and lock out the owner of an email for longer than the refill time
+TAKE_TOKEN = f"""
+INSERT INTO {ThrottleBucket._meta.db_table} AS bucket (key, tokens, allowed, updated_at)
+VALUES (%(key)s, %(capacity)s - 1, true, clock_timestamp())
+ON CONFLICT (key) DO UPDATE SET
+    tokens = {REFILLED} - CASE WHEN {REFILLED} >= 1 THEN 1 ELSE 0 END,
+    allowed = {REFILLED} >= 1,
+    updated_at = clock_timestamp()
+RETURNING allowed, tokens
+"""
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Throttle giving each client a bucket of LOGIN_THROTTLE[scope] = (capacity, tokens refilled per minute)
+
+    A request takes a token, and is refused with a Retry-After while the bucket is empty.
+    The buckets are rows of an unlogged Postgres table, so all the workers share them.
+    DRF checks the throttles before the view runs, so a refused request never hashes a password.
+    """
+
+    scope = None
+
+    def get_key(self, request):
+        """Return the client of the request, None to not throttle it"""
+        raise NotImplementedError('.get_key() must be overridden')
+
+    def allow_request(self, request, view):
+        """Take a token from the client's bucket, return whether there was one"""
+        client = self.get_key(request)
+        if client is None:
+            return True
+
+        capacity, per_minute = settings.LOGIN_THROTTLE[self.scope]
+        self.rate = per_minute / 60
+        with connection.cursor() as cursor:
+            cursor.execute(TAKE_TOKEN, {'key': f'{self.scope}:{client}', 'capacity': capacity, 'rate': self.rate})
+            allowed, self.tokens = cursor.fetchone()
+
+        return allowed
+
+    def wait(self):
+        """Return the seconds until the bucket has a token again, sent as Retry-After"""
+        return math.ceil((1 - self.tokens) / self.rate)
+
+
+class LoginIPThrottle(TokenBucketThrottle):
+    """Throttle the login and sign up requests of an IP address"""
+
+    scope = 'ip'
+
+    def get_key(self, request):
+        # The address of the client, the X-Forwarded-For entries set by NUM_PROXIES proxies are trusted
+        return self.get_ident(request)
+
+
+class LoginEmailThrottle(TokenBucketThrottle):
+    """Throttle the login and sign up requests for an email, whatever the IP addresses they come from"""
+
+    scope = 'email'
+
+    def get_key(self, request):
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        if not isinstance(email, str) or not email:
+            return None
+
+        # Hashed so the table holds no email addresses, and the key has a fixed length
+        return hashlib.sha256(email.strip().lower().encode()).hexdigest()
+
+
+LOGIN_THROTTLE_CLASSES = [LoginIPThrottle, LoginEmailThrottle]
+
+
+def stale_buckets():
+    """Return the buckets full again since their last request, they are the same as no bucket"""
+    longest_refill = max(capacity / per_minute * 60 for capacity, per_minute in settings.LOGIN_THROTTLE.values())
+
+    return ThrottleBucket.objects.filter(updated_at__lt=timezone.now() - timedelta(seconds=longest_refill))
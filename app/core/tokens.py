@@ -0,0 +1,228 @@
+"""
+Expiry of the opaque tokens, signed access tokens and refresh tokens.
+
+An opaque token expires TOKEN_TTL seconds after its last use, and TOKEN_MAX_AGE seconds after its creation.
+
+An access token is signed with HMAC and holds the user id, so it is verified without reading the database.
+It lives ACCESS_TOKEN_TTL seconds, a client exchanges its refresh token for a new one before it expires.
+"""
+
+import hashlib
+import secrets
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from core.models import RefreshToken, Token, TokenUsage
+from core.utils import now_and_on_commit
+
+ACCESS_TOKEN_SALT = 'core.tokens.access'
+
+
+class InvalidToken(Exception):
+    """The token is malformed, badly signed, expired or revoked"""
+
+
+def token_last_used(token):
+    """Return when the opaque token was last used"""
+    # The tokens created since the last_used_at backfill have no usage until their first use
+    usage = getattr(token, 'usage', None)
+
+    return usage.last_used_at if usage is not None else token.created
+
+
+def token_expired(token, now):
+    """Return whether the opaque token has expired"""
+    if settings.TOKEN_TTL and token_last_used(token) + timedelta(seconds=settings.TOKEN_TTL) <= now:
+        return True
+
+    return bool(settings.TOKEN_MAX_AGE) and token.created + timedelta(seconds=settings.TOKEN_MAX_AGE) <= now
+
+
+def token_needs_stamp(token, now):
+    """Return whether the use of the opaque token must be recorded"""
+    # The last use is written at most once per interval, most requests don't write
+    return token_last_used(token) + timedelta(seconds=settings.TOKEN_LAST_USED_INTERVAL) <= now
+
+
+def stamp_token(token, now):
+    """Record the use of the opaque token"""
+    if not TokenUsage.objects.filter(token_id=token.pk).update(last_used_at=now):
+        # First use, ignore_conflicts because a concurrent request may insert it too
+        TokenUsage.objects.bulk_create([TokenUsage(token_id=token.pk, last_used_at=now)], ignore_conflicts=True)
+    token.usage = TokenUsage(token=token, last_used_at=now)
+
+
+def obtain_token(user):
+    """Return the opaque token of the user, a new one when the previous one has expired"""
+    now = timezone.now()
+    with transaction.atomic():
+        token, created = Token.objects.select_related('usage').get_or_create(user=user)
+        if created:
+            return token
+
+        if token_expired(token, now):
+            token.delete()
+            return Token.objects.create(user=user)
+
+        # Logging in is a use of the token
+        if token_needs_stamp(token, now):
+            stamp_token(token, now)
+
+    return token
+
+
+def expired_tokens(now):
+    """Return the opaque tokens expired at the time"""
+    expired = Q()
+    if settings.TOKEN_TTL:
+        expired |= Q(last_used__lte=now - timedelta(seconds=settings.TOKEN_TTL))
+    if settings.TOKEN_MAX_AGE:
+        expired |= Q(created__lte=now - timedelta(seconds=settings.TOKEN_MAX_AGE))
+    if not expired:
+        return Token.objects.none()
+
+    return Token.objects.alias(last_used=Coalesce('usage__last_used_at', 'created')).filter(expired)
+
+
+def expired_refresh_tokens(now):
+    """Return the refresh tokens expired at the time"""
+    return RefreshToken.objects.filter(expires_at__lte=now)
+
+
+def _cache():
+    """Return the cache backend holding the denylist"""
+    return caches[settings.AUTH_DENYLIST_CACHE_ALIAS]
+
+
+def _denied_key(jti):
+    return f'auth:denied:{jti}'
+
+
+def _revoked_key(user_id):
+    return f'auth:revoked:{user_id}'
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def _signer(key_id):
+    """Return the signer of the key id, InvalidToken for a key that was rotated out"""
+    try:
+        return signing.Signer(key=settings.ACCESS_TOKEN_KEYS[key_id], salt=ACCESS_TOKEN_SALT)
+    except KeyError:
+        raise InvalidToken(_('Unknown signing key.'))
+
+
+def issue_access_token(user):
+    """Return a new access token of the user"""
+    # The first key signs, the others still verify the tokens they signed until they expire
+    key_id = next(iter(settings.ACCESS_TOKEN_KEYS))
+    # Short claims keep the token small: user id, token id for the denylist and issue time in milliseconds
+    claims = {'u': user.pk, 'j': secrets.token_urlsafe(8), 'i': _now_ms()}
+
+    # The key id can't contain a dot, the signed value is after the first one
+    return f'{key_id}.{_signer(key_id).sign_object(claims)}'
+
+
+def verify_access_token(token):
+    """Return the claims of a valid access token, raise InvalidToken otherwise"""
+    key_id, dot, value = token.partition('.')
+    try:
+        claims = _signer(key_id).unsign_object(value)
+    except signing.BadSignature:
+        raise InvalidToken(_('Invalid signature.'))
+
+    # The lifetime is checked against the setting, shortening ACCESS_TOKEN_TTL also shortens the issued tokens
+    if claims['i'] + settings.ACCESS_TOKEN_TTL * 1000 <= _now_ms():
+        raise InvalidToken(_('Token expired.'))
+
+    # One read of the shared cache checks both ways a token is revoked
+    denylist = _cache().get_many([_denied_key(claims['j']), _revoked_key(claims['u'])])
+    if _denied_key(claims['j']) in denylist:
+        raise InvalidToken(_('Token revoked.'))
+    if claims['i'] <= denylist.get(_revoked_key(claims['u']), -1):
+        raise InvalidToken(_('Token revoked.'))
+
+    return claims
+
+
+def deny_access_token(claims):
+    """Revoke an access token until it expires"""
+    # The denylist stays compact: an entry is only kept while its token could still be used
+    remaining = claims['i'] // 1000 + settings.ACCESS_TOKEN_TTL - int(time.time())
+    if remaining > 0:
+        _cache().set(_denied_key(claims['j']), True, timeout=remaining + 1)
+
+
+def revoke_user_tokens(user_id):
+    """Revoke all the opaque, access and refresh tokens of the user issued until now"""
+    # The tables are written in the transaction of the caller, e.g. with the password change
+    RefreshToken.objects.filter(user_id=user_id).delete()
+    Token.objects.filter(user_id=user_id).delete()
+
+    # One entry for all the access tokens of the user, they were issued before it
+    # Set again at the commit, so the tokens issued until then are revoked too
+    now_and_on_commit(lambda: _revoke_access_tokens(user_id))
+
+
+def _revoke_access_tokens(user_id):
+    _cache().set(_revoked_key(user_id), _now_ms(), timeout=settings.ACCESS_TOKEN_TTL + 1)
+
+
+def _digest(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue_refresh_token(user):
+    """Return a new refresh token of the user"""
+    token = secrets.token_urlsafe(32)
+    RefreshToken.objects.create(
+        digest=_digest(token),
+        user=user,
+        expires_at=timezone.now() + timedelta(seconds=settings.REFRESH_TOKEN_TTL),
+    )
+
+    return token
+
+
+def issue_tokens(user):
+    """Return a new access token and refresh token of the user"""
+    return {
+        'access': issue_access_token(user),
+        'refresh': issue_refresh_token(user),
+        'expires_in': settings.ACCESS_TOKEN_TTL,
+    }
+
+
+def refresh_tokens(refresh):
+    """Exchange a refresh token for a new access token and refresh token, raise InvalidToken otherwise"""
+    # A refresh token is used once, a stolen copy stops working as soon as the client refreshes
+    with transaction.atomic():
+        token = (
+            RefreshToken.objects
+            .select_for_update()    # Two concurrent refreshes with the same token can't both succeed
+            .select_related('user')
+            .filter(digest=_digest(refresh))
+            .first()
+        )
+        if token is None or token.expires_at <= timezone.now() or not token.user.is_active:
+            raise InvalidToken(_('Invalid refresh token.'))
+
+        token.delete()
+
+        return issue_tokens(token.user)
+
+
+def revoke_refresh_token(refresh):
+    """Revoke a refresh token, nothing happens for an unknown one"""
+    RefreshToken.objects.filter(digest=_digest(refresh)).delete()
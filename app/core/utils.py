@@ -0,0 +1,17 @@
+"""
+Helpers shared by the apps.
+"""
+
+from django.db import transaction
+
+
+def now_and_on_commit(func):
+    """Call the function now, and once more when the current transaction commits
+
+    For the caches, which aren't transactional: until the write commits, another request still reads the
+    old rows and can cache them again, the second call drops them once the write is visible to everyone.
+    """
+    func()
+    # Outside of a transaction on_commit runs the function immediately, so only schedule it inside one
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(func)
@@ -0,0 +1,104 @@
+"""
+Per-user response cache for the recipe API.
+"""
+
+import hashlib
+import threading
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.utils import now_and_on_commit
+
+# Names of the counters, kept in the memory of each worker: counting in the cache would be one more write
+# to it on every request, and incr isn't atomic in every backend
+STATS = ('hits', 'misses', 'invalidations')
+
+_stats = dict.fromkeys(STATS, 0)
+_stats_lock = threading.Lock()  # Under ASGI the views run in a thread pool, the threads share the counters
+
+
+def _cache():
+    """Return the cache backend of the recipe API"""
+    return caches[settings.RECIPE_CACHE_ALIAS]
+
+
+def _generation_key(user_id):
+    return f'recipe:generation:{user_id}'
+
+
+def _count(name):
+    """Add one to a counter of this worker"""
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _new_generation(user_id):
+    """Start a new generation of the user's cached responses, the previous ones are never read again"""
+    # A random value instead of a counter, so an evicted generation can't start again at a value already used
+    _cache().set(_generation_key(user_id), uuid.uuid4().hex, timeout=None)
+
+
+def _generation(user_id):
+    """Return the current generation of the user's cached responses"""
+    # get_or_set uses add(), if two workers start a generation at the same time they both get the one stored first
+    return _cache().get_or_set(_generation_key(user_id), uuid.uuid4().hex, timeout=None)
+
+
+def response_key(request):
+    """Return the cache key of the response to a recipe API request"""
+    # The absolute url holds the recipe id, the pagination cursor, the page size and the filters,
+    # and the host, because the pagination links are absolute
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+
+    return f'recipe:response:{request.user.pk}:{_generation(request.user.pk)}:{url}'
+
+
+def invalidate_user_recipes(user_id):
+    """Drop the cached responses of the user, after a write to one of their recipes"""
+    # A request on another worker can cache the old recipes under the new generation until the write commits
+    now_and_on_commit(lambda: _new_generation(user_id))
+    _count('invalidations')
+
+
+def cache_stats():
+    """Return the hits, misses and invalidations counted by this worker since the last reset, with the hit rate"""
+    with _stats_lock:
+        stats = dict(_stats)
+
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+
+    return stats
+
+
+def reset_cache_stats():
+    """Set the counters of this worker back to zero"""
+    with _stats_lock:
+        _stats.update(dict.fromkeys(STATS, 0))
+
+
+def cache_recipes_response(view_func):
+    """Decorator for the GET views of the recipe API, caching their response data per user"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        key = response_key(request)
+        data = _cache().get(key)
+        if data is not None:
+            _count('hits')
+            # The data is cached before rendering, so the same entry serves every content type
+            return Response(data)
+
+        _count('misses')
+        response = view_func(request, *args, **kwargs)
+        # Errors are not cached, an invalid query string or a missing recipe is cheap to answer again
+        if response.status_code == status.HTTP_200_OK:
+            _cache().set(key, response.data, timeout=settings.RECIPE_CACHE_TIMEOUT)
+
+        return response
+
+    return wrapper
@@ -0,0 +1,54 @@
+"""
+Conditional GET (ETag / Last-Modified) for the recipe API.
+"""
+
+import hashlib
+
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
+
+from core.models import Recipe
+
+
+def user_recipes_version(user):
+    """Return the number of recipes of the user and the time of the latest change"""
+    # One aggregate query, answered from the (user, updated_at) index
+    # A create or an update moves the latest change, a delete changes the count
+    version = Recipe.objects.filter(user=user).aggregate(count=Count('id'), last_modified=Max('updated_at'))
+
+    return version['count'], version['last_modified']
+
+
+def _request_version(request):
+    """Return the recipes version of the authenticated user, computed once per request"""
+    # condition() calls both the etag and the last_modified function, only run the query for the first one
+    if not hasattr(request, '_recipes_version'):
+        request._recipes_version = user_recipes_version(request.user)
+
+    return request._recipes_version
+
+
+def recipes_etag(request, *args, **kwargs):
+    """Return the ETag of a recipe API response"""
+    count, last_modified = _request_version(request)
+    # The same version gives a different response for another url, query string or content type
+    key = '|'.join([
+        str(request.user.pk),
+        str(count),
+        last_modified.isoformat() if last_modified else '',
+        request.get_full_path(),
+        request.META.get('HTTP_ACCEPT', ''),
+    ])
+
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def recipes_last_modified(request, *args, **kwargs):
+    """Return the Last-Modified time of a recipe API response"""
+    return _request_version(request)[1]
+
+
+# Decorator for the GET views of the recipe API
+# Sets the ETag and Last-Modified headers, and answers 304 Not Modified without running the view
+# when the If-None-Match or If-Modified-Since header of the request still matches
+recipes_condition = condition(etag_func=recipes_etag, last_modified_func=recipes_last_modified)
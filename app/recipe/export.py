@@ -0,0 +1,96 @@
+"""
+Streaming export of the recipes of a user.
+"""
+
+import csv
+import json
+import tempfile
+
+from django.conf import settings
+
+from core.models import Recipe
+from recipe.serializers import RecipeDetailSerializer, RecipeRowSerializer
+
+# Every field of the recipe detail, in the same order
+EXPORT_FIELDS = RecipeDetailSerializer.Meta.fields
+
+# Content type and file extension of each export format
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+}
+
+
+class _Echo:
+    """File-like object that returns what is written instead of keeping it, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def _rows(user):
+    """Yield the user's recipes as JSON values, chunk by chunk"""
+    # iterator() reads the rows through a server-side cursor, chunk_size rows at a time,
+    # so only one chunk of recipes is in memory however many recipes the user has
+    rows = (
+        Recipe.objects
+        .filter(user=user)
+        .order_by('id')
+        .values(*EXPORT_FIELDS)
+        .iterator(chunk_size=settings.RECIPE_EXPORT_CHUNK_SIZE)
+    )
+    serializer = RecipeRowSerializer(rows, fields=EXPORT_FIELDS)
+
+    for row in rows:
+        yield serializer.to_representation(row)
+
+
+def _chunks(lines):
+    """Join the lines in chunks of RECIPE_EXPORT_CHUNK_SIZE lines"""
+    # One write to the socket, and one gzip flush, per chunk instead of per recipe
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= settings.RECIPE_EXPORT_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def ndjson_lines(user):
+    """Yield the user's recipes as newline delimited JSON, one recipe per line"""
+    # Same encoding as the JSON renderer of the API
+    for data in _rows(user):
+        yield json.dumps(data, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def csv_lines(user):
+    """Yield the user's recipes as CSV, with a header line"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for data in _rows(user):
+        yield writer.writerow([data[field] for field in EXPORT_FIELDS])
+
+
+def export_stream(user, export_format):
+    """Return the chunks of the export of the user's recipes in the format"""
+    lines = ndjson_lines(user) if export_format == 'ndjson' else csv_lines(user)
+
+    return _chunks(lines)
+
+
+def spool_export(user, export_format):
+    """Return a file holding the export of the user's recipes, read back from its start
+
+    Django 3.2's ASGI handler iterates a streaming response on the event loop, where the queries
+    of export_stream can't run. The view, which runs in a thread, writes the export to this file instead,
+    and the handler then streams the file. Only RECIPE_EXPORT_SPOOL_SIZE bytes are kept in memory,
+    a bigger export goes to a temporary file on disk.
+    """
+    file = tempfile.SpooledTemporaryFile(max_size=settings.RECIPE_EXPORT_SPOOL_SIZE, mode='w+b')
+    for chunk in export_stream(user, export_format):
+        file.write(chunk.encode())
+    file.seek(0)
+
+    return file
@@ -0,0 +1,136 @@
+"""
+Streaming import of recipes from NDJSON or CSV.
+"""
+
+import csv
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
+
+from core.models import Recipe
+from recipe.caching import invalidate_user_recipes
+from recipe.serializers import RecipeDetailSerializer
+
+
+def _error(message):
+    """Return the errors of a record that couldn't be parsed"""
+    return {api_settings.NON_FIELD_ERRORS_KEY: [message]}
+
+
+def ndjson_records(lines):
+    """Yield (line number, data, errors) for each line of an NDJSON stream"""
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue    # Blank lines, e.g. at the end of the file
+        try:
+            data = json.loads(line)
+        except ValueError as exc:
+            yield line_number, None, _error(f'Invalid JSON: {exc}')
+            continue
+
+        if isinstance(data, dict):
+            yield line_number, data, None
+        else:
+            yield line_number, None, _error('Expected a JSON object.')
+
+
+def csv_records(lines):
+    """Yield (line number, data, errors) for each row of a CSV stream with a header row"""
+    reader = csv.DictReader(lines)
+    try:
+        for row in reader:
+            # Columns beyond the header are under the None key, they are not recipe fields
+            row.pop(None, None)
+            yield reader.line_num, row, None
+    except csv.Error as exc:
+        yield reader.line_num, None, _error(f'Invalid CSV: {exc}')
+
+
+def _chunks(records, size):
+    """Yield lists of at most size records"""
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _decoded(records):
+    """Yield the records, then a record with an error instead of raising when the stream isn't valid UTF-8"""
+    line_number = 0
+    try:
+        for record in records:
+            line_number = record[0]
+            yield record
+    except UnicodeDecodeError:
+        # The rest of the stream can't be read, the records before it are still imported
+        yield line_number + 1, None, _error('The file is not valid UTF-8 from this line on.')
+
+
+def import_chunks(records, serializer, insert, chunk_size, max_errors, result=None):
+    """Validate the records with the serializer and insert the valid ones, chunk by chunk
+
+    insert is called with the (line number, validated data) pairs of the valid records of each chunk and
+    returns the number of rows it created. Return the result with the number of created rows, the number
+    of failed records and the errors of the first max_errors of them, a result passed in can hold more
+    counters of insert. Every chunk is committed on its own, an invalid record doesn't stop the import,
+    invalid UTF-8 stops it with an error at the line after the last record read.
+    """
+    if result is None:
+        result = {}
+    result.update(created=0, failed=0, errors=[])
+
+    def fail(line_number, errors):
+        result['failed'] += 1
+        # The count of failures is exact, but only the first errors are kept so a bad file can't fill the memory
+        if len(result['errors']) < max_errors:
+            result['errors'].append({'line': line_number, 'errors': errors})
+
+    # Only one chunk of records is in memory at a time, whatever the size of the stream
+    for chunk in _chunks(_decoded(records), chunk_size):
+        valid = []
+        for line_number, data, errors in chunk:
+            if errors:
+                fail(line_number, errors)
+                continue
+            try:
+                # One serializer validates every record, like the ListSerializer of a batch does with its child
+                valid.append((line_number, serializer.run_validation(data)))
+            except ValidationError as exc:
+                fail(line_number, exc.detail)
+
+        if valid:
+            result['created'] += insert(valid)
+
+    return result
+
+
+def import_recipes(user, records):
+    """Validate the records and create the valid ones as recipes of the user, chunk by chunk
+
+    Return the number of created recipes, the number of failed records and the errors of the first
+    RECIPE_IMPORT_MAX_ERRORS failed records, see import_chunks.
+    """
+    created = 0
+
+    def insert(valid):
+        nonlocal created
+        # One INSERT per chunk, bulk_create sets created_at and updated_at and the triggers fill the rest
+        recipes = Recipe.objects.bulk_create([Recipe(user=user, **validated_data) for _, validated_data in valid])
+        created += len(recipes)
+        return len(recipes)
+
+    try:
+        return import_chunks(
+            records, RecipeDetailSerializer(), insert, settings.RECIPE_IMPORT_CHUNK_SIZE, settings.RECIPE_IMPORT_MAX_ERRORS,
+        )
+    finally:
+        # bulk_create doesn't send the post_save signal
+        # Also when an insert failed, the chunks before are already imported
+        if created:
+            invalidate_user_recipes(user.pk)
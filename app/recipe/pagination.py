@@ -0,0 +1,123 @@
+"""
+Pagination for the recipe API.
+"""
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+# CursorPagination is keyset pagination: the next page is fetched with WHERE id < <last id seen>
+# instead of OFFSET, so a deep page costs the same as the first one
+# The cursor in the next/previous links is base64 encoded, so clients treat it as an opaque value
+class RecipeCursorPagination(CursorPagination):
+    """Keyset pagination for recipes, newest first"""
+
+    ordering = '-id'    # Same ordering as RecipeViewSet.get_queryset, the id is unique so no offset is needed
+    page_size = settings.RECIPE_PAGE_SIZE
+    page_size_query_param = 'page_size'     # Allow the client to choose the page size with ?page_size=
+    max_page_size = settings.RECIPE_MAX_PAGE_SIZE   # Hard cap on the page size a client can ask for
+
+    def get_ordering(self, request, queryset, view):
+        """Order search results by rank, best match first"""
+        # RecipeViewSet annotates the rank only when the list is searched with ?q=
+        if 'rank' in queryset.query.annotations:
+            # The id breaks the ties between recipes with the same rank, the cursor holds both
+            return ('-rank', '-id')
+
+        return super().get_ordering(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Paginate the queryset, with the position of the cursor on every field of the ordering"""
+        self.ordering = self.get_ordering(request, queryset, view)
+        if len(self.ordering) == 1:
+            return super().paginate_queryset(queryset, request, view)
+
+        # DRF filters on the first field of the ordering only, and skips the rows with the same rank with an OFFSET,
+        # which costs as many rows as the page is deep. The (rank, id) position of a row is unique,
+        # the next page is found with WHERE (rank, id) < (<rank>, <id>) and never an offset
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        current_position = self.cursor.position if self.cursor is not None else None
+
+        # A reversed cursor reads the previous page backwards from its position
+        ordering = [_reverse(field) for field in self.ordering] if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if current_position is not None:
+            queryset = queryset.filter(self._after(queryset, current_position, reverse))
+
+        # One more row tells whether there is a page after this one
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = (
+            self._get_position_from_instance(results[-1], self.ordering) if len(results) > len(self.page) else None
+        )
+
+        if reverse:
+            # The rows were read backwards from the position, they are returned in the order of the list
+            self.page.reverse()
+            self.has_next, self.next_position = current_position is not None, current_position
+            self.has_previous, self.previous_position = following_position is not None, following_position
+        else:
+            self.has_next, self.next_position = following_position is not None, following_position
+            self.has_previous, self.previous_position = current_position is not None, current_position
+        self.display_page_controls = self.has_previous or self.has_next
+
+        return self.page
+
+    def _get_position_from_instance(self, instance, ordering):
+        """Return the position of a row, the values of all the fields of the ordering"""
+        if len(ordering) == 1:
+            return super()._get_position_from_instance(instance, ordering)
+
+        # str() of a float is its exact value, the position of the last row of a page is found again exactly
+        return ','.join(str(instance[field.lstrip('-')]) for field in ordering)
+
+    def _after(self, queryset, position, reverse):
+        """Return the condition of the rows after the position, before it when the cursor is reversed"""
+        fields = [field.lstrip('-') for field in self.ordering]
+        try:
+            values = [
+                _output_field(queryset, field).to_python(value) for field, value in zip(fields, position.split(','))
+            ]
+        except (ValidationError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if len(values) != len(fields):
+            raise NotFound(self.invalid_cursor_message)
+
+        # (a, b) < (x, y) as a row comparison, spelled out: a < x OR (a = x AND b < y)
+        condition = Q()
+        for index, field in enumerate(fields):
+            lookup = 'lt' if self.ordering[index].startswith('-') != reverse else 'gt'
+            equal = {fields[before]: values[before] for before in range(index)}
+            condition |= Q(**equal, **{f'{field}__{lookup}': values[index]})
+
+        return condition
+
+    def get_schema_operation_parameters(self, view):
+        """Describe the cursor as the opaque string it is"""
+        parameters = super().get_schema_operation_parameters(view)
+        # DRF documents the cursor as an integer, but it is a base64 encoded string
+        parameters[0]['schema'] = {'type': 'string'}
+
+        return parameters
+
+
+def _reverse(field):
+    """Return the field of an ordering in the other direction"""
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+def _output_field(queryset, name):
+    """Return the model field or the annotation output field of a name of the queryset"""
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+
+    return queryset.model._meta.get_field(name)
@@ -2,9 +2,85 @@
 Serializers for recipe API.
 """
 
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 
 from core.models import Recipe
+from recipe import sync
+
+
+# A ListSerializer is what DRF uses for many=True, this one writes the whole batch with one query
+class RecipeListSerializer(serializers.ListSerializer):
+    """Serializer for a batch of recipes"""
+
+    def to_internal_value(self, data):
+        """Validate every recipe of the batch, and check the recipes to update exist"""
+        # Check the size before validating the items, so a huge batch is rejected without doing the work
+        if isinstance(data, list) and len(data) > settings.RECIPE_BULK_MAX_ITEMS:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [f'Ensure this batch has no more than {settings.RECIPE_BULK_MAX_ITEMS} recipes.'],
+            }, code='max_length')
+
+        # Validates each item with the child serializer, the errors are a list with one entry per item
+        validated_data = super().to_internal_value(data)
+
+        if self.instance is not None:
+            self._recipes = self._find_recipes(validated_data)
+
+        return validated_data
+
+    def _find_recipes(self, validated_data):
+        """Return the recipes to update by id, with an error for each item that isn't one of them"""
+        ids = [item.get('id') for item in validated_data]
+        # The instance is the queryset of the authenticated user's recipes, so other users' recipes are not found
+        recipes = {recipe.id: recipe for recipe in self.instance.filter(id__in=ids)}
+
+        errors = []
+        seen = set()
+        for recipe_id in ids:
+            if recipe_id is None:
+                errors.append({'id': [_('This field is required.')]})
+            elif recipe_id not in recipes:
+                errors.append({'id': [_('Recipe not found.')]})
+            elif recipe_id in seen:
+                errors.append({'id': [_('Duplicate recipe in the batch.')]})
+            else:
+                errors.append({})
+            seen.add(recipe_id)
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return recipes
+
+    def create(self, validated_data):
+        """Create all the recipes with one INSERT"""
+        recipes = [Recipe(**item) for item in validated_data]
+
+        # On Postgres bulk_create sets the ids of the new recipes
+        return Recipe.objects.bulk_create(recipes)
+
+    def update(self, instance, validated_data):
+        """Update all the recipes with one UPDATE of the changed fields"""
+        # bulk_update doesn't set the auto_now field like save() does, so set it here
+        now = timezone.now()
+        recipes = []
+        fields = {'updated_at'}
+        for item in validated_data:
+            recipe = self._recipes[item.pop('id')]
+            for attr, value in item.items():
+                setattr(recipe, attr, value)
+            recipe.updated_at = now
+            fields.update(item)
+            recipes.append(recipe)
+
+        Recipe.objects.bulk_update(recipes, sorted(fields))
+
+        return recipes
 
 
 # Using the ModelSerializer because we will be working with model objects Recipe
@@ -21,6 +97,41 @@ class RecipeSerializer(serializers.ModelSerializer):
             'link'
         ]
         read_only_fields = ['id']   # The id is automatically assigned by Django, so we don't want to allow the user to change it
+        list_serializer_class = RecipeListSerializer    # Used instead of the default ListSerializer when many=True
+
+
+# Plain class instead of a Serializer, the recipe list can return hundreds of recipes per page
+# and a ModelSerializer builds a model instance and calls every field's to_representation for each of them
+class RecipeRowSerializer:
+    """Read-only serializer for recipe rows from .values(), with the same output as RecipeSerializer"""
+
+    fields = RecipeSerializer.Meta.fields
+
+    def __init__(self, rows, fields=None):
+        self.rows = rows
+        if fields is not None:
+            self.fields = fields    # Only these keys of the rows are returned
+
+    @staticmethod
+    def _price(value):
+        """Return the price the same way the DecimalField of RecipeSerializer does"""
+        if not api_settings.COERCE_DECIMAL_TO_STRING:
+            return value
+        # The column is numeric(5, 2), Postgres always returns 2 decimal places so no quantize is needed
+        return '{:f}'.format(value)
+
+    def to_representation(self, row):
+        """Return the JSON value of one row, the keys in the order of RecipeSerializer"""
+        data = {field: row[field] for field in self.fields}
+        if 'price' in data:
+            data['price'] = self._price(data['price'])
+
+        return data
+
+    @property
+    def data(self):
+        """Return the JSON value of every row"""
+        return [self.to_representation(row) for row in self.rows]
 
 
 # RecipeDetailSerializer inherits from RecipeSerializer because this is an extension of the RecipeSerializer
@@ -30,3 +141,192 @@ class RecipeDetailSerializer(RecipeSerializer):
 
     class Meta(RecipeSerializer.Meta):
         fields = RecipeSerializer.Meta.fields + ['description']
+
+
+# In a batch update the id says which recipe each item updates, so it is a writable field here
+class RecipeBulkUpdateSerializer(RecipeDetailSerializer):
+    """Serializer for a recipe in a batch update"""
+
+    id = serializers.IntegerField()
+
+
+class RecipeBulkDeleteSerializer(serializers.Serializer):
+    """Serializer for the ids of a batch delete"""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        min_length=1,
+        max_length=settings.RECIPE_BULK_MAX_ITEMS,
+    )
+
+
+# Plain Serializer instead of a ModelSerializer, it's only used to validate the query parameters
+class RecipeFilterSerializer(serializers.Serializer):
+    """Serializer for the search and filter query parameters of the recipe list"""
+
+    q = serializers.CharField(
+        required=False,
+        allow_blank=True,
+        help_text='Full-text search in the title and description, best matches first',
+    )
+    # Same limits as the model fields, so a value that can't be stored can't be filtered on either
+    price_min = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0, required=False)
+    price_max = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0, required=False)
+    time_minutes_min = serializers.IntegerField(min_value=0, required=False)
+    time_minutes_max = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, attrs):
+        """Check the minimum of a range is not above its maximum"""
+        for field in ('price', 'time_minutes'):
+            low = attrs.get(f'{field}_min')
+            high = attrs.get(f'{field}_max')
+            if low is not None and high is not None and low > high:
+                raise serializers.ValidationError({f'{field}_min': f'Must be lower than or equal to {field}_max.'})
+
+        return attrs
+
+
+# The parameter is a comma separated string, like ?fields=id,title
+class RecipeFieldsQuerySerializer(serializers.Serializer):
+    """Serializer for the sparse fieldset query parameter of the recipe list"""
+
+    allowed_fields = RecipeSerializer.Meta.fields
+
+    fields = serializers.CharField(
+        required=False,
+        help_text=f'Comma separated fields to return, any of {", ".join(RecipeSerializer.Meta.fields)}',
+    )
+
+    def validate_fields(self, value):
+        """Return the list of requested fields, in the order of the serializer"""
+        # A trailing comma, as in ?fields=title, leaves an empty entry, which isn't a field name
+        requested = {field.strip() for field in value.split(',')} - {''}
+        if not requested:
+            raise serializers.ValidationError(_('Choose at least one field.'))
+        unknown = requested - set(self.allowed_fields)
+        if unknown:
+            raise serializers.ValidationError(
+                _('Unknown fields: {unknown}. Choose from {allowed}.').format(
+                    unknown=', '.join(sorted(unknown)),
+                    allowed=', '.join(self.allowed_fields),
+                )
+            )
+
+        return [field for field in self.allowed_fields if field in requested]
+
+
+class RecipeDetailFieldsQuerySerializer(RecipeFieldsQuerySerializer):
+    """Serializer for the sparse fieldset query parameter of the recipe detail"""
+
+    allowed_fields = RecipeDetailSerializer.Meta.fields
+
+    fields = serializers.CharField(
+        required=False,
+        help_text=f'Comma separated fields to return, any of {", ".join(RecipeDetailSerializer.Meta.fields)}',
+    )
+
+
+class RecipeAutocompleteQuerySerializer(serializers.Serializer):
+    """Serializer for the query parameters of the title autocomplete"""
+
+    # At least 2 characters, a single character matches too many titles to be useful
+    q = serializers.CharField(min_length=2, max_length=255)
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.RECIPE_AUTOCOMPLETE_LIMIT,
+        default=settings.RECIPE_AUTOCOMPLETE_LIMIT,
+    )
+
+
+class RecipeAutocompleteSerializer(serializers.Serializer):
+    """Serializer for a title autocomplete suggestion"""
+
+    id = serializers.IntegerField(read_only=True)
+    title = serializers.CharField(read_only=True)
+
+
+class RecipeSyncQuerySerializer(serializers.Serializer):
+    """Serializer for the query parameters of the recipe sync"""
+
+    cursor = serializers.CharField(
+        required=False,
+        help_text='Cursor returned by the previous sync, leave out for the first sync',
+    )
+
+    def validate_cursor(self, value):
+        """Return the transaction id of the cursor"""
+        try:
+            return sync.decode_cursor(value)
+        except signing.SignatureExpired:
+            # The tombstones of the deletions since the cursor may be gone
+            raise serializers.ValidationError(_('Expired cursor, sync again without a cursor.'))
+        except signing.BadSignature:
+            raise serializers.ValidationError(_('Invalid cursor.'))
+
+
+class RecipeSyncSerializer(serializers.Serializer):
+    """Serializer for the recipes changed since the last sync"""
+
+    changed = RecipeDetailSerializer(many=True, help_text='Recipes created or updated since the cursor')
+    deleted = serializers.ListField(child=serializers.IntegerField(), help_text='Ids of the recipes deleted since the cursor')
+    cursor = serializers.CharField(help_text='Cursor to send with the next sync')
+    has_more = serializers.BooleanField(help_text='More changes follow, sync again with the cursor right away')
+
+
+class RecipeExportQuerySerializer(serializers.Serializer):
+    """Serializer for the query parameters of the recipe export"""
+
+    # Not named format, DRF reads ?format= to choose the renderer
+    file_format = serializers.ChoiceField(
+        choices=['ndjson', 'csv'],
+        default='ndjson',
+        help_text='ndjson: one JSON recipe per line, csv: one recipe per row after a header row',
+    )
+
+
+class RecipeImportQuerySerializer(RecipeExportQuerySerializer):
+    """Serializer for the query parameters of the recipe import, the file formats are the same as the export"""
+
+
+class RecipeImportErrorSerializer(serializers.Serializer):
+    """Serializer for the errors of a record that wasn't imported"""
+
+    line = serializers.IntegerField(help_text='Line of the record in the file')
+    errors = serializers.DictField(help_text='Errors of the record, by field')
+
+
+class RecipeImportResultSerializer(serializers.Serializer):
+    """Serializer for the result of a recipe import"""
+
+    created = serializers.IntegerField(help_text='Number of recipes created')
+    failed = serializers.IntegerField(help_text='Number of records with errors, they were not imported')
+    errors = RecipeImportErrorSerializer(many=True, help_text='Errors of the first failed records')
+
+
+class RecipeStatsBucketSerializer(serializers.Serializer):
+    """Serializer for a bucket of the preparation time histogram"""
+
+    min = serializers.IntegerField(allow_null=True, help_text='Lowest time_minutes of the bucket, null for no limit')
+    max = serializers.IntegerField(allow_null=True, help_text='Highest time_minutes of the bucket, excluded, null for no limit')
+    count = serializers.IntegerField(help_text='Number of recipes in the bucket')
+
+
+class RecipeCacheStatsSerializer(serializers.Serializer):
+    """Serializer for the counters of the recipe response cache of a worker"""
+
+    worker = serializers.IntegerField(help_text='Process id of the worker that answered, each worker counts its own requests')
+    hits = serializers.IntegerField()
+    misses = serializers.IntegerField()
+    invalidations = serializers.IntegerField()
+    hit_rate = serializers.FloatField(help_text='Share of the lookups answered from the cache, 0 without lookups')
+
+
+class RecipeStatsSerializer(serializers.Serializer):
+    """Serializer for the statistics of the recipes of a user"""
+
+    recipe_count = serializers.IntegerField()
+    # null without recipes
+    price_avg = serializers.DecimalField(max_digits=5, decimal_places=2, allow_null=True)
+    price_min = serializers.DecimalField(max_digits=5, decimal_places=2, allow_null=True)
+    price_max = serializers.DecimalField(max_digits=5, decimal_places=2, allow_null=True)
+    time_histogram = RecipeStatsBucketSerializer(many=True)
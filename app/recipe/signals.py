@@ -0,0 +1,17 @@
+"""
+Signal receivers of the recipe app.
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Recipe
+from recipe.caching import invalidate_user_recipes
+
+
+# bulk_create and bulk_update don't send these signals, the batch views invalidate the cache themselves
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipes_cache(sender, instance, **kwargs):
+    """Drop the cached recipe responses of the owner of a saved or deleted recipe"""
+    invalidate_user_recipes(instance.user_id)
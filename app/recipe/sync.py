@@ -0,0 +1,122 @@
+"""
+Change tracking for the recipe sync API.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db import connection
+from django.db.models import Exists, OuterRef, Q
+
+from core.models import Recipe, RecipeTombstone
+
+CURSOR_SALT = 'recipe.sync'
+
+# The changes are read in the order of their position (change_txid, recipe id), after the position of the cursor
+# A transaction still running when a cursor was issued can commit later with a txid before its position,
+# the cursor keeps the ids of these pending transactions and their changes are read whatever their position
+# The pages of a first sync keep its first snapshot, the recipes deleted before it were never sent to the client
+CHANGED = f"""
+SELECT change_txid, id, false AS deleted FROM {Recipe._meta.db_table}
+WHERE user_id = %(user_id)s
+    AND ((change_txid, id) > (%(txid)s, %(id)s) OR change_txid = ANY(%(pending)s::bigint[]))
+ORDER BY change_txid, id
+LIMIT %(limit)s + 1
+"""
+
+DELETED = f"""
+SELECT change_txid, recipe_id, true FROM {RecipeTombstone._meta.db_table}
+WHERE %(deletions)s AND user_id = %(user_id)s
+    AND ((change_txid, recipe_id) > (%(txid)s, %(id)s) OR change_txid = ANY(%(pending)s::bigint[]))
+    AND (%(first)s::txid_snapshot IS NULL OR NOT txid_visible_in_snapshot(change_txid, %(first)s::txid_snapshot))
+ORDER BY change_txid, recipe_id
+LIMIT %(limit)s + 1
+"""
+
+# One statement, so the snapshot and the changes are read from the same snapshot
+# Both sub-selects are answered from the (user, change_txid) indexes, an idle client costs this single query
+# Every transaction before the snapshot's xmax has committed, except the ones of its xip list, still running
+CHANGES_SQL = f"""
+WITH changes AS (({CHANGED}) UNION ALL ({DELETED}))
+SELECT
+    txid_current_snapshot()::text,
+    txid_snapshot_xmax(txid_current_snapshot()),
+    ARRAY(SELECT txid_snapshot_xip(txid_current_snapshot())),
+    ARRAY(SELECT ARRAY[change_txid, id, deleted::int] FROM changes ORDER BY change_txid, id LIMIT %(limit)s + 1)
+"""
+
+
+def encode_cursor(position):
+    """Return the opaque cursor the client sends back on its next sync"""
+    # Signed, so a client can only send back a cursor the server issued
+    # signing.dumps also holds the time it was issued, old cursors are refused, their tombstones may be gone
+    return signing.dumps(position, salt=CURSOR_SALT)
+
+
+def decode_cursor(cursor):
+    """Return the (txid, recipe id, pending txids, first sync snapshot) position of a cursor
+
+    Raises signing.SignatureExpired for a cursor older than RECIPE_SYNC_CURSOR_MAX_AGE,
+    and signing.BadSignature for a cursor the server didn't issue.
+    """
+    position = signing.loads(cursor, salt=CURSOR_SALT, max_age=settings.RECIPE_SYNC_CURSOR_MAX_AGE)
+    if isinstance(position, int):
+        # Cursor of the previous format, the changes from this transaction id on
+        return position, 0, [], None
+    if len(position) == 3:
+        # Cursor issued before the pages of a first sync kept their snapshot
+        return (*position, None)
+
+    return tuple(position)
+
+
+def changes_since(user, position=None):
+    """Return the ids of the user's recipes changed and deleted after the position, the next position and has_more
+
+    At most RECIPE_SYNC_PAGE_SIZE changes are returned, has_more tells there are more after the next position.
+    Without a position every recipe of the user is returned and no deletions, and the next pages of this
+    first sync only return the deletions after it. A change can be returned twice, but never missed.
+    """
+    txid, recipe_id, pending, first = position or (0, 0, [], None)
+    limit = settings.RECIPE_SYNC_PAGE_SIZE
+    params = {
+        'user_id': user.pk,
+        'txid': txid,
+        'id': recipe_id,
+        'pending': pending,
+        'limit': limit,
+        'deletions': position is not None,  # The first sync returns the recipes and no deletions
+        'first': first,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(CHANGES_SQL, params)
+        snapshot, xmax, running, changes = cursor.fetchone()
+
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    if has_more:
+        # The next page starts right after the last change returned, even before the previous position
+        # when changes of pending transactions filled the page
+        txid, recipe_id = changes[-1][:2]
+        # The pages after the first one of a first sync skip the deletions its snapshot already saw
+        first = snapshot if position is None else first
+        # Only the running transactions before the position can be missed, the later ones are after it anyway
+        next_position = (txid, recipe_id, [pending_txid for pending_txid in running if pending_txid <= txid], first)
+    else:
+        # Every change the snapshot sees was read, including the tombstones a first sync skips:
+        # the next sync starts after the snapshot, with the transactions it didn't see yet
+        next_position = (xmax, 0, running, None)
+    changed_ids = [change_id for _, change_id, deleted in changes if not deleted]
+    deleted_ids = [change_id for _, change_id, deleted in changes if deleted]
+
+    return changed_ids, deleted_ids, next_position, has_more
+
+
+def stale_tombstones(now):
+    """Return the tombstones no cursor can still need: older than RECIPE_TOMBSTONE_TTL, or of a deleted user"""
+    return RecipeTombstone.objects.filter(
+        Q(deleted_at__lt=now - timedelta(seconds=settings.RECIPE_TOMBSTONE_TTL))
+        | ~Exists(get_user_model().objects.filter(pk=OuterRef('user_id')))
+    )
@@ -0,0 +1,152 @@
+"""
+Tests for the recipe export API
+"""
+
+import csv
+import gzip
+import io
+import json
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import tokens
+from recipe.serializers import RecipeDetailSerializer
+from recipe.tests.test_recipe_api import create_recipe, create_user
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+class PublicRecipeExportAPITest(TestCase):
+    """Test unauthenticated recipe export requests"""
+
+    def test_auth_required(self):
+        """Test auth is required to export recipes"""
+        res = APIClient().get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateRecipeExportAPITest(TestCase):
+    """Test the recipe export of an authenticated user"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='testpass123')
+
+        self.client.force_authenticate(self.user)
+
+    def test_export_ndjson(self):
+        """Test the export streams one JSON recipe per line, oldest first, like the recipe detail"""
+        r1 = create_recipe(user=self.user, title='Crème brûlée')
+        r2 = create_recipe(user=self.user, price=Decimal('10'), description='Line 1\nLine 2')
+        other_user = create_user(email='other_user@example.com', password='testpass123')
+        create_recipe(user=other_user)
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        self.assertIn('recipes.ndjson', res['Content-Disposition'])
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], RecipeDetailSerializer([r1, r2], many=True).data)
+
+    def test_export_csv(self):
+        """Test the export streams a CSV file with a header row"""
+        recipe = create_recipe(user=self.user, title='Tarte, "Tatin"', description='Line 1\nLine 2')
+
+        res = self.client.get(EXPORT_URL, {'file_format': 'csv'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(io.StringIO(b''.join(res.streaming_content).decode())))
+        self.assertEqual(rows, [{
+            field: str(value) for field, value in RecipeDetailSerializer(recipe).data.items()
+        }])
+
+    @override_settings(RECIPE_EXPORT_CHUNK_SIZE=2)
+    def test_export_streamed_in_chunks(self):
+        """Test the recipes are sent in chunks of RECIPE_EXPORT_CHUNK_SIZE recipes"""
+        for _ in range(5):
+            create_recipe(user=self.user)
+
+        res = self.client.get(EXPORT_URL)
+        chunks = list(res.streaming_content)
+
+        self.assertEqual([chunk.count(b'\n') for chunk in chunks], [2, 2, 1])
+
+    def test_export_gzip(self):
+        """Test the stream is compressed when the client accepts gzip"""
+        create_recipe(user=self.user)
+
+        res = self.client.get(EXPORT_URL, HTTP_ACCEPT_ENCODING='gzip')
+        res_plain = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(res.streaming_content)), b''.join(res_plain.streaming_content))
+
+    def test_export_invalid_format_error(self):
+        """Test an unknown export format is rejected"""
+        res = self.client.get(EXPORT_URL, {'file_format': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+def asgi_get(path, headers):
+    """Send a GET request through Django's ASGI handler, return the status, headers and body"""
+    scope = {
+        'type': 'http',
+        'method': 'GET',
+        'path': path,
+        'query_string': b'',
+        'headers': [(name.encode(), value.encode()) for name, value in headers.items()],
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    # Like the test client, keep the connection of the test transaction open across the request signals
+    request_started.disconnect(close_old_connections)
+    request_finished.disconnect(close_old_connections)
+    try:
+        async_to_sync(ASGIHandler())(scope, receive, send)
+    finally:
+        request_started.connect(close_old_connections)
+        request_finished.connect(close_old_connections)
+
+    start = messages[0]
+    body = b''.join(message.get('body', b'') for message in messages[1:])
+
+    return start['status'], dict((name.decode(), value.decode()) for name, value in start['headers']), body
+
+
+@override_settings(ASGI_MODE=True, RECIPE_EXPORT_CHUNK_SIZE=2)
+class ASGIRecipeExportAPITest(TestCase):
+    """Test the recipe export served by the ASGI handler"""
+
+    def test_export_asgi(self):
+        """Test the export is read from the database before the ASGI handler iterates it on the event loop"""
+        user = create_user(email='user@example.com', password='testpass123')
+        recipes = [create_recipe(user=user, title=f'Recipe {i}') for i in range(5)]
+        token = tokens.obtain_token(user)
+
+        status_code, headers, body = asgi_get(EXPORT_URL, {'host': 'testserver', 'authorization': f'Token {token.key}'})
+
+        self.assertEqual(status_code, status.HTTP_200_OK)
+        self.assertEqual(headers['Content-Type'], 'application/x-ndjson')
+        self.assertIn('recipes.ndjson', headers['Content-Disposition'])
+        lines = body.decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], RecipeDetailSerializer(recipes, many=True).data)
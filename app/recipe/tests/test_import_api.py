@@ -0,0 +1,104 @@
+"""
+Tests for the recipe import API
+"""
+
+import json
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from recipe.tests.test_recipe_api import create_user
+
+IMPORT_URL = reverse('recipe:recipe-import')
+
+
+def ndjson(*records):
+    """Return the records as an NDJSON body"""
+    return ''.join(json.dumps(record) + '\n' for record in records).encode()
+
+
+class PublicRecipeImportAPITest(TestCase):
+    """Test unauthenticated recipe import requests"""
+
+    def test_auth_required(self):
+        """Test auth is required to import recipes"""
+        res = APIClient().post(IMPORT_URL, ndjson({'title': 'Soup'}), content_type='application/x-ndjson')
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateRecipeImportAPITest(TestCase):
+    """Test the recipe import of an authenticated user"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='testpass123')
+
+        self.client.force_authenticate(self.user)
+
+    def test_import_ndjson(self):
+        """Test importing recipes from NDJSON, the invalid lines are reported and skipped"""
+        body = ndjson(
+            {'title': 'Soup', 'time_minutes': 10, 'price': '2.50', 'description': 'Hot'},
+            {'title': 'Cake', 'time_minutes': 'ten', 'price': '4.00'},
+        ) + b'\n{not json}\n' + ndjson(
+            ['Not', 'an', 'object'],
+            {'title': 'Salad', 'time_minutes': 5, 'price': '3.00', 'user': 999},
+        )
+
+        res = self.client.post(IMPORT_URL, body, content_type='application/x-ndjson')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['created'], 2)
+        self.assertEqual(res.data['failed'], 3)
+        # Line 3 is blank, line numbers count every line of the file
+        self.assertEqual([error['line'] for error in res.data['errors']], [2, 4, 5])
+        self.assertIn('time_minutes', res.data['errors'][0]['errors'])
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual([recipe.title for recipe in recipes], ['Soup', 'Salad'])
+        self.assertEqual(recipes[0].description, 'Hot')
+
+    def test_import_csv(self):
+        """Test importing recipes from CSV with a header row and a byte order mark"""
+        body = (
+            '﻿title,time_minutes,price,link,description\r\n'
+            'Crème brûlée,30,6.50,,"Line 1\nLine 2"\r\n'
+            'Tarte,abc,3.00,,\r\n'
+        ).encode()
+
+        res = self.client.post(f'{IMPORT_URL}?file_format=csv', body, content_type='text/csv')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['created'], 1)
+        self.assertEqual(res.data['errors'][0]['line'], 4)
+        recipe = Recipe.objects.get(user=self.user)
+        self.assertEqual(recipe.title, 'Crème brûlée')
+        self.assertEqual(recipe.description, 'Line 1\nLine 2')
+
+    @override_settings(RECIPE_IMPORT_CHUNK_SIZE=2, RECIPE_IMPORT_MAX_ERRORS=1)
+    def test_import_in_chunks(self):
+        """Test the records are inserted with one INSERT per chunk, and only the first errors are kept"""
+        body = ndjson(*[{'title': f'Recipe {i}', 'time_minutes': 1, 'price': '1.00'} for i in range(5)], {}, {})
+
+        res = self.client.post(IMPORT_URL, body, content_type='application/x-ndjson')
+
+        self.assertEqual(res.data['created'], 5)
+        self.assertEqual(res.data['failed'], 2)
+        self.assertEqual(len(res.data['errors']), 1)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 5)
+
+    def test_import_invalid_utf8_error(self):
+        """Test a body that isn't UTF-8 is reported at its line, after the records before it are imported"""
+        body = ndjson({'title': 'Recipe', 'time_minutes': 1, 'price': '1.00'}) + b'{"title": "\xff"}\n'
+
+        res = self.client.post(IMPORT_URL, body, content_type='application/x-ndjson')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['created'], 1)
+        self.assertEqual(res.data['failed'], 1)
+        self.assertEqual(res.data['errors'][0]['line'], 2)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 1)
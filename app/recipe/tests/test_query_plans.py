@@ -0,0 +1,161 @@
+"""
+Query plan regression tests for the recipe API
+"""
+
+import random
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.models import Recipe
+from recipe.views import RecipeAutocompleteView, RecipeViewSet
+
+# The cursor pagination fetches one extra row to know if there is a next page
+PAGE_QUERY_SIZE = settings.RECIPE_PAGE_SIZE + 1
+
+# Plan nodes that mean Postgres had to read the whole table or sort the rows itself instead of using an index
+FORBIDDEN_NODES = {'Seq Scan', 'Sort', 'Incremental Sort'}
+
+# The composite (user, -id) index from core.models.Recipe.Meta
+USER_ID_INDEX = 'core_recipe_user_id_desc_idx'
+
+# One power user with many recipes among many users with a few recipes each, like in production
+SEED_POWER_USER_RECIPES = 100
+SEED_USERS = 2000
+SEED_RECIPES_PER_USER = 10
+
+
+def plan_nodes(plan):
+    """Return the nodes of an EXPLAIN (FORMAT JSON) plan, walking all the child plans"""
+    nodes = [plan]
+    for child in plan.get('Plans', []):
+        nodes.extend(plan_nodes(child))
+
+    return nodes
+
+
+def explain(queryset):
+    """Run EXPLAIN on the queryset and return the list of plan nodes"""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        # psycopg2 already decodes the JSON output, the plan is the first item of the list
+        plan = cursor.fetchone()[0][0]['Plan']
+
+    return plan_nodes(plan)
+
+
+def viewset_queryset(user, action, **params):
+    """Return the queryset that RecipeViewSet builds for the user, the action and the query parameters"""
+    # Build the viewset the same way the router does, but without running the request
+    request = Request(APIRequestFactory().get('/', params))
+    request.user = user
+    view = RecipeViewSet(request=request, action=action, format_kwarg=None, kwargs={})
+
+    return view.get_queryset()
+
+
+def autocomplete_queryset(user, terms):
+    """Return the queryset that RecipeAutocompleteView builds for the user and the typed terms"""
+    request = Request(APIRequestFactory().get('/'))
+    request.user = user
+    view = RecipeAutocompleteView(request=request)
+
+    return view.get_queryset(terms)
+
+
+class RecipeQueryPlanTests(TestCase):
+    """Test the recipe API queries are answered from an index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Seed enough recipes over several users for the planner to prefer an index"""
+        # The users don't need to log in, so skip create_user and the password hashing
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(email=f'user{i}@example.com')
+            for i in range(SEED_USERS + 1)
+        )
+        cls.user = users[0]
+
+        # The recipes of all users are interleaved, like recipes created over time
+        owners = [cls.user] * SEED_POWER_USER_RECIPES + users[1:] * SEED_RECIPES_PER_USER
+        random.Random(0).shuffle(owners)    # Fixed seed, so every run gets the same table
+
+        # bulk_create inserts all the recipes in a few queries instead of one query per recipe
+        Recipe.objects.bulk_create(
+            Recipe(
+                user=user,
+                title=f'Recipe {i}' if i % 100 else f'Saffron risotto {i}',
+                time_minutes=i % 120,
+                price=Decimal(i % 50),
+            )
+            for i, user in enumerate(owners)
+        )
+
+        # Refresh the table statistics, otherwise the planner thinks the table is empty
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE core_recipe')
+
+    def assertIndexedPlan(self, queryset, index=None):
+        """Assert the plan of the queryset has no sequential scan and no sort, and uses the index if given"""
+        nodes = explain(queryset)
+        node_types = [node['Node Type'] for node in nodes]
+
+        self.assertFalse(FORBIDDEN_NODES & set(node_types), f'Plan is not using an index: {node_types}')
+        if index:
+            # Without the right index Postgres can still avoid a sort by walking the primary key backwards,
+            # but then it reads and throws away the recipes of every other user
+            index_names = [node.get('Index Name') for node in nodes]
+            self.assertIn(index, index_names, f'Plan is not using {index}: {index_names}')
+
+    def test_list_first_page_uses_index(self):
+        """Test the first page of the recipe list is read from the index in order"""
+        queryset = viewset_queryset(self.user, 'list')
+
+        self.assertIndexedPlan(queryset[:PAGE_QUERY_SIZE], index=USER_ID_INDEX)
+
+    def test_list_next_page_uses_index(self):
+        """Test a page after the cursor is read from the index in order"""
+        queryset = viewset_queryset(self.user, 'list')
+        cursor = queryset.values_list('id', flat=True)[50]
+
+        self.assertIndexedPlan(queryset.filter(id__lt=cursor)[:PAGE_QUERY_SIZE], index=USER_ID_INDEX)
+
+    def test_detail_uses_index(self):
+        """Test a single recipe is looked up through an index"""
+        queryset = viewset_queryset(self.user, 'retrieve')
+        recipe_id = queryset.values_list('id', flat=True)[0]
+
+        self.assertIndexedPlan(queryset.filter(pk=recipe_id))
+
+    def test_range_filter_uses_index(self):
+        """Test filtering the recipe list on price and time doesn't read every row of the table"""
+        for params in ({'price_max': '1.00'}, {'time_minutes_min': 118}, {'price_min': '10.00', 'time_minutes_max': 60}):
+            queryset = viewset_queryset(self.user, 'list', **params)
+            node_types = [node['Node Type'] for node in explain(queryset[:PAGE_QUERY_SIZE])]
+
+            # A selective range is read from the (user, price) or (user, time_minutes) index and its few rows sorted,
+            # a wide range is read in order from the (user, -id) index
+            self.assertNotIn('Seq Scan', node_types, params)
+
+    def test_search_does_not_scan_table(self):
+        """Test searching the recipe list doesn't read every row of the table"""
+        queryset = viewset_queryset(self.user, 'list', q='saffron').order_by('-rank', '-id')
+        node_types = [node['Node Type'] for node in explain(queryset[:PAGE_QUERY_SIZE])]
+
+        # The matches are sorted on their rank, but only after an index found them
+        self.assertNotIn('Seq Scan', node_types)
+
+    def test_autocomplete_does_not_scan_table(self):
+        """Test the title autocomplete doesn't read every row of the table"""
+        queryset = autocomplete_queryset(self.user, 'saff')
+        node_types = [node['Node Type'] for node in explain(queryset[:settings.RECIPE_AUTOCOMPLETE_LIMIT])]
+
+        # The suggestions are sorted on their similarity, but only after an index found them
+        self.assertNotIn('Seq Scan', node_types)
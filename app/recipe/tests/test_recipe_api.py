@@ -2,20 +2,33 @@
 Test for recipe API
 """
 
+import base64
+import os
 from decimal import Decimal
+from unittest.mock import patch
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 
 from core.models import Recipe
 
-from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+from recipe import sync
+from recipe.caching import cache_stats, reset_cache_stats
+from recipe.pagination import RecipeCursorPagination
+from recipe.serializers import RecipeSerializer, RecipeDetailSerializer, RecipeRowSerializer
 
 RECIPES_URL = reverse('recipe:recipe-list')
+AUTOCOMPLETE_URL = reverse('recipe:recipe-autocomplete')
+BULK_URL = reverse('recipe:recipe-bulk')
+SYNC_URL = reverse('recipe:recipe-sync')
+CACHE_STATS_URL = reverse('recipe:recipe-cache-stats')
 
 
 # Helper function
@@ -63,6 +76,12 @@ class PublicRecipeAPITest(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_autocomplete_auth_required(self):
+        """Test that authentication is required for the autocomplete"""
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'choc'})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
 
 class PrivateRecipeAPITest(TestCase):
     """Test authenticated recipe API access"""
@@ -85,7 +104,82 @@ class PrivateRecipeAPITest(TestCase):
         serializer = RecipeSerializer(recipes, many=True)   # many=True because we are serializing a list of objects
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)    # The list is paginated, the recipes are in results
+
+    def test_row_serializer_same_output(self):
+        """Test the list row serializer renders exactly the same JSON as RecipeSerializer"""
+        create_recipe(user=self.user, title='Crème brûlée "maison"', price=Decimal('10'), link='')
+        create_recipe(user=self.user, title='Tarte\nTatin', price=Decimal('0.5'), time_minutes=0)
+        create_recipe(user=self.user, price=Decimal('999.99'), link='https://sample.com/?a=1&b=<2>')
+        recipes = Recipe.objects.filter(user=self.user).order_by('-id')
+
+        expected = JSONRenderer().render(RecipeSerializer(recipes, many=True).data)
+        rows = recipes.values(*RecipeRowSerializer.fields)
+
+        self.assertEqual(JSONRenderer().render(RecipeRowSerializer(rows).data), expected)
+
+    def test_list_same_output_as_model_serializer(self):
+        """Test the recipe list response is the JSON RecipeSerializer renders"""
+        create_recipe(user=self.user, title='Soupe à l\'oignon', price=Decimal('3.2'))
+        create_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL, {'q': 'soupe'})
+        recipes = Recipe.objects.filter(user=self.user, title__startswith='Soupe')
+
+        self.assertEqual(
+            JSONRenderer().render(res.data['results']),
+            JSONRenderer().render(RecipeSerializer(recipes, many=True).data),
+        )
+
+    def test_list_sparse_fields(self):
+        """Test ?fields= limits the recipe list to the requested fields and columns"""
+        create_recipe(user=self.user, title='First')
+        create_recipe(user=self.user, title='Second')
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL, {'fields': 'title', 'page_size': 1})
+        # The next request resets the query log, read the page query first
+        select = [query['sql'] for query in queries if 'ORDER BY' in query['sql']][0]
+        res_next = self.client.get(res.data['next'])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [{'title': 'Second'}])
+        self.assertEqual(res_next.data['results'], [{'title': 'First'}])
+        self.assertNotIn('"core_recipe"."price"', select)
+
+    def test_detail_sparse_fields(self):
+        """Test ?fields= leaves the description out of the recipe detail and its query"""
+        recipe = create_recipe(user=self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(detail_url(recipe.id), {'fields': 'id, title'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {'id': recipe.id, 'title': recipe.title})
+        self.assertFalse(any('"core_recipe"."description"' in query['sql'] for query in queries))
+
+    def test_sparse_fields_empty_entries_ignored(self):
+        """Test a trailing comma or a doubled comma in ?fields= is not an unknown field"""
+        create_recipe(user=self.user, title='First')
+
+        res = self.client.get(RECIPES_URL, {'fields': 'title,, '})
+        res_empty = self.client.get(RECIPES_URL, {'fields': ','})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [{'title': 'First'}])
+        self.assertEqual(res_empty.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('at least one field', str(res_empty.data['fields']))
+
+    def test_sparse_fields_unknown_field_error(self):
+        """Test an unknown field name is rejected"""
+        recipe = create_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL, {'fields': 'title,description'})
+        res_detail = self.client.get(detail_url(recipe.id), {'fields': 'title,user'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)    # The description is only in the detail
+        self.assertIn('fields', res.data)
+        self.assertEqual(res_detail.status_code, status.HTTP_400_BAD_REQUEST)
 
     def test_recipes_limited_to_user(self):
         """Test retrieving recipes for user"""
@@ -100,7 +194,241 @@ class PrivateRecipeAPITest(TestCase):
         serializer = RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
+
+    def test_recipe_list_paginated_with_cursor(self):
+        """Test the recipe list is split in pages with an opaque cursor"""
+        for i in range(5):
+            create_recipe(user=self.user, title=f'Recipe {i}')
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIsNone(res.data['previous'])     # The first page has no previous page
+        self.assertIn('cursor=', res.data['next'])
+
+        # Follow the next links until the last page and collect all the recipe ids
+        ids = [recipe['id'] for recipe in res.data['results']]
+        while res.data['next']:
+            # CaptureQueriesContext records the SQL queries that are run inside the with block
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.get(res.data['next'])
+            ids.extend(recipe['id'] for recipe in res.data['results'])
+
+            # The next page is found with WHERE id < cursor, never by skipping rows with OFFSET
+            self.assertFalse(any('OFFSET' in query['sql'] for query in queries))
+
+        expected = list(Recipe.objects.filter(user=self.user).order_by('-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)     # Every recipe exactly once, newest first
+
+    def test_recipe_list_page_size_capped(self):
+        """Test the client can't ask for more recipes per page than the maximum"""
+        for i in range(3):
+            create_recipe(user=self.user)
+
+        # Patch the cap on the pagination class, the setting is read when the class is defined
+        with patch.object(RecipeCursorPagination, 'max_page_size', 2):
+            res = self.client.get(RECIPES_URL, {'page_size': 1000})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 2)
+
+    def test_recipe_list_invalid_cursor_error(self):
+        """Test a cursor that wasn't issued by the API is rejected"""
+        res = self.client.get(RECIPES_URL, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_search_recipes(self):
+        """Test searching recipes on the title and description"""
+        r1 = create_recipe(user=self.user, title='Thai vegetable curry', description='')
+        r2 = create_recipe(user=self.user, title='Rice bowl', description='Served with a mild curry sauce')
+        create_recipe(user=self.user, title='Chocolate cake', description='Dessert')
+
+        res = self.client.get(RECIPES_URL, {'q': 'curries'})    # The search is on word stems, curries matches curry
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        # A match in the title ranks higher than a match in the description
+        self.assertEqual([recipe['id'] for recipe in res.data['results']], [r1.id, r2.id])
+        self.assertEqual(res.data['results'][0], RecipeSerializer(r1).data)
+
+    def test_search_recipes_limited_to_user(self):
+        """Test searching only returns recipes of the authenticated user"""
+        other_user = create_user(email='other_user@example.com', password='testpass123')
+        create_recipe(user=other_user, title='Pasta carbonara')
+        recipe = create_recipe(user=self.user, title='Pasta pesto')
+
+        res = self.client.get(RECIPES_URL, {'q': 'pasta'})
+
+        self.assertEqual([r['id'] for r in res.data['results']], [recipe.id])
+
+    def test_search_recipes_updated_title(self):
+        """Test the search document follows updates of the title"""
+        recipe = create_recipe(user=self.user, title='Pancakes')
+        self.client.patch(detail_url(recipe.id), {'title': 'Waffles'})
+
+        res_old = self.client.get(RECIPES_URL, {'q': 'pancakes'})
+        res_new = self.client.get(RECIPES_URL, {'q': 'waffles'})
+
+        self.assertEqual(res_old.data['results'], [])
+        self.assertEqual([r['id'] for r in res_new.data['results']], [recipe.id])
+
+    def test_search_recipes_paginated(self):
+        """Test the search results are paginated by rank without duplicates"""
+        for i in range(5):
+            # Same title for every recipe, so every recipe has the same rank
+            create_recipe(user=self.user, title='Tomato soup', description='tomato ' * i)
+        create_recipe(user=self.user, title='Onion soup')
+
+        res = self.client.get(RECIPES_URL, {'q': 'tomato', 'page_size': 2})
+        pages = [res.data['results']]
+        while res.data['next']:
+            # The (rank, id) position of the cursor finds the next page without skipping rows with OFFSET
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.get(res.data['next'])
+            pages.append(res.data['results'])
+            self.assertFalse(any('OFFSET' in query['sql'] for query in queries))
+        ids = [recipe['id'] for page in pages for recipe in page]
+
+        expected = Recipe.objects.filter(user=self.user, title='Tomato soup').values_list('id', flat=True)
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(set(ids), set(expected))
+
+        # The previous links go back through the same pages
+        res = self.client.get(res.data['previous'])
+        self.assertEqual(res.data['results'], pages[-2])
+
+    def test_search_recipes_same_rank_paginated(self):
+        """Test the results with the same rank are paginated by id without OFFSET"""
+        for i in range(7):
+            create_recipe(user=self.user, title='Tomato soup')
+
+        res = self.client.get(RECIPES_URL, {'q': 'tomato', 'page_size': 2})
+        ids = [recipe['id'] for recipe in res.data['results']]
+        while res.data['next']:
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.get(res.data['next'])
+            ids.extend(recipe['id'] for recipe in res.data['results'])
+            self.assertFalse(any('OFFSET' in query['sql'] for query in queries))
+
+        expected = list(Recipe.objects.filter(user=self.user).order_by('-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_search_recipes_invalid_cursor_error(self):
+        """Test a search cursor whose position isn't a rank and an id is rejected"""
+        cursor = base64.b64encode(b'p=best').decode()
+
+        res = self.client.get(RECIPES_URL, {'q': 'tomato', 'cursor': cursor})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_filter_recipes_by_price_and_time(self):
+        """Test filtering recipes on price and time ranges"""
+        r1 = create_recipe(user=self.user, price=Decimal('8.00'), time_minutes=20)
+        create_recipe(user=self.user, price=Decimal('12.00'), time_minutes=20)   # Too expensive
+        create_recipe(user=self.user, price=Decimal('8.00'), time_minutes=45)    # Takes too long
+        r4 = create_recipe(user=self.user, price=Decimal('10.00'), time_minutes=30)     # The limits are included
+
+        res = self.client.get(RECIPES_URL, {'price_max': '10.00', 'time_minutes_max': 30})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['results']], [r4.id, r1.id])
+
+    def test_filter_recipes_minimum(self):
+        """Test filtering recipes on the minimum of a range"""
+        create_recipe(user=self.user, time_minutes=5)
+        recipe = create_recipe(user=self.user, time_minutes=60)
+
+        res = self.client.get(RECIPES_URL, {'time_minutes_min': 10})
+
+        self.assertEqual([r['id'] for r in res.data['results']], [recipe.id])
+
+    def test_filter_recipes_paginated(self):
+        """Test the filters are kept when following the pagination cursor"""
+        for i in range(6):
+            create_recipe(user=self.user, price=Decimal(i))
+
+        res = self.client.get(RECIPES_URL, {'price_min': '2', 'page_size': 2})
+        ids = [recipe['id'] for recipe in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            ids.extend(recipe['id'] for recipe in res.data['results'])
+
+        expected = Recipe.objects.filter(user=self.user, price__gte=2).order_by('-id').values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+
+    def test_filter_recipes_invalid_errors(self):
+        """Test invalid filter values are rejected"""
+        invalid_params = [
+            {'price_max': 'cheap'},
+            {'price_min': '-1'},
+            {'price_max': '1000.00'},   # Doesn't fit in the price field
+            {'time_minutes_min': '1.5'},
+            {'time_minutes_min': 30, 'time_minutes_max': 10},   # Empty range
+        ]
+
+        for params in invalid_params:
+            res = self.client.get(RECIPES_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_autocomplete_titles(self):
+        """Test the autocomplete suggests only id and title, prefix matches first"""
+        r1 = create_recipe(user=self.user, title='Chocolate cake')
+        r2 = create_recipe(user=self.user, title='Hot chocolate')
+        create_recipe(user=self.user, title='Apple pie')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'chocolate'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': r1.id, 'title': r1.title},
+            {'id': r2.id, 'title': r2.title},   # Not a prefix match, but similar enough
+        ])
+
+    def test_autocomplete_tolerates_typos(self):
+        """Test the autocomplete suggests titles that are similar to the typed terms"""
+        recipe = create_recipe(user=self.user, title='Lasagna')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'lasagne'})
+
+        self.assertEqual(res.data, [{'id': recipe.id, 'title': recipe.title}])
+
+    def test_autocomplete_escapes_wildcards(self):
+        """Test the % typed by the user is not a wildcard"""
+        create_recipe(user=self.user, title='Carrot soup')
+        recipe = create_recipe(user=self.user, title='100% rye bread')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': '100%'})
+
+        self.assertEqual(res.data, [{'id': recipe.id, 'title': recipe.title}])
+
+    def test_autocomplete_limited_to_user(self):
+        """Test the autocomplete only suggests recipes of the authenticated user"""
+        other_user = create_user(email='other_user@example.com', password='testpass123')
+        create_recipe(user=other_user, title='Banana bread')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'banana'})
+
+        self.assertEqual(res.data, [])
+
+    def test_autocomplete_limit(self):
+        """Test the number of suggestions is limited and can't go over the maximum"""
+        for i in range(3):
+            create_recipe(user=self.user, title=f'Pizza {i}')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'pizza', 'limit': 2})
+        res_over_max = self.client.get(AUTOCOMPLETE_URL, {'q': 'pizza', 'limit': 1000})
+
+        self.assertEqual(len(res.data), 2)
+        self.assertEqual(res_over_max.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_autocomplete_terms_too_short_error(self):
+        """Test the autocomplete needs at least 2 characters"""
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'c'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
     def test_view_recipe_detail(self):
         """Test viewing a recipe detail"""
@@ -222,3 +550,465 @@ class PrivateRecipeAPITest(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
         self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
+
+    def test_bulk_create_recipes(self):
+        """Test creating a batch of recipes with one INSERT"""
+        payload = [
+            {'title': 'Recipe 1', 'time_minutes': 10, 'price': '2.50'},
+            {'title': 'Recipe 2', 'time_minutes': 20, 'price': '5.00', 'description': 'Second'},
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual([r.title for r in recipes], ['Recipe 1', 'Recipe 2'])
+        self.assertEqual(res.data, RecipeDetailSerializer(recipes, many=True).data)
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "core_recipe"')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_bulk_create_invalid_recipe_errors(self):
+        """Test a batch with an invalid recipe creates nothing and reports the errors per recipe"""
+        payload = [
+            {'title': 'Valid recipe', 'time_minutes': 10, 'price': '2.50'},
+            {'title': 'Invalid recipe', 'time_minutes': 'long'},
+        ]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})   # No errors for the first recipe
+        self.assertIn('time_minutes', res.data[1])
+        self.assertIn('price', res.data[1])
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    def test_bulk_create_too_many_recipes_errors(self):
+        """Test a batch can't have more recipes than the maximum"""
+        payload = [{'title': 'Recipe', 'time_minutes': 10, 'price': '2.50'}] * 3
+
+        with self.settings(RECIPE_BULK_MAX_ITEMS=2):
+            res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    def test_bulk_update_recipes(self):
+        """Test partially updating a batch of recipes with one UPDATE"""
+        r1 = create_recipe(user=self.user, title='Recipe 1')
+        r2 = create_recipe(user=self.user, title='Recipe 2', time_minutes=10)
+        payload = [
+            {'id': r1.id, 'title': 'Updated 1'},
+            {'id': r2.id, 'time_minutes': 15},
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        r1.refresh_from_db()
+        r2.refresh_from_db()
+        self.assertEqual(r1.title, 'Updated 1')
+        self.assertEqual(r2.title, 'Recipe 2')
+        self.assertEqual(r2.time_minutes, 15)
+        self.assertEqual(res.data, RecipeDetailSerializer([r1, r2], many=True).data)
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "core_recipe"')]
+        self.assertEqual(len(updates), 1)
+
+    def test_bulk_update_other_users_recipe_errors(self):
+        """Test a batch update can't change recipes of another user"""
+        other_user = create_user(email='other_user@example.com', password='testpass123')
+        own_recipe = create_recipe(user=self.user, title='Own recipe')
+        other_recipe = create_recipe(user=other_user, title='Other recipe')
+        payload = [
+            {'id': own_recipe.id, 'title': 'Changed'},
+            {'id': other_recipe.id, 'title': 'Changed'},
+            {'title': 'No id'},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('id', res.data[1])
+        self.assertIn('id', res.data[2])
+        own_recipe.refresh_from_db()
+        other_recipe.refresh_from_db()
+        self.assertEqual(own_recipe.title, 'Own recipe')    # Nothing is written when one recipe is invalid
+        self.assertEqual(other_recipe.title, 'Other recipe')
+
+    def test_bulk_delete_recipes(self):
+        """Test deleting a batch of recipes with one DELETE"""
+        r1 = create_recipe(user=self.user)
+        r2 = create_recipe(user=self.user)
+        r3 = create_recipe(user=self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.delete(BULK_URL, {'ids': [r1.id, r2.id]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(list(Recipe.objects.filter(user=self.user)), [r3])
+        deletes = [query for query in queries if query['sql'].startswith('DELETE FROM "core_recipe"')]
+        self.assertEqual(len(deletes), 1)
+
+    def test_bulk_delete_other_users_recipe_errors(self):
+        """Test a batch delete can't delete recipes of another user"""
+        other_user = create_user(email='other_user@example.com', password='testpass123')
+        own_recipe = create_recipe(user=self.user)
+        other_recipe = create_recipe(user=other_user)
+
+        res = self.client.delete(BULK_URL, {'ids': [own_recipe.id, other_recipe.id]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(res.data['ids']), [1])    # The error is on the second id
+        self.assertTrue(Recipe.objects.filter(id=own_recipe.id).exists())
+        self.assertTrue(Recipe.objects.filter(id=other_recipe.id).exists())
+
+    def test_list_etag_not_modified(self):
+        """Test the list answers 304 to a matching ETag, with only the version query"""
+        create_recipe(user=self.user)
+        res = self.client.get(RECIPES_URL)
+
+        self.assertIn('ETag', res)
+        self.assertIn('Last-Modified', res)
+
+        # The recipes version is the only query, nothing is read for the serializer
+        with self.assertNumQueries(1):
+            res_cached = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res_cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_list_etag_changes_on_write(self):
+        """Test creating, updating and deleting a recipe changes the list ETag"""
+        recipe = create_recipe(user=self.user)
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        writes = [
+            lambda: self.client.post(RECIPES_URL, {'title': 'New', 'time_minutes': 5, 'price': '1.00'}),
+            lambda: self.client.patch(detail_url(recipe.id), {'title': 'Updated'}),
+            lambda: self.client.patch(BULK_URL, [{'id': recipe.id, 'title': 'Bulk updated'}], format='json'),
+            lambda: self.client.delete(detail_url(recipe.id)),
+        ]
+        for write in writes:
+            write()
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(res['ETag'], etag)
+            etag = res['ETag']
+
+    def test_list_etag_depends_on_query(self):
+        """Test another page or filter of the list has another ETag"""
+        create_recipe(user=self.user)
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        res = self.client.get(RECIPES_URL, {'price_max': '1.00'}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_list_etag_other_user_write_ignored(self):
+        """Test a write of another user keeps the list ETag"""
+        other_user = create_user(email='other_user@example.com', password='testpass123')
+        create_recipe(user=self.user)
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        create_recipe(user=other_user)
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_etag_not_modified(self):
+        """Test the recipe detail answers 304 to a matching ETag"""
+        recipe = create_recipe(user=self.user)
+        url = detail_url(recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.client.patch(url, {'title': 'Updated'})
+        res_updated = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res_updated.status_code, status.HTTP_200_OK)
+        self.assertEqual(res_updated.data['title'], 'Updated')
+
+
+class RecipeCacheAPITest(TestCase):
+    """Test the per-user cache of the recipe list and detail responses"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='testpass123')
+
+        self.client.force_authenticate(self.user)
+        reset_cache_stats()
+
+    def test_list_served_from_cache(self):
+        """Test a repeated list request reads no recipes from the database"""
+        create_recipe(user=self.user)
+        res = self.client.get(RECIPES_URL)
+
+        # The ETag version is the only query, the recipes come from the cache
+        with self.assertNumQueries(1):
+            res_cached = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res_cached.status_code, status.HTTP_200_OK)
+        self.assertEqual(res_cached.data, res.data)
+        # Creating the recipe invalidates
+        self.assertEqual(cache_stats(), {'hits': 1, 'misses': 1, 'invalidations': 1, 'hit_rate': 0.5})
+
+    def test_cache_stats_staff_only(self):
+        """Test the counters of the cache are only shown to the staff"""
+        res = self.client.get(CACHE_STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_cache_stats(self):
+        """Test the staff gets the counters of the worker answering"""
+        self.client.get(RECIPES_URL)
+        self.client.get(RECIPES_URL)
+        self.user.is_staff = True
+        self.user.save()
+
+        res = self.client.get(CACHE_STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual((res.data['hits'], res.data['misses'], res.data['hit_rate']), (1, 1, 0.5))
+        self.assertEqual(res.data['worker'], os.getpid())
+
+    def test_hit_only_reads_cache(self):
+        """Test a cache hit reads the generation and the response, and writes nothing to the cache"""
+        self.client.get(RECIPES_URL)
+
+        with patch('recipe.caching._cache') as patched_cache:
+            patched_cache.return_value.get_or_set.return_value = 'generation'
+            patched_cache.return_value.get.return_value = {'results': []}
+            self.client.get(RECIPES_URL)
+
+        self.assertEqual([call[0] for call in patched_cache.return_value.method_calls], ['get_or_set', 'get'])
+        self.assertEqual(cache_stats()['hits'], 1)
+
+    def test_cache_key_includes_query_string(self):
+        """Test the filters and the pagination cursor get their own cache entry"""
+        create_recipe(user=self.user, price=Decimal('1.00'))
+        create_recipe(user=self.user, price=Decimal('9.00'))
+        self.client.get(RECIPES_URL)
+
+        res = self.client.get(RECIPES_URL, {'price_max': '5.00'})
+        res_page = self.client.get(RECIPES_URL, {'page_size': 1})
+        res_next = self.client.get(res_page.data['next'])
+
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertNotEqual(res_next.data['results'], res_page.data['results'])
+        self.assertEqual(cache_stats()['hits'], 0)
+
+    def test_cache_per_user(self):
+        """Test a user never gets the cached recipes of another user"""
+        other_user = create_user(email='other_user@example.com', password='testpass123')
+        create_recipe(user=other_user)
+        self.client.get(RECIPES_URL)
+
+        self.client.force_authenticate(other_user)
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(cache_stats()['hits'], 0)
+
+    def test_api_writes_invalidate_cache(self):
+        """Test creating, updating and deleting a recipe through the API refreshes the cached list"""
+        recipe = create_recipe(user=self.user)
+        self.client.get(RECIPES_URL)
+
+        self.client.patch(detail_url(recipe.id), {'title': 'Updated'})
+        res_updated = self.client.get(RECIPES_URL)
+        self.client.post(BULK_URL, [{'title': 'New', 'time_minutes': 5, 'price': '1.00'}], format='json')
+        res_created = self.client.get(RECIPES_URL)
+        self.client.delete(detail_url(recipe.id))
+        res_deleted = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res_updated.data['results'][0]['title'], 'Updated')
+        self.assertEqual([r['title'] for r in res_created.data['results']], ['New', 'Updated'])
+        self.assertEqual([r['title'] for r in res_deleted.data['results']], ['New'])
+        self.assertEqual(cache_stats()['hits'], 0)
+
+    def test_model_signals_invalidate_cache(self):
+        """Test saving and deleting a recipe outside of the API refreshes the cached detail"""
+        recipe = create_recipe(user=self.user)
+        url = detail_url(recipe.id)
+        self.client.get(url)
+        reset_cache_stats()
+
+        recipe.title = 'Renamed'
+        recipe.save()
+        res_saved = self.client.get(url)
+        recipe.delete()
+        res_deleted = self.client.get(url)
+
+        self.assertEqual(res_saved.data['title'], 'Renamed')
+        self.assertEqual(res_deleted.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(cache_stats()['invalidations'], 2)
+
+    def test_other_user_write_keeps_cache(self):
+        """Test a write to the recipes of another user doesn't invalidate the user's cache"""
+        other_user = create_user(email='other_user@example.com', password='testpass123')
+        self.client.get(RECIPES_URL)
+
+        create_recipe(user=other_user)
+        self.client.get(RECIPES_URL)
+
+        self.assertEqual(cache_stats()['hits'], 1)
+
+
+# TransactionTestCase commits every request like in production, TestCase would run the whole test in one transaction
+# and the sync compares transaction ids
+class RecipeSyncAPITest(TransactionTestCase):
+    """Test the recipe sync API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='testpass123')
+
+        self.client.force_authenticate(self.user)
+
+    def test_first_sync_returns_all_recipes(self):
+        """Test a sync without cursor returns every recipe of the user"""
+        r1 = create_recipe(user=self.user)
+        r2 = create_recipe(user=self.user)
+        r2.delete()
+        other_user = create_user(email='other_user@example.com', password='testpass123')
+        create_recipe(user=other_user)
+
+        res = self.client.get(SYNC_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['changed'], RecipeDetailSerializer([r1], many=True).data)
+        self.assertEqual(res.data['deleted'], [])
+        self.assertTrue(res.data['cursor'])
+
+    def test_sync_returns_changes_since_cursor(self):
+        """Test a sync with a cursor returns only the created, updated and deleted recipes"""
+        unchanged = create_recipe(user=self.user)
+        updated = create_recipe(user=self.user)
+        deleted = create_recipe(user=self.user)
+        cursor = self.client.get(SYNC_URL).data['cursor']
+
+        created = create_recipe(user=self.user)
+        self.client.patch(detail_url(updated.id), {'title': 'Updated'})
+        self.client.delete(BULK_URL, {'ids': [deleted.id]}, format='json')
+
+        res = self.client.get(SYNC_URL, {'cursor': cursor})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        changed_ids = {recipe['id'] for recipe in res.data['changed']}
+        self.assertEqual(changed_ids, {created.id, updated.id})
+        self.assertNotIn(unchanged.id, changed_ids)
+        self.assertEqual(res.data['deleted'], [deleted.id])
+
+    def test_sync_skips_deletions_before_first_sync(self):
+        """Test the recipes deleted before the first sync are never returned as deleted"""
+        kept = create_recipe(user=self.user)
+        create_recipe(user=self.user).delete()
+        cursor = self.client.get(SYNC_URL).data['cursor']
+
+        res = self.client.get(SYNC_URL, {'cursor': cursor})
+
+        self.assertEqual(res.data['deleted'], [])
+        self.assertNotIn(kept.id, [recipe['id'] for recipe in res.data['changed']])
+
+    def test_sync_without_recipes_skips_old_deletions(self):
+        """Test a user whose recipes were all deleted before the first sync gets no deletions on the next one"""
+        create_recipe(user=self.user).delete()
+        cursor = self.client.get(SYNC_URL).data['cursor']
+
+        res = self.client.get(SYNC_URL, {'cursor': cursor})
+
+        self.assertEqual(res.data['deleted'], [])
+
+    @override_settings(RECIPE_SYNC_PAGE_SIZE=1)
+    def test_paged_first_sync_skips_old_deletions(self):
+        """Test the next pages of a first sync return the deletions after it, not the ones before"""
+        sent = create_recipe(user=self.user)
+        create_recipe(user=self.user).delete()
+        unsent = create_recipe(user=self.user)
+        unsent_id = unsent.id
+        res = self.client.get(SYNC_URL)
+        pages = [res.data]
+        unsent.delete()
+        while res.data['has_more']:
+            res = self.client.get(SYNC_URL, {'cursor': res.data['cursor']})
+            pages.append(res.data)
+
+        self.assertEqual([recipe['id'] for page in pages for recipe in page['changed']], [sent.id])
+        self.assertEqual([recipe_id for page in pages for recipe_id in page['deleted']], [unsent_id])
+
+    def test_idle_sync_single_query(self):
+        """Test a sync without changes runs a single query and returns nothing"""
+        create_recipe(user=self.user)
+        cursor = self.client.get(SYNC_URL).data['cursor']
+
+        with self.assertNumQueries(1):
+            res = self.client.get(SYNC_URL, {'cursor': cursor})
+
+        self.assertEqual(res.data['changed'], [])
+        self.assertEqual(res.data['deleted'], [])
+
+    def test_sync_ignores_other_users_changes(self):
+        """Test changes of another user are not returned"""
+        other_user = create_user(email='other_user@example.com', password='testpass123')
+        other_recipe = create_recipe(user=other_user)
+        cursor = self.client.get(SYNC_URL).data['cursor']
+
+        create_recipe(user=other_user)
+        other_recipe.delete()
+        res = self.client.get(SYNC_URL, {'cursor': cursor})
+
+        self.assertEqual(res.data['changed'], [])
+        self.assertEqual(res.data['deleted'], [])
+
+    @override_settings(RECIPE_SYNC_PAGE_SIZE=2)
+    def test_sync_in_pages(self):
+        """Test the changes are returned RECIPE_SYNC_PAGE_SIZE at a time, until has_more is false"""
+        # One transaction, the pages split the changes of a transaction by recipe id
+        recipes = Recipe.objects.bulk_create([Recipe(user=self.user, title=f'R{i}', time_minutes=5, price=1) for i in range(5)])
+        deleted = create_recipe(user=self.user)
+        deleted_id = deleted.id
+        res = self.client.get(SYNC_URL)
+        pages = [res.data]
+        deleted.delete()
+        while res.data['has_more']:
+            res = self.client.get(SYNC_URL, {'cursor': res.data['cursor']})
+            pages.append(res.data)
+
+        # The deletion is a change too, after the changes of the bulk create
+        self.assertEqual([len(page['changed']) + len(page['deleted']) for page in pages], [2, 2, 2])
+        self.assertEqual(
+            sorted(recipe['id'] for page in pages for recipe in page['changed']),
+            [recipe.id for recipe in recipes],
+        )
+        self.assertEqual(pages[-1]['deleted'], [deleted_id])
+
+    def test_sync_returns_changes_of_pending_transactions(self):
+        """Test a transaction running when the cursor was issued is synced once committed, whatever its txid"""
+        recipe = create_recipe(user=self.user)
+        recipe.refresh_from_db()
+        # The cursor of a sync that ran while the transaction writing the recipe was still running
+        cursor = sync.encode_cursor((recipe.change_txid + 100, 0, [recipe.change_txid]))
+
+        res = self.client.get(SYNC_URL, {'cursor': cursor})
+
+        self.assertEqual([changed['id'] for changed in res.data['changed']], [recipe.id])
+
+    def test_sync_expired_cursor_error(self):
+        """Test a cursor older than RECIPE_SYNC_CURSOR_MAX_AGE is rejected, its tombstones may be gone"""
+        cursor = self.client.get(SYNC_URL).data['cursor']
+
+        with override_settings(RECIPE_SYNC_CURSOR_MAX_AGE=-1):
+            res = self.client.get(SYNC_URL, {'cursor': cursor})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Expired cursor', str(res.data['cursor']))
+
+    def test_sync_invalid_cursor_error(self):
+        """Test a cursor that wasn't issued by the server is rejected"""
+        res = self.client.get(SYNC_URL, {'cursor': '12345'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,126 @@
+"""
+Tests for the recipe statistics API
+"""
+
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, RecipeStats
+from recipe.tests.test_recipe_api import BULK_URL, create_recipe, create_user, detail_url
+
+STATS_URL = reverse('recipe:recipe-stats')
+
+
+class PublicRecipeStatsAPITest(TestCase):
+    """Test unauthenticated recipe statistics requests"""
+
+    def test_auth_required(self):
+        """Test auth is required to get the statistics"""
+        res = APIClient().get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateRecipeStatsAPITest(TestCase):
+    """Test the recipe statistics of an authenticated user"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='testpass123')
+
+        self.client.force_authenticate(self.user)
+
+    def get_stats(self):
+        """Return the statistics returned by the API"""
+        res = self.client.get(STATS_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        return res.data
+
+    def assert_matches_recipes(self):
+        """Assert the statistics are the same as the ones computed from the recipes"""
+        stats = self.get_stats()
+
+        RecipeStats.objects.rebuild([self.user])
+
+        self.assertEqual(stats, self.get_stats())
+
+    def test_no_recipes(self):
+        """Test the statistics of a user without recipes"""
+        stats = self.get_stats()
+
+        self.assertEqual(stats['recipe_count'], 0)
+        self.assertIsNone(stats['price_avg'])
+        self.assertIsNone(stats['price_min'])
+        self.assertEqual([bucket['count'] for bucket in stats['time_histogram']], [0, 0, 0, 0, 0])
+
+    def test_stats(self):
+        """Test the count, prices and time histogram of the recipes"""
+        create_recipe(self.user, time_minutes=5, price=Decimal('2.00'))
+        create_recipe(self.user, time_minutes=15, price=Decimal('4.00'))
+        create_recipe(self.user, time_minutes=200, price=Decimal('10.00'))
+        create_recipe(create_user(email='other@example.com', password='testpass123'), price=Decimal('99.00'))
+
+        stats = self.get_stats()
+
+        self.assertEqual(stats['recipe_count'], 3)
+        self.assertEqual(stats['price_avg'], '5.33')
+        self.assertEqual(stats['price_min'], '2.00')
+        self.assertEqual(stats['price_max'], '10.00')
+        self.assertEqual(stats['time_histogram'], [
+            {'min': None, 'max': 15, 'count': 1},
+            {'min': 15, 'max': 30, 'count': 1},
+            {'min': 30, 'max': 60, 'count': 0},
+            {'min': 60, 'max': 120, 'count': 0},
+            {'min': 120, 'max': None, 'count': 1},
+        ])
+
+    def test_stats_one_query(self):
+        """Test the statistics are read with one query, whatever the number of recipes"""
+        for _ in range(5):
+            create_recipe(self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.get_stats()
+
+        self.assertEqual(len(queries), 1)
+
+    def test_stats_follow_writes(self):
+        """Test the statistics follow the creates, updates and deletes of the API"""
+        cheapest = self.client.post(BULK_URL, [
+            {'title': 'Soup', 'time_minutes': 10, 'price': '1.00'},
+            {'title': 'Cake', 'time_minutes': 45, 'price': '6.00'},
+            {'title': 'Roast', 'time_minutes': 90, 'price': '12.00'},
+        ], format='json').data[0]['id']
+        self.assert_matches_recipes()
+
+        # The cheapest recipe becomes the most expensive, the minimum and maximum both change
+        res = self.client.patch(detail_url(cheapest), {'price': '20.00', 'time_minutes': 130})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        stats = self.get_stats()
+        self.assertEqual((stats['price_min'], stats['price_max']), ('6.00', '20.00'))
+        self.assert_matches_recipes()
+
+        self.client.delete(detail_url(cheapest))
+        stats = self.get_stats()
+        self.assertEqual((stats['recipe_count'], stats['price_max']), (2, '12.00'))
+        self.assert_matches_recipes()
+
+        Recipe.objects.filter(user=self.user).delete()
+        stats = self.get_stats()
+        self.assertEqual((stats['recipe_count'], stats['price_min'], stats['price_avg']), (0, None, None))
+
+    def test_stats_deleted_with_user(self):
+        """Test deleting a user also deletes its statistics, the recipe triggers don't create them again"""
+        create_recipe(self.user)
+
+        self.user.delete()
+
+        self.assertFalse(RecipeStats.objects.exists())
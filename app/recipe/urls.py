@@ -7,6 +7,7 @@ from django.urls import path, include
 # The DefaultRouter is a feature of the Django REST Framework that automatically generates the URLs for our viewset
 from rest_framework.routers import DefaultRouter
 
+from core.asyncviews import asgi_urlpatterns
 from recipe import views
 
 router = DefaultRouter()
@@ -15,5 +16,12 @@ router.register('recipes', views.RecipeViewSet)
 app_name = 'recipe'
 
 urlpatterns = [
-    path('', include(router.urls)),  # The router.urls is a function that returns a list of urls for our viewset
+    # The router.urls is a function that returns a list of urls for our viewset
+    # Under ASGI the list and detail are served by async views, the slow database calls of concurrent requests overlap
+    path('', include(asgi_urlpatterns(router.urls, {'recipe-list', 'recipe-detail'}))),
+    path('autocomplete/', views.RecipeAutocompleteView.as_view(), name='recipe-autocomplete'),
+    path('stats/', views.RecipeStatsView.as_view(), name='recipe-stats'),
+    path('cache-stats/', views.RecipeCacheStatsView.as_view(), name='recipe-cache-stats'),
+    path('export/', views.RecipeExportView.as_view(), name='recipe-export'),
+    path('import/', views.RecipeImportView.as_view(), name='recipe-import'),
 ]
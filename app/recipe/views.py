@@ -2,34 +2,159 @@
 Views for the Recipe API.
 """
 
-from rest_framework import viewsets
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated
+import codecs
+import os
+from functools import cached_property
 
-from core.models import Recipe
-from recipe import serializers
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connection, transaction
+from django.db.models import BooleanField, ExpressionWrapper, F, FloatField, Q
+from django.db.models.functions import Cast
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.utils.translation import gettext_lazy as _
+from django.views.decorators.gzip import gzip_page
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, extend_schema_view
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from core.authentication import API_AUTHENTICATION_CLASSES
+from core.models import Recipe, RecipeStats
+from recipe import export, importer, serializers, sync
+from recipe.caching import cache_recipes_response, cache_stats, invalidate_user_recipes
+from recipe.conditional import recipes_condition
+from recipe.pagination import RecipeCursorPagination
 
+# Text search configuration of the search document, must be the same as the trigger in core migration 0004
+SEARCH_CONFIG = 'english'
+
+
+# Query parameters of the list and the lookups they filter on, the ranges include their limits
+RANGE_FILTERS = {
+    'price_min': 'price__gte',
+    'price_max': 'price__lte',
+    'time_minutes_min': 'time_minutes__gte',
+    'time_minutes_max': 'time_minutes__lte',
+}
+
+
+# extend_schema_view adds the documentation of the query parameters to the generated OpenAPI schema
+@extend_schema_view(
+    list=extend_schema(parameters=[serializers.RecipeFilterSerializer, serializers.RecipeFieldsQuerySerializer]),
+    retrieve=extend_schema(parameters=[serializers.RecipeDetailFieldsQuerySerializer]),
+)
+# method_decorator applies the function decorator to the list and retrieve methods of the class
+# A client that sends back the ETag it got gets a 304 response without the recipes being read or serialized
+@method_decorator(recipes_condition, name='list')
+@method_decorator(recipes_condition, name='retrieve')
+# Inside the conditional GET, a client without a matching ETag gets the response data from the per-user cache
+@method_decorator(cache_recipes_response, name='list')
+@method_decorator(cache_recipes_response, name='retrieve')
 # Using the ModelViewSet because we will be working with model objects Recipe and we want to allow all the CRUD operations
 class RecipeViewSet(viewsets.ModelViewSet):
     """View for manage recipes API's"""
 
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()     # The queryset is the objects that are managed by the viewset
-    authentication_classes = [TokenAuthentication]  # The authentication_classes is the authentication classes that are used by the viewset
+    authentication_classes = API_AUTHENTICATION_CLASSES  # The authentication_classes is the authentication classes that are used by the viewset
     permission_classes = [IsAuthenticated]  # The permission_classes is the permission classes that are used by the viewset
+    pagination_class = RecipeCursorPagination   # Only the list action is paginated, with a cursor on -id
 
     # Override the get_queryset function to return recipes for the authenticated user only
     # Default function returns all the objects
     def get_queryset(self):
         """Return recipes for the authenticated user only"""
-        return self.queryset.filter(user=self.request.user).order_by('-id')
+        # The search document is never returned, don't read it from the database
+        queryset = self.queryset.filter(user=self.request.user).defer('search_vector')
+
+        if self.action == 'list':
+            params = serializers.RecipeFilterSerializer(data=self.request.query_params)
+            params.is_valid(raise_exception=True)   # Return a 400 response with the errors if the parameters are invalid
+
+            queryset = self._filter(queryset, params.validated_data)
+            queryset = self._search(queryset, params.validated_data.get('q'))
+        elif self.action == 'retrieve' and self.requested_fields:
+            # Only read the requested columns, a large description isn't read when it isn't returned
+            queryset = queryset.only(*self.requested_fields)
+
+        return queryset.order_by('-id')
+
+    @cached_property
+    def requested_fields(self):
+        """Return the fields of the ?fields= query parameter of a list or retrieve, None to return every field"""
+        if self.action == 'list':
+            params = serializers.RecipeFieldsQuerySerializer(data=self.request.query_params)
+        elif self.action == 'retrieve':
+            params = serializers.RecipeDetailFieldsQuerySerializer(data=self.request.query_params)
+        else:
+            return None
+        params.is_valid(raise_exception=True)
+
+        return params.validated_data.get('fields')
+
+    def _filter(self, queryset, params):
+        """Filter the recipes on the price and time_minutes ranges"""
+        # The ranges are WHERE conditions in SQL, answered from the (user, price) and (user, time_minutes) indexes
+        lookups = {lookup: params[param] for param, lookup in RANGE_FILTERS.items() if param in params}
+
+        return queryset.filter(**lookups)
+
+    def _search(self, queryset, terms):
+        """Filter the recipes on the ?q= search terms and annotate their rank"""
+        if not terms:
+            return queryset
+
+        # websearch accepts what users type in a search box: words, "quoted phrases", -excluded words, or
+        query = SearchQuery(terms, config=SEARCH_CONFIG, search_type='websearch')
+        # The rank is cast to double precision so the cursor position of the pagination survives the round trip exactly
+        rank = Cast(SearchRank(F('search_vector'), query), FloatField())
+
+        # search_vector=query is the @@ match operator, which uses the GIN index
+        return queryset.filter(search_vector=query).annotate(rank=rank)
+
+    def list(self, request, *args, **kwargs):
+        """List the recipes of the authenticated user"""
+        # The rows are read with values() and serialized by RecipeRowSerializer, no model instances are created
+        fields = self.requested_fields or serializers.RecipeRowSerializer.fields
+        queryset = self.filter_queryset(self.get_queryset())
+        # Only the columns of the output are read, plus the id and the rank the cursor pagination orders on
+        columns = ['id'] + [field for field in fields if field != 'id'] + [
+            annotation for annotation in ('rank',) if annotation in queryset.query.annotations
+        ]
+        rows = queryset.values(*columns)
+
+        page = self.paginate_queryset(rows)     # The cursor pagination reads the position of a page from the row dictionaries
+        if page is not None:
+            return self.get_paginated_response(serializers.RecipeRowSerializer(page, fields=fields).data)
+
+        return Response(serializers.RecipeRowSerializer(rows, fields=fields).data)
+
+    def get_serializer(self, *args, **kwargs):
+        """Return the serializer, without the fields left out of the ?fields= query parameter"""
+        serializer = super().get_serializer(*args, **kwargs)
+        if self.requested_fields:
+            for field in set(serializer.fields) - set(self.requested_fields):
+                serializer.fields.pop(field)
+
+        return serializer
 
     def get_serializer_class(self):
         """Return serializer class for requests"""
         # Return a reference to the serializer class not an instance of the serializer class!
         if self.action == 'list':
             return serializers.RecipeSerializer
+        elif self.action == 'bulk_update':
+            return serializers.RecipeBulkUpdateSerializer
+        elif self.action == 'bulk_destroy':
+            return serializers.RecipeBulkDeleteSerializer
+        elif self.action == 'sync':
+            return serializers.RecipeSyncSerializer
 
         return self.serializer_class
 
@@ -37,3 +162,217 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         """Create a new recipe"""
         serializer.save(user=self.request.user)
+
+    # The batch endpoints share the /recipes/bulk/ url, the HTTP method selects the operation
+    # Each batch is validated as a whole and written in one transaction, if one recipe is invalid nothing is written
+    @extend_schema(
+        request=serializers.RecipeDetailSerializer(many=True),
+        responses={201: serializers.RecipeDetailSerializer(many=True)},
+    )
+    @action(detail=False, methods=['post'], url_path='bulk', url_name='bulk', pagination_class=None)
+    def bulk_create(self, request):
+        """Create a batch of recipes"""
+        serializer = self.get_serializer(data=request.data, many=True, allow_empty=False)
+        serializer.is_valid(raise_exception=True)   # The errors are a list with one entry per recipe
+
+        with transaction.atomic():
+            serializer.save(user=request.user)  # The user is added to every recipe of the batch
+        # bulk_create doesn't send the post_save signal
+        invalidate_user_recipes(request.user.pk)
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @extend_schema(
+        request=serializers.RecipeBulkUpdateSerializer(many=True, partial=True),
+        responses=serializers.RecipeDetailSerializer(many=True),
+    )
+    @bulk_create.mapping.patch
+    def bulk_update(self, request):
+        """Partially update a batch of recipes"""
+        with transaction.atomic():
+            # get_queryset limits the batch to the user's recipes, select_for_update locks them until the commit
+            recipes = self.get_queryset().select_for_update()
+            serializer = self.get_serializer(recipes, data=request.data, many=True, partial=True, allow_empty=False)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        # bulk_update doesn't send the post_save signal
+        invalidate_user_recipes(request.user.pk)
+
+        return Response(serializer.data)
+
+    @extend_schema(request=serializers.RecipeBulkDeleteSerializer, responses={204: None})
+    @bulk_create.mapping.delete
+    def bulk_destroy(self, request):
+        """Delete a batch of recipes, the request body is {"ids": [...]}"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+
+        with transaction.atomic():
+            # One DELETE ... WHERE id IN (...) of the recipes selected through get_queryset, limited to the user's recipes
+            # The recipes are selected first to send the post_delete signal that invalidates the cache
+            deleted = self.get_queryset().filter(id__in=ids).delete()[0]
+            missing = deleted != len(set(ids))
+            if missing:
+                # Some ids are not recipes of the user, undo the delete so the batch is all or nothing
+                transaction.set_rollback(True)
+
+        if missing:
+            found = set(self.get_queryset().filter(id__in=ids).values_list('id', flat=True))
+            raise ValidationError({
+                'ids': {index: [_('Recipe not found.')] for index, recipe_id in enumerate(ids) if recipe_id not in found},
+            })
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @extend_schema(parameters=[serializers.RecipeSyncQuerySerializer])
+    @action(detail=False, methods=['get'], pagination_class=None)
+    def sync(self, request):
+        """Return the recipes created, updated and deleted since the cursor of the previous sync, page by page"""
+        params = serializers.RecipeSyncQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        changed_ids, deleted_ids, position, has_more = sync.changes_since(
+            request.user, params.validated_data.get('cursor'),
+        )
+
+        # The recipes are only read when something changed, at most RECIPE_SYNC_PAGE_SIZE of them
+        changed = self.get_queryset().filter(id__in=changed_ids) if changed_ids else []
+        serializer = self.get_serializer({
+            'changed': changed,
+            'deleted': deleted_ids,
+            'cursor': sync.encode_cursor(position),
+            'has_more': has_more,
+        })
+
+        return Response(serializer.data)
+
+
+# APIView instead of a generic view, the autocomplete is called on every keystroke
+# so it skips the model instances and the ModelSerializer and returns the id and title rows directly
+class RecipeAutocompleteView(APIView):
+    """Suggest recipe titles of the authenticated user while typing"""
+
+    authentication_classes = API_AUTHENTICATION_CLASSES
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self, terms):
+        """Return the id and title of the user's recipes matching the typed terms, best suggestions first"""
+        # Escape the % and _ typed by the user, they are wildcards in a LIKE pattern
+        prefix = connection.ops.prep_for_like_query(terms) + '%'
+
+        # Both conditions are answered from the trigram index on the title:
+        # title__ilike matches titles starting with the terms, title__trigram_similar tolerates typos
+        return (
+            Recipe.objects
+            .filter(user=self.request.user)
+            .filter(Q(title__ilike=prefix) | Q(title__trigram_similar=terms))
+            .annotate(
+                is_prefix=ExpressionWrapper(Q(title__ilike=prefix), output_field=BooleanField()),
+                similarity=TrigramSimilarity('title', terms),
+            )
+            .order_by('-is_prefix', '-similarity', '-id')
+            .values('id', 'title')  # values() returns dictionaries, no model instances are created
+        )
+
+    @extend_schema(
+        parameters=[serializers.RecipeAutocompleteQuerySerializer],
+        responses=serializers.RecipeAutocompleteSerializer(many=True),
+    )
+    def get(self, request):
+        """Return the title suggestions"""
+        params = serializers.RecipeAutocompleteQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)   # Return a 400 response with the errors if the parameters are invalid
+
+        suggestions = self.get_queryset(params.validated_data['q'])[:params.validated_data['limit']]
+
+        # The rows already have the shape of RecipeAutocompleteSerializer, no need to serialize them again
+        return Response(list(suggestions))
+
+
+class RecipeStatsView(APIView):
+    """Statistics of the recipes of the authenticated user"""
+
+    authentication_classes = API_AUTHENTICATION_CLASSES
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(responses=serializers.RecipeStatsSerializer)
+    def get(self, request):
+        """Return the count, prices and preparation time histogram of the recipes"""
+        # One row kept up to date by the database on every write of the recipes, no aggregate over the recipes
+        # A user who never had recipes has no row yet, the unsaved defaults are the statistics of no recipes
+        stats = RecipeStats.objects.filter(user=request.user).first() or RecipeStats(user=request.user)
+
+        return Response(serializers.RecipeStatsSerializer(stats).data)
+
+
+class RecipeCacheStatsView(APIView):
+    """Counters of the recipe response cache, for the staff"""
+
+    authentication_classes = API_AUTHENTICATION_CLASSES
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(responses=serializers.RecipeCacheStatsSerializer)
+    def get(self, request):
+        """Return the hits, misses, invalidations and hit rate of the worker answering the request"""
+        # The counters are in the memory of each worker, the worker id tells the samples of different workers apart
+        return Response(serializers.RecipeCacheStatsSerializer(dict(cache_stats(), worker=os.getpid())).data)
+
+
+# gzip_page compresses the stream chunk by chunk when the client accepts gzip, the whole export is never in memory
+@method_decorator(gzip_page, name='dispatch')
+class RecipeExportView(APIView):
+    """Export all the recipes of the authenticated user"""
+
+    authentication_classes = API_AUTHENTICATION_CLASSES
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(parameters=[serializers.RecipeExportQuerySerializer], responses={200: OpenApiTypes.STR})
+    def get(self, request):
+        """Stream the recipes as NDJSON or CSV"""
+        params = serializers.RecipeExportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        export_format = params.validated_data['file_format']
+        content_type, extension = export.EXPORT_FORMATS[export_format]
+
+        if settings.ASGI_MODE:
+            # The ASGI handler iterates the response on the event loop, the rows are read here, in the view's thread
+            response = FileResponse(export.spool_export(request.user, export_format), content_type=content_type)
+        else:
+            # StreamingHttpResponse sends each chunk as soon as it is generated, without a Content-Length
+            response = StreamingHttpResponse(
+                export.export_stream(request.user, export_format), content_type=content_type,
+            )
+        response['Content-Disposition'] = f'attachment; filename="recipes.{extension}"'
+
+        return response
+
+
+class RecipeImportView(APIView):
+    """Import recipes for the authenticated user"""
+
+    authentication_classes = API_AUTHENTICATION_CLASSES
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        parameters=[serializers.RecipeImportQuerySerializer],
+        request={'application/x-ndjson': OpenApiTypes.STR, 'text/csv': OpenApiTypes.STR},
+        responses=serializers.RecipeImportResultSerializer,
+    )
+    def post(self, request):
+        """Create recipes from an NDJSON or CSV file, the file is the request body"""
+        params = serializers.RecipeImportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        # The body is read line by line from the stream instead of request.data, so it's never entirely in memory
+        # utf-8-sig also accepts the byte order mark spreadsheets write at the start of a CSV file
+        lines = codecs.iterdecode(request.stream or [], 'utf-8-sig')
+        if params.validated_data['file_format'] == 'ndjson':
+            records = importer.ndjson_records(lines)
+        else:
+            records = importer.csv_records(lines)
+
+        # Invalid UTF-8 ends the import with an error, the result still counts the recipes created before it
+        result = importer.import_recipes(request.user, records)
+
+        return Response(serializers.RecipeImportResultSerializer(result).data)
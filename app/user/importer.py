@@ -0,0 +1,53 @@
+"""
+Bulk creation of users from NDJSON or CSV, see the bulk_create_users command.
+"""
+
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from core import hashing
+from recipe import importer
+from user.serializers import BulkUserSerializer
+
+
+def import_users(records, workers=None, on_created=None):
+    """Validate the records of recipe.importer's readers and create the valid ones as users with a token
+
+    The passwords of a chunk are hashed by a pool of `workers` processes, one per CPU by default, 0 hashes them
+    in this process. on_created is called with the (user, token) pairs of each chunk.
+    Return the number of created users, the failed records and the duplicate emails, with the errors and
+    duplicates of the first USER_IMPORT_MAX_ERRORS of them, see recipe.importer.import_chunks.
+    A taken email doesn't stop the import either.
+    """
+    result = {'duplicated': 0, 'duplicates': []}
+
+    def insert(make_passwords, valid):
+        created = []
+        pairs = get_user_model().objects.bulk_create_users([fields for _, fields in valid], make_passwords)
+        for (line_number, _), (user, token) in zip(valid, pairs):
+            if token is None:
+                # Taken by an existing user or an earlier record, reported and skipped
+                result['duplicated'] += 1
+                if len(result['duplicates']) < settings.USER_IMPORT_MAX_ERRORS:
+                    result['duplicates'].append({'line': line_number, 'email': user.email})
+            else:
+                created.append((user, token))
+
+        if on_created is not None and created:
+            on_created(created)
+        return len(created)
+
+    def import_all(make_passwords):
+        return importer.import_chunks(
+            records, BulkUserSerializer(), partial(insert, make_passwords),
+            settings.USER_IMPORT_CHUNK_SIZE, settings.USER_IMPORT_MAX_ERRORS, result,
+        )
+
+    if workers == 0:
+        return import_all(None)
+
+    # One pool for the whole import, starting processes for every chunk would cost more than some hashes
+    with hashing.parallel_hasher(workers) as make_passwords:
+        return import_all(make_passwords)
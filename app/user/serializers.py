@@ -7,8 +7,12 @@ from django.contrib.auth import (
                                 authenticate,
                                 )
 
+from django.db import transaction
 from django.utils.translation import ugettext_lazy as _     # Default syntax for translating strings into different languages in Django
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+
+from core import tokens
 
 # Serializers are used to convert data inputs into Python objects and vice versa
 # The serializer takes a json input, it validates it, and then converts it into a Python object or a model from the database
@@ -33,7 +37,11 @@ class UserSerializer(serializers.ModelSerializer):
         """Meta class for the serializer"""
         model = get_user_model()
         fields = ('email', 'password', 'name')
-        extra_kwargs = {'password': {'write_only': True, 'min_length': 5}}
+        extra_kwargs = {
+            'password': {'write_only': True, 'min_length': 5},
+            # The email is unique whatever its case, like the index on lower(email) enforces
+            'email': {'validators': [UniqueValidator(queryset=get_user_model().objects.all(), lookup='ciexact')]},
+        }
 
     def create(self, validated_data):
         """Create a new user with encrypted password and return it"""
@@ -53,14 +61,43 @@ class UserSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         """Update and return the user, setting the password correctly"""
         password = validated_data.pop('password', None)    # pop = get and remove the password from the validated_data
-        user = super().update(instance, validated_data)    # The super function is a Python function that calls the update function on the ModelSerializer BaseClass
 
-        if password:
-            user.set_password(password)
-            user.save()
+        # Only the changed columns are written, with one UPDATE, nothing is written when nothing changed
+        changed = [field for field, value in validated_data.items() if getattr(instance, field) != value]
+        for field in changed:
+            setattr(instance, field, validated_data[field])
+
+        if not password:
+            if changed:
+                instance.save(update_fields=changed)
+            # Return the user object as expected by the view that is calling the serializer
+            return instance
+
+        # The hash is computed before the transaction, which doesn't stay open while the pool hashes
+        instance.set_password(password)
+        with transaction.atomic():
+            instance.save(update_fields=changed + ['password'])
+            # The tokens issued with the old password stop working with the change, or not at all if it fails
+            tokens.revoke_user_tokens(instance.pk)
+
+        return instance
+
 
-        # Return the user object as expected by the view that is calling the serializer
-        return user
+class BulkUserSerializer(serializers.ModelSerializer):
+    """Serializer for a user of a bulk creation, see user/importer.py"""
+
+    class Meta:
+        model = get_user_model()
+        fields = ('email', 'password', 'name')
+        extra_kwargs = {
+            # No unique validator, it would query the database for every user,
+            # bulk_create_users looks up the emails of a whole chunk at once
+            'email': {'validators': []},
+            # Users created without a password, or with an empty CSV cell, get an unusable one
+            # and reset it to log in
+            'password': {'required': False, 'allow_blank': True, 'min_length': 5},
+            'name': {'required': False, 'allow_blank': True},
+        }
 
 
 class AuthTokenSerializer(serializers.Serializer):
@@ -121,3 +158,28 @@ class AuthTokenSerializer(serializers.Serializer):
 
         attrs['user'] = user
         return attrs
+
+
+class SignedTokenSerializer(serializers.Serializer):
+    """Serializer for the signed access token and refresh token of a user"""
+
+    access = serializers.CharField(help_text='Access token, sent as Authorization: Bearer <access>')
+    refresh = serializers.CharField(help_text='Refresh token, exchanged once for new tokens')
+    expires_in = serializers.IntegerField(help_text='Seconds the access token is valid')
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    """Serializer for a refresh token sent by the client"""
+
+    refresh = serializers.CharField()
+
+
+class TokenCacheStatsSerializer(serializers.Serializer):
+    """Serializer for the counters of the token authentication cache of a worker"""
+
+    worker = serializers.IntegerField(help_text='Process id of the worker that answered, each worker has its own cache')
+    hits = serializers.IntegerField()
+    misses = serializers.IntegerField()
+    invalidations = serializers.IntegerField()
+    hit_rate = serializers.FloatField(help_text='Share of the lookups answered from the cache, 0 without lookups')
+    size = serializers.IntegerField(help_text='Number of tokens in the cache')
@@ -0,0 +1,83 @@
+"""
+Tests for the throttling of the login and sign up endpoints
+"""
+
+import base64
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import ThrottleBucket
+
+CREATE_USER_URL = reverse('user:create')
+TOKEN_URL = reverse('user:token')
+
+
+# 2 requests at once per email, 3 per IP, then one per minute
+@override_settings(LOGIN_THROTTLE={'ip': (3, 1), 'email': (2, 1)})
+class LoginThrottleApiTests(TestCase):
+    """Test the token buckets of the login and sign up endpoints"""
+
+    def setUp(self):
+        self.client = APIClient()
+        get_user_model().objects.create_user(email='test@example.com', password='testpass123')
+
+    def login(self, email='test@example.com', password='wrong', **extra):
+        """Return the response to a login attempt"""
+        return self.client.post(TOKEN_URL, {'email': email, 'password': password}, **extra)
+
+    def test_email_throttled_before_hashing(self):
+        """Test the requests above the email bucket are refused with a Retry-After, without checking the password"""
+        self.assertEqual(self.login().status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.login(password='testpass123').status_code, status.HTTP_200_OK)
+
+        with patch('user.serializers.authenticate') as patched_authenticate:
+            res = self.login(email='TEST@example.com ', password='testpass123')
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '60')
+        patched_authenticate.assert_not_called()
+
+    def test_ip_throttled_across_emails(self):
+        """Test an IP trying many emails is throttled, whatever X-Forwarded-For it sends"""
+        for i in range(3):
+            self.assertEqual(self.login(email=f'user{i}@example.com', HTTP_X_FORWARDED_FOR=f'10.0.0.{i}').status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertEqual(self.login(email='other@example.com').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_refill(self):
+        """Test the bucket refills with time, and refused requests don't push it below empty"""
+        for _ in range(5):
+            self.login()
+
+        bucket = ThrottleBucket.objects.get(key__startswith='email:')
+        self.assertGreaterEqual(bucket.tokens, 0)
+        ThrottleBucket.objects.update(updated_at=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(self.login(password='testpass123').status_code, status.HTTP_200_OK)
+
+    def test_sign_up_throttled(self):
+        """Test the sign up shares the buckets of the login"""
+        for i in range(3):
+            self.client.post(CREATE_USER_URL, {'email': f'new{i}@example.com', 'password': 'testpass123', 'name': 'Name'})
+
+        res = self.client.post(CREATE_USER_URL, {'email': 'new@example.com', 'password': 'testpass123', 'name': 'Name'})
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertFalse(get_user_model().objects.filter(email='new@example.com').exists())
+
+    def test_basic_auth_not_checked(self):
+        """Test a Basic authorization header isn't checked, it would hash the password before the throttles"""
+        credentials = base64.b64encode(b'test@example.com:testpass123').decode()
+
+        with patch('django.contrib.auth.authenticate') as patched_authenticate:
+            self.client.post(CREATE_USER_URL, {}, HTTP_AUTHORIZATION=f'Basic {credentials}')
+
+        patched_authenticate.assert_not_called()
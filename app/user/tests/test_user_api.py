@@ -2,12 +2,19 @@
 Test for the user API
 """
 
-from django.test import TestCase
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
 
 # APIClient is a test client that allows us to make requests to our API and check the response
 from rest_framework.test import APIClient
+from rest_framework.authtoken.models import Token
 # status is a module that contains some status codes that we can use when returning responses from our API
 from rest_framework import status
 
@@ -66,6 +73,15 @@ class PublicUserApiTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_user_with_email_in_other_case_exists_errors(self):
+        """Test creating a user whose email exists in another case fails"""
+        create_user(email='test@example.com', password='Testpass123')
+
+        res = self.client.post(CREATE_USER_URL, {'email': 'Test@Example.com', 'password': 'Testpass123'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('email', res.data)
+
     def test_password_too_short_errors(self):
         """Test that the password must be more than 5 characters"""
         payload = {
@@ -105,6 +121,31 @@ class PublicUserApiTests(TestCase):
         self.assertIn('token', res.data)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
+    def test_create_token_email_case_insensitive(self):
+        """Test the user logs in with the email in any case"""
+        user = create_user(email='Test@example.com', password='Testpass123')
+
+        res = self.client.post(TOKEN_URL, {'email': 'tEST@EXAMPLE.COM', 'password': 'Testpass123'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['token'], Token.objects.get(user=user).key)
+
+    @override_settings(TOKEN_TTL=3600)
+    def test_create_token_replaces_expired_token(self):
+        """Test that the same token is returned until it expires, then a new one"""
+        create_user(email='test@example.com', password='Testpass123')
+        payload = {'email': 'test@example.com', 'password': 'Testpass123'}
+        key = self.client.post(TOKEN_URL, payload).data['token']
+
+        self.assertEqual(self.client.post(TOKEN_URL, payload).data['token'], key)
+
+        Token.objects.filter(key=key).update(created=timezone.now() - timedelta(hours=2))
+        res = self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res.data['token'], key)
+        self.assertFalse(Token.objects.filter(key=key).exists())
+
     def test_create_token_invalid_credentials_errors(self):
         """Test that token is not created if invalid credentials are given"""
         user_details = {
@@ -217,3 +258,100 @@ class PrivateUserApiTests(TestCase):
 
         # Check that the response is HTTP 200
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def patch_me(self, payload):
+        """Return the response to a PATCH of the profile and the queries it ran"""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.patch(ME_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res, [query['sql'] for query in queries]
+
+    def test_retrieve_profile_no_query(self):
+        """Test retrieving the profile reads nothing more than the authentication"""
+        with self.assertNumQueries(0):
+            self.client.get(ME_URL)
+
+    def test_update_profile_single_update(self):
+        """Test a profile change reads the current user, then is one UPDATE of the changed columns only"""
+        res, queries = self.patch_me({'name': 'New name'})
+
+        self.assertEqual(res.data['name'], 'New name')
+        self.assertEqual(len(queries), 2)
+        self.assertTrue(queries[0].startswith('SELECT'))
+        self.assertTrue(queries[1].startswith('UPDATE "core_user" SET "name" = '))
+        self.assertNotIn('"password"', queries[1])
+        self.assertNotIn('"email"', queries[1])
+
+    def test_update_profile_unchanged_no_write(self):
+        """Test nothing is written when the profile doesn't change"""
+        res, queries = self.patch_me({'name': self.user.name})
+
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(queries[0].startswith('SELECT'))
+
+    def test_update_profile_compared_to_current_user(self):
+        """Test a change is compared to the current row, not to an older copy of the authenticated user"""
+        get_user_model().objects.filter(pk=self.user.pk).update(name='Newer name')
+
+        res, queries = self.patch_me({'name': self.user.name})
+
+        self.assertEqual(res.data['name'], self.user_details['name'])
+        self.assertEqual(get_user_model().objects.get(pk=self.user.pk).name, self.user_details['name'])
+
+    def test_update_profile_keeps_newer_password(self):
+        """Test a change through an older copy of the user doesn't write back its older password"""
+        newer = get_user_model().objects.get(pk=self.user.pk)
+        newer.set_password('Newerpass123')
+        newer.save()
+
+        self.patch_me({'name': 'New name'})
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, 'New name')
+        self.assertTrue(self.user.check_password('Newerpass123'))
+
+    def test_update_profile_deactivated_user_errors(self):
+        """Test a user deactivated since it was authenticated can't change the profile"""
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+
+        res = self.client.patch(ME_URL, {'name': 'New name'})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(get_user_model().objects.get(pk=self.user.pk).name, self.user_details['name'])
+
+    def test_update_email_validated_and_updated(self):
+        """Test an email change checks the email is free, then updates it alone"""
+        res, queries = self.patch_me({'email': 'new@example.com'})
+
+        self.assertEqual(len(queries), 3)
+        self.assertTrue(queries[2].startswith('UPDATE "core_user" SET "email" = '))
+
+    def test_update_password_revokes_tokens_in_transaction(self):
+        """Test a password change is one UPDATE with the other changes, and deletes the tokens in the same transaction"""
+        token = Token.objects.create(user=self.user)
+
+        res, queries = self.patch_me({'name': 'New name', 'password': 'newpass123'})
+
+        updates = [query for query in queries if query.startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertTrue(updates[0].startswith('UPDATE "core_user" SET "password" = '))
+        self.assertIn('"name" = ', updates[0])
+        # The writes are between the savepoint and its release, the transaction of the test
+        self.assertTrue(queries[0].startswith('SELECT'))
+        self.assertTrue(queries[1].startswith('SAVEPOINT'))
+        self.assertTrue(queries[-1].startswith('RELEASE SAVEPOINT'))
+        self.assertEqual(len(queries), 8)
+        self.assertFalse(Token.objects.filter(key=token.key).exists())
+
+    def test_update_password_rolled_back_keeps_tokens(self):
+        """Test the tokens are kept when the password change fails"""
+        token = Token.objects.create(user=self.user)
+
+        with patch('core.tokens.RefreshToken.objects.filter', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.client.patch(ME_URL, {'password': 'newpass123'})
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password(self.user_details['password']))
+        self.assertTrue(Token.objects.filter(key=token.key).exists())
@@ -4,6 +4,7 @@ Urls mappings for the user API.
 
 from django.urls import path
 
+from core.asyncviews import asgi_view
 from user import views
 
 # The app_name is the name of the app that we want to use to identify the urls
@@ -18,5 +19,9 @@ urlpatterns = [
     # The second argument is the view that we want to use for this url, and must be a function
     path('create/', views.CreateUserView.as_view(), name='create'),
     path('token/', views.CreateTokenView.as_view(), name='token'),
-    path('me/', views.ManageUserView.as_view(), name='me'),
+    path('token/signed/', views.CreateSignedTokenView.as_view(), name='token-signed'),
+    path('token/refresh/', views.RefreshSignedTokenView.as_view(), name='token-refresh'),
+    path('token/revoke/', views.RevokeSignedTokenView.as_view(), name='token-revoke'),
+    path('me/', asgi_view(views.ManageUserView.as_view()), name='me'),     # Async view under ASGI
+    path('token-cache-stats/', views.TokenCacheStatsView.as_view(), name='token-cache-stats'),
 ]
@@ -2,12 +2,24 @@
 Views for user API
 """
 
+import os
+
 # rest_framework handles alot of the logic for creating objects in our database and it does that with different BaseClass views
-from rest_framework import generics, authentication, permissions
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
+from drf_spectacular.utils import extend_schema
+from rest_framework import exceptions, generics, permissions, status
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 
-from user.serializers import UserSerializer, AuthTokenSerializer
+from core import tokens
+from core.authentication import API_AUTHENTICATION_CLASSES, token_cache_stats
+from core.throttling import LOGIN_THROTTLE_CLASSES
+from user.serializers import (UserSerializer, AuthTokenSerializer, RefreshTokenSerializer, SignedTokenSerializer,
+                              TokenCacheStatsSerializer)
 
 
 # CreateAPIView is a view that allows us to create an object in the database
@@ -19,6 +31,10 @@ class CreateUserView(generics.CreateAPIView):
 
     # The serializer_class is the serializer that we want to use to create the object
     serializer_class = UserSerializer
+    # Hashing the password is slow on purpose, the throttles refuse the bursts before it runs
+    # No authentication, the default BasicAuthentication would hash a password before the throttles
+    authentication_classes = []
+    throttle_classes = LOGIN_THROTTLE_CLASSES
 
 
 # ObtainAuthToken is a view that comes with rest_framework that handles creating authentication tokens
@@ -32,6 +48,20 @@ class CreateTokenView(ObtainAuthToken):
     # The renderer_classes are the renderer classes that we want to use to render the view
     # Is not active by default, we need to add it
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    # Checking the password is slow on purpose, the throttles refuse the bursts before it runs
+    # No authentication, the default BasicAuthentication would check a password before the throttles
+    authentication_classes = []
+    throttle_classes = LOGIN_THROTTLE_CLASSES
+
+    def post(self, request, *args, **kwargs):
+        """Return the auth token of the user, a new one when missing or expired"""
+        serializer = self.serializer_class(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+
+        # Unlike ObtainAuthToken, an expired token is replaced by a new one instead of returned
+        token = tokens.obtain_token(serializer.validated_data['user'])
+
+        return Response({'token': token.key})
 
 
 # RetrieveUpdateAPIView is a view that allows us to retrieve and update an object from the database
@@ -42,7 +72,9 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
     """Manage the authenticated user"""
     serializer_class = UserSerializer
     # The authentication_classes are the authentication classes that we want to use to authenticate the user
-    authentication_classes = [authentication.TokenAuthentication]
+    # An opaque token is read from the database only when it isn't in the cache of the worker,
+    # a signed access token is never read from the database
+    authentication_classes = API_AUTHENTICATION_CLASSES
     # The permission_classes are the permission classes that we want to use to authenticate the user
     permission_classes = [permissions.IsAuthenticated]
 
@@ -54,4 +86,96 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
         # self.request.user is the user that is authenticated
         # self.request.user is the user that is authenticated by the authentication_classes
         # self.request.user is the user that is authenticated by the authentication_classes that we added to the view
-        return self.request.user
+        user = self.request.user
+        # The user of a signed access token only has its id, read all its fields with one query
+        # The user of a cached token can be older than the row, a change is compared to the current row instead,
+        # and a user deactivated since it was cached can't change the profile
+        if user.get_deferred_fields() or self.request.method not in permissions.SAFE_METHODS:
+            try:
+                user = get_user_model().objects.get(pk=user.pk, is_active=True)
+            except get_user_model().DoesNotExist:
+                # Deleted since the token was issued, on another worker before its revocation was shared
+                raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return user
+
+
+class TokenCacheStatsView(APIView):
+    """Counters of the token authentication cache, for the staff"""
+
+    authentication_classes = API_AUTHENTICATION_CLASSES
+    permission_classes = [permissions.IsAdminUser]
+
+    @extend_schema(responses=TokenCacheStatsSerializer)
+    def get(self, request):
+        """Return the hits, misses, invalidations, hit rate and size of the cache of the worker answering the request"""
+        # The cache is in the memory of each worker, the worker id tells the samples of different workers apart
+        return Response(TokenCacheStatsSerializer(dict(token_cache_stats(), worker=os.getpid())).data)
+
+
+class SignedTokensEnabled(permissions.BasePermission):
+    """Allow the signed token endpoints only when the signed mode is on"""
+
+    message = 'Signed tokens are turned off.'
+
+    def has_permission(self, request, view):
+        return 'signed' in settings.AUTH_TOKEN_MODES
+
+
+class CreateSignedTokenView(APIView):
+    """Create a signed access token and a refresh token for the user"""
+
+    authentication_classes = []
+    permission_classes = [SignedTokensEnabled]
+    throttle_classes = LOGIN_THROTTLE_CLASSES
+    serializer_class = AuthTokenSerializer
+
+    @extend_schema(request=AuthTokenSerializer, responses=SignedTokenSerializer)
+    def post(self, request):
+        """Return the tokens of the user with the email and password"""
+        serializer = AuthTokenSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+
+        return Response(tokens.issue_tokens(serializer.validated_data['user']))
+
+
+class RefreshSignedTokenView(APIView):
+    """Exchange a refresh token for a new access token and refresh token"""
+
+    authentication_classes = []
+    permission_classes = [SignedTokensEnabled]
+    serializer_class = RefreshTokenSerializer
+
+    @extend_schema(request=RefreshTokenSerializer, responses=SignedTokenSerializer)
+    def post(self, request):
+        """Return the new tokens, the refresh token sent can't be used again"""
+        serializer = RefreshTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            return Response(tokens.refresh_tokens(serializer.validated_data['refresh']))
+        except tokens.InvalidToken as exc:
+            # A 400 like the invalid credentials of the token endpoints, this view has no authentication scheme for a 401
+            raise exceptions.ValidationError({'refresh': [exc.args[0]]})
+
+
+class RevokeSignedTokenView(APIView):
+    """Revoke a refresh token, and the access token authenticating the request"""
+
+    # Authentication is optional, a client can log out with only its refresh token
+    authentication_classes = API_AUTHENTICATION_CLASSES
+    permission_classes = [SignedTokensEnabled]
+    serializer_class = RefreshTokenSerializer
+
+    @extend_schema(request=RefreshTokenSerializer, responses={204: None})
+    def post(self, request):
+        """Revoke the tokens"""
+        serializer = RefreshTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        tokens.revoke_refresh_token(serializer.validated_data['refresh'])
+        # request.auth is the claims of a signed access token
+        if isinstance(request.auth, dict):
+            tokens.deny_access_token(request.auth)
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
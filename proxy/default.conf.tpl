@@ -1,13 +1,21 @@
 server{
     listen ${LISTEN_PORT};
 
-    location /static {
-        alias /vol/static/;
+    location /static/ {
+        alias /vol/static/static/;
+        # Serve the .gz copies written by collectstatic instead of compressing the files on every request
+        gzip_static on;
+        gzip_vary   on;
+
+        # The hashed names, e.g. base.5af66c1b1797.css, change with the content, so they can be cached forever
+        location ~ "\.[0-9a-f]{12}\.\w+$" {
+            add_header Cache-Control "public, max-age=31536000, immutable";
+        }
     }
 
     location / {
-        uwsgi_pass              ${APP_HOST}:${APP_PORT};
-        include                 /etc/nginx/uwsgi_params;
+        # uwsgi_pass to the uWSGI app, or proxy_pass to the ASGI app, chosen by APP_PROTOCOL in run.sh
+        include                 /etc/nginx/upstream.conf;
         client_max_body_size    10M;
     }
-}
\ No newline at end of file
+}
@@ -2,5 +2,10 @@
 
 set -e  # Exit immediately if a command exits with a non-zero status.
 
-envsubst < /etc/nginx/default.conf.tpl > /etc/nginx/conf.d/default.conf  # Replace environment variables in NGINX config file, e.g. ${NGINX_PORT} with 9000
-nginx -g 'daemon off;'  # Start NGINX server as main process, daemon off means run in foreground
\ No newline at end of file
+# Only our variables are replaced, the NGINX variables of the templates, e.g. $host, are kept
+VARIABLES='${LISTEN_PORT} ${APP_HOST} ${APP_PORT}'
+
+envsubst "$VARIABLES" < /etc/nginx/default.conf.tpl > /etc/nginx/conf.d/default.conf  # Replace environment variables in NGINX config file, e.g. ${NGINX_PORT} with 9000
+# APP_PROTOCOL is uwsgi for the WSGI app, http for the ASGI app
+envsubst "$VARIABLES" < /etc/nginx/upstream-${APP_PROTOCOL}.conf.tpl > /etc/nginx/upstream.conf
+nginx -g 'daemon off;'  # Start NGINX server as main process, daemon off means run in foreground
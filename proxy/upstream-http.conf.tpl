@@ -0,0 +1,7 @@
+# The ASGI app, uvicorn speaks plain HTTP (scripts/run-asgi.sh)
+proxy_pass              http://${APP_HOST}:${APP_PORT};
+# HTTP/1.1 keeps the chunked encoding of the streamed responses, e.g. the recipe export
+proxy_http_version      1.1;
+proxy_set_header        Host $host;
+proxy_set_header        X-Forwarded-For $proxy_add_x_forwarded_for;
+proxy_set_header        X-Forwarded-Proto $scheme;
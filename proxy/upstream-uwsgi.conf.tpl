@@ -0,0 +1,3 @@
+# The WSGI app, uWSGI speaks the uwsgi protocol on its socket (scripts/run.sh)
+uwsgi_pass              ${APP_HOST}:${APP_PORT};
+include                 /etc/nginx/uwsgi_params;
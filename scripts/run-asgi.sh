@@ -0,0 +1,13 @@
+#!/bin/sh
+
+set -e  # Exit immediately if a command exits with a non-zero status.
+
+python manage.py wait_for_db
+python manage.py collectstatic --noinput
+python manage.py migrate
+# Refuse to start with settings that break between workers, e.g. a denylist in the memory of each one
+python manage.py check --deploy --fail-level ERROR
+
+# Start the ASGI server as main process, one event loop per worker process
+# The recipe list and detail and the user endpoint are async views, see core.asyncviews
+uvicorn app.asgi:application --host 0.0.0.0 --port 9000 --workers 4
@@ -5,6 +5,8 @@ set -e  # Exit immediately if a command exits with a non-zero status.
 python manage.py wait_for_db
 python manage.py collectstatic --noinput
 python manage.py migrate
+# Refuse to start with settings that break between workers, e.g. a denylist in the memory of each one
+python manage.py check --deploy --fail-level ERROR
 
 # Start Wsgi server as main process
 uwsgi --socket :9000 --workers 4 --master --enable-threads --module app.wsgi